@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from drf_spectacular.views import (
     SpectacularAPIView,
@@ -8,10 +9,20 @@ from drf_spectacular.views import (
 from .api_views import (
     WeatherStatsAPIView,
     UserHistoryAPIView,
+    ForecastBatchAPIView,
+    HourlyForecastAPIView,
+    NearestCitiesAPIView,
     APIRootView
 )
 from ..views import AutocompleteView
 
+if settings.WEATHER_ASYNC_VIEWS:
+    from .async_api_views import (
+        AsyncWeatherStatsAPIView as WeatherStatsAPIView,
+        AsyncUserHistoryAPIView as UserHistoryAPIView
+    )
+    from ..async_views import AsyncAutocompleteView as AutocompleteView
+
 app_name = "weather_api"
 
 
@@ -20,6 +31,9 @@ urlpatterns = [
     path("user-history/", UserHistoryAPIView.as_view(), name="user_history"),
     path("root/", APIRootView.as_view(), name="api_root"),
     path("autocomplete/", AutocompleteView.as_view(), name="autocomplete"),
+    path("forecast/batch/", ForecastBatchAPIView.as_view(), name="forecast_batch"),
+    path("forecast/hourly/", HourlyForecastAPIView.as_view(), name="forecast_hourly"),
+    path("cities/nearest/", NearestCitiesAPIView.as_view(), name="cities_nearest"),
 
     # API документация
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -1,9 +1,89 @@
-from django.http import JsonResponse
-from drf_spectacular.utils import extend_schema
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 
+from apps.weather.api.http_cache import conditional_response
+from apps.weather.services.forecast_data import ForecastJSONEncoder
 from apps.weather.services.history_service import HistoryService
+from apps.weather.services.nearest_cities import nearest_city_index
+from apps.weather.services.weather_service import WeatherService
+
+
+# Схемы OpenAPI общие для WSGI- и ASGI-версий представлений (async_api_views)
+stats_schema = extend_schema(
+    summary="Статистика популярных городов",
+    description=(
+        "Возвращает список самых популярных городов по количеству поисковых запросов "
+        "за все время или за окно window (по почасовым счетчикам). "
+        "Поддерживает If-None-Match: при неизменной статистике отвечает 304"
+    ),
+    parameters=[
+        OpenApiParameter("window", str, enum=["1h", "24h", "7d", "30d"], description="Окно статистики"),
+    ],
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "example": "success"},
+                "popular_cities": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "city": {"type": "string", "example": "Москва"},
+                            "search_count": {"type": "integer", "example": 15},
+                            "country": {"type": "string", "example": "Россия"}
+                        }
+                    }
+                },
+                "window": {"type": "string", "nullable": True, "example": "24h"},
+                "total_count": {"type": "integer", "example": 28}
+            }
+        }
+    }
+)
+
+user_history_schema = extend_schema(
+    summary="История поиска пользователя",
+    description=(
+        "Возвращает историю поиска текущего пользователя (по сессии) постранично. "
+        "Для следующей страницы передайте next_cursor из предыдущего ответа. "
+        "Поддерживает If-None-Match: при неизменной истории отвечает 304"
+    ),
+    parameters=[
+        OpenApiParameter("cursor", str, description="Курсор следующей страницы"),
+        OpenApiParameter("limit", int, description="Размер страницы"),
+    ],
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "example": "success"},
+                "history": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer", "example": 42},
+                            "city": {"type": "string", "example": "Москва"},
+                            "country": {"type": "string", "example": "Россия"},
+                            "weather_data": {"type": "object"},
+                            "search_date": {"type": "string", "format": "date-time"}
+                        }
+                    }
+                },
+                "next_cursor": {"type": "string", "nullable": True},
+                "total_count": {"type": "integer", "example": 5}
+            }
+        }
+    }
+)
 
 
 class WeatherStatsAPIView(APIView):
@@ -11,68 +91,392 @@ class WeatherStatsAPIView(APIView):
 
     permission_classes = (AllowAny,)
 
+    @stats_schema
+    def get(self, request):
+        history_service = HistoryService()
+        window = request.GET.get("window") or None
+
+        try:
+            etag = history_service.popular_cities_etag(20, window)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
+
+        return conditional_response(
+            request,
+            etag,
+            lambda: self.build_response(history_service, window),
+            max_age=settings.WEATHER_API_STATS_MAX_AGE
+        )
+
+    @staticmethod
+    def build_response(history_service: HistoryService, window: str | None = None) -> JsonResponse:
+        """Полный ответ статистики."""
+        try:
+            popular_cities = history_service.get_popular_cities(20, window)
+
+            return JsonResponse({
+                "status": "success",
+                "popular_cities": popular_cities,
+                "window": window,
+                "total_count": len(popular_cities)
+            })
+        except Exception as e:
+            return JsonResponse({
+                "status": "error",
+                "message": f"Ошибка получения статистики: {str(e)}"
+            }, status=500)
+
+
+class UserHistoryAPIView(APIView):
+    """API для истории пользователя."""
+
+    permission_classes = (AllowAny,)
+
+    @user_history_schema
+    def get(self, request):
+        session_key = request.session.session_key
+
+        if not session_key:
+            return JsonResponse({
+                "status": "success",
+                "history": [],
+                "next_cursor": None,
+                "message": "Сессия не найдена"
+            })
+
+        try:
+            cursor, limit = self.parse_page_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
+
+        history_service = HistoryService()
+        return conditional_response(
+            request,
+            history_service.history_etag(session_key, cursor, limit),
+            lambda: self.build_response(history_service, session_key, cursor, limit),
+            private=True
+        )
+
+    @staticmethod
+    def build_response(history_service: HistoryService, session_key: str, cursor: str | None,
+                       limit: int | None) -> JsonResponse:
+        """Полный ответ со страницей истории."""
+        try:
+            page = history_service.get_history_page(session_key, cursor=cursor, limit=limit)
+
+            return JsonResponse({
+                "status": "success",
+                "history": page["history"],
+                "next_cursor": page["next_cursor"],
+                "total_count": len(page["history"])
+            })
+        except Exception as e:
+            return JsonResponse({
+                "status": "error",
+                "message": f"Ошибка получения истории: {str(e)}"
+            }, status=500)
+
+    @staticmethod
+    def parse_page_params(params) -> tuple[str | None, int | None]:
+        """Разбирает cursor и limit из параметров запроса."""
+        cursor = params.get("cursor") or None
+        limit = params.get("limit")
+
+        if cursor is not None:
+            HistoryService.decode_cursor(cursor)
+
+        if limit in (None, ""):
+            return cursor, None
+        try:
+            return cursor, int(limit)
+        except ValueError:
+            raise ValueError("Параметр limit должен быть целым числом")
+
+
+class ForecastBatchAPIView(APIView):
+    """API для пакетного получения прогнозов по нескольким городам."""
+
+    permission_classes = (AllowAny,)
+
     @extend_schema(
-        summary="Статистика популярных городов",
-        description="Возвращает список самых популярных городов по количеству поисковых запросов",
+        summary="Прогнозы для нескольких городов",
+        description=(
+            "Возвращает прогнозы для списка городов и/или координат. "
+            "Недостающие в кеше прогнозы запрашиваются у Open-Meteo одним запросом"
+        ),
+        parameters=[
+            OpenApiParameter("cities", str, description="Названия городов через запятую"),
+            OpenApiParameter("locations", str, description="Координаты в формате lat,lon;lat,lon"),
+        ],
         responses={
             200: {
                 "type": "object",
                 "properties": {
                     "status": {"type": "string", "example": "success"},
-                    "popular_cities": {
+                    "forecasts": {
                         "type": "array",
                         "items": {
                             "type": "object",
                             "properties": {
                                 "city": {"type": "string", "example": "Москва"},
-                                "search_count": {"type": "integer", "example": 15},
-                                "country": {"type": "string", "example": "Россия"}
+                                "latitude": {"type": "number", "example": 55.7558},
+                                "longitude": {"type": "number", "example": 37.6176},
+                                "weather_data": {"type": "object"}
                             }
                         }
                     },
-                    "total_count": {"type": "integer", "example": 28}
+                    "errors": {"type": "array", "items": {"type": "object"}},
+                    "total_count": {"type": "integer", "example": 2}
                 }
             }
         }
     )
     def get(self, request):
+        cities = [city.strip() for city in request.GET.get("cities", "").split(",") if city.strip()]
+
         try:
-            history_service = HistoryService()
-            popular_cities = history_service.get_popular_cities(20)
+            locations = self._parse_locations(request.GET.get("locations", ""))
+        except ValueError:
+            return JsonResponse({
+                "status": "error",
+                "message": "Некорректный формат locations, ожидается lat,lon;lat,lon"
+            }, status=400)
 
+        total = len(cities) + len(locations)
+        if not total:
             return JsonResponse({
-                "status": "success",
-                "popular_cities": popular_cities,
-                "total_count": len(popular_cities)
-            })
-        except Exception as e:
+                "status": "error",
+                "message": "Укажите cities или locations"
+            }, status=400)
+
+        if total > settings.WEATHER_FORECAST_BATCH_MAX_LOCATIONS:
             return JsonResponse({
                 "status": "error",
-                "message": f"Ошибка получения статистики: {str(e)}"
+                "message": f"Не более {settings.WEATHER_FORECAST_BATCH_MAX_LOCATIONS} точек за запрос"
+            }, status=400)
+
+        weather_service = WeatherService()
+        forecasts = []
+        errors = []
+
+        for city in cities:
+            try:
+                latitude, longitude = weather_service.get_city_coordinates(city)
+                forecasts.append({"city": city, "latitude": latitude, "longitude": longitude})
+            except ValueError as e:
+                errors.append({"city": city, "message": str(e)})
+
+        forecasts.extend(
+            {"city": None, "latitude": latitude, "longitude": longitude}
+            for latitude, longitude in locations
+        )
+
+        try:
+            raw_forecasts = weather_service.get_weather_forecast_batch(
+                [(item["latitude"], item["longitude"]) for item in forecasts]
+            )
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
             }, status=500)
 
+        for item, raw_forecast in zip(forecasts, raw_forecasts):
+            item["weather_data"] = weather_service.format_weather_data(raw_forecast)
 
-class UserHistoryAPIView(APIView):
-    """API для истории пользователя."""
+        return JsonResponse({
+            "status": "success",
+            "forecasts": forecasts,
+            "errors": errors,
+            "total_count": len(forecasts)
+        }, encoder=ForecastJSONEncoder)
+
+    def _parse_locations(self, value: str) -> list[tuple[float, float]]:
+        """Разбирает строку координат вида lat,lon;lat,lon."""
+        locations = []
+        for pair in filter(None, (part.strip() for part in value.split(";"))):
+            latitude, longitude = (float(part) for part in pair.split(","))
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError(pair)
+            locations.append((latitude, longitude))
+        return locations
+
+
+class HourlyForecastAPIView(APIView):
+    """API почасового прогноза с потоковой отдачей окна ряда."""
 
     permission_classes = (AllowAny,)
 
+    # Сколько часов сериализуется в один кусок потокового ответа
+    CHUNK_HOURS = 48
+
     @extend_schema(
-        summary="История поиска пользователя",
-        description="Возвращает историю поиска текущего пользователя (по сессии)",
+        summary="Почасовой прогноз",
+        description=(
+            "Потоково отдает окно почасового прогноза для города или координат. "
+            "output=ndjson - первая строка с метаданными, затем по строке на час; "
+            "output=json - объект {meta, hours}. Для следующего окна передайте "
+            "meta.next_start в параметре start"
+        ),
+        parameters=[
+            OpenApiParameter("city", str, description="Название города"),
+            OpenApiParameter("lat", float, description="Широта (вместо city)"),
+            OpenApiParameter("lon", float, description="Долгота (вместо city)"),
+            OpenApiParameter("start", str, description="Начало окна, ISO 8601 (например 2024-01-01T06:00)"),
+            OpenApiParameter("hours", int, description="Длина окна в часах"),
+            OpenApiParameter("variables", str, description="Переменные через запятую"),
+            OpenApiParameter("output", str, enum=["ndjson", "json"], description="Формат ответа"),
+        ],
+        responses={200: {"type": "string"}}
+    )
+    def get(self, request):
+        try:
+            params = self.parse_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
+
+        weather_service = WeatherService()
+        city = params["city"]
+        if city:
+            try:
+                latitude, longitude = weather_service.get_city_coordinates(city)
+            except ValueError as e:
+                return JsonResponse({
+                    "status": "error",
+                    "message": str(e)
+                }, status=404)
+        else:
+            latitude, longitude = params["latitude"], params["longitude"]
+
+        try:
+            forecast = weather_service.get_hourly_forecast(latitude, longitude)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=500)
+
+        begin, end = forecast.window(params["start"], params["hours"])
+        meta = {
+            "city": city,
+            "latitude": latitude,
+            "longitude": longitude,
+            "variables": params["variables"],
+            "hours": end - begin,
+            "next_start": forecast.next_start(end),
+        }
+        rows = forecast.iter_rows(begin, end, params["variables"])
+
+        if params["output"] == "json":
+            response = StreamingHttpResponse(self._stream_json(meta, rows), content_type="application/json")
+        else:
+            response = StreamingHttpResponse(self._stream_ndjson(meta, rows), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    @staticmethod
+    def parse_params(params) -> dict:
+        """Разбирает и проверяет параметры запроса почасового прогноза."""
+        city = (params.get("city") or "").strip()
+        latitude = longitude = None
+        if not city:
+            try:
+                latitude, longitude = float(params["lat"]), float(params["lon"])
+            except (KeyError, ValueError):
+                raise ValueError("Укажите city или lat и lon")
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("Координаты вне допустимого диапазона")
+
+        start = params.get("start") or None
+        if start is not None:
+            try:
+                start = datetime.fromisoformat(start).strftime("%Y-%m-%dT%H:%M")
+            except ValueError:
+                raise ValueError("Параметр start должен быть датой в формате ISO 8601")
+
+        hours = params.get("hours") or settings.WEATHER_HOURLY_PAGE_HOURS
+        try:
+            hours = int(hours)
+        except ValueError:
+            raise ValueError("Параметр hours должен быть целым числом")
+        hours = max(1, min(hours, settings.WEATHER_HOURLY_MAX_HOURS))
+
+        variables = [name.strip() for name in (params.get("variables") or "").split(",") if name.strip()]
+        unknown = [name for name in variables if name not in WeatherService.HOURLY_VARIABLES]
+        if unknown:
+            raise ValueError(f"Неизвестные переменные: {', '.join(unknown)}")
+
+        # Параметр format занят согласованием формата DRF
+        output = params.get("output") or "ndjson"
+        if output not in ("ndjson", "json"):
+            raise ValueError("Параметр output должен быть ndjson или json")
+
+        return {
+            "city": city or None,
+            "latitude": latitude,
+            "longitude": longitude,
+            "start": start,
+            "hours": hours,
+            "variables": variables or list(WeatherService.HOURLY_VARIABLES),
+            "output": output,
+        }
+
+    def _stream_ndjson(self, meta: dict, rows):
+        yield json.dumps({"meta": meta}, ensure_ascii=False) + "\n"
+        for chunk in self._chunks(rows):
+            yield "".join(json.dumps(row) + "\n" for row in chunk)
+
+    def _stream_json(self, meta: dict, rows):
+        yield '{"meta": ' + json.dumps(meta, ensure_ascii=False) + ', "hours": ['
+        separator = ""
+        for chunk in self._chunks(rows):
+            yield separator + ", ".join(json.dumps(row) for row in chunk)
+            separator = ", "
+        yield "]}"
+
+    def _chunks(self, rows):
+        while chunk := list(islice(rows, self.CHUNK_HOURS)):
+            yield chunk
+
+
+class NearestCitiesAPIView(APIView):
+    """API обратного геокодинга: ближайшие к координатам города."""
+
+    permission_classes = (AllowAny,)
+
+    @extend_schema(
+        summary="Ближайшие города",
+        description="Возвращает ближайшие к точке города из индекса в памяти, по возрастанию расстояния",
+        parameters=[
+            OpenApiParameter("lat", float, required=True, description="Широта"),
+            OpenApiParameter("lon", float, required=True, description="Долгота"),
+            OpenApiParameter("limit", int, description="Сколько городов вернуть"),
+        ],
         responses={
             200: {
                 "type": "object",
                 "properties": {
                     "status": {"type": "string", "example": "success"},
-                    "history": {
+                    "cities": {
                         "type": "array",
                         "items": {
                             "type": "object",
                             "properties": {
-                                "city": {"type": "string", "example": "Москва"},
-                                "weather_data": {"type": "object"},
-                                "search_date": {"type": "string", "format": "date-time"}
+                                "id": {"type": "integer", "example": 1},
+                                "name": {"type": "string", "example": "Москва"},
+                                "country": {"type": "string", "example": "Россия"},
+                                "latitude": {"type": "number", "example": 55.7558},
+                                "longitude": {"type": "number", "example": 37.6176},
+                                "distance_km": {"type": "number", "example": 1.234}
                             }
                         }
                     },
@@ -82,29 +486,31 @@ class UserHistoryAPIView(APIView):
         }
     )
     def get(self, request):
-        session_key = request.session.session_key
-
-        if not session_key:
-            return JsonResponse({
-                "status": "success",
-                "history": [],
-                "message": "Сессия не найдена"
-            })
-
         try:
-            history_service = HistoryService()
-            user_history = history_service.get_history(session_key)
-
+            latitude, longitude = float(request.GET["lat"]), float(request.GET["lon"])
+            limit = int(request.GET.get("limit", 5))
+        except (KeyError, ValueError):
             return JsonResponse({
-                "status": "success",
-                "history": user_history,
-                "total_count": len(user_history)
-            })
-        except Exception as e:
+                "status": "error",
+                "message": "Укажите lat и lon числами, limit - целым числом"
+            }, status=400)
+
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
             return JsonResponse({
                 "status": "error",
-                "message": f"Ошибка получения истории: {str(e)}"
-            }, status=500)
+                "message": "Координаты вне допустимого диапазона"
+            }, status=400)
+
+        limit = max(1, min(limit, settings.WEATHER_NEAREST_MAX_CITIES))
+        cities = nearest_city_index.nearest(latitude, longitude, limit)
+
+        return JsonResponse({
+            "status": "success",
+            "latitude": latitude,
+            "longitude": longitude,
+            "cities": cities,
+            "total_count": len(cities)
+        })
 
 
 class APIRootView(APIView):
@@ -143,12 +549,44 @@ class APIRootView(APIView):
                 "stats": {
                     "url": "/api/v1/stats/",
                     "method": "GET",
-                    "description": "Статистика популярных городов"
+                    "description": "Статистика популярных городов",
+                    "parameters": {"window": "окно: 1h, 24h, 7d или 30d (по умолчанию - за все время)"}
                 },
                 "user_history": {
                     "url": "/api/v1/user-history/",
                     "method": "GET",
                     "description": "История поиска пользователя"
+                },
+                "forecast_batch": {
+                    "url": "/api/v1/forecast/batch/",
+                    "method": "GET",
+                    "description": "Прогнозы для нескольких городов одним запросом",
+                    "parameters": {
+                        "cities": "названия городов через запятую",
+                        "locations": "координаты в формате lat,lon;lat,lon"
+                    }
+                },
+                "forecast_hourly": {
+                    "url": "/api/v1/forecast/hourly/",
+                    "method": "GET",
+                    "description": "Потоковый почасовой прогноз (NDJSON или JSON) с окнами по времени",
+                    "parameters": {
+                        "city": "название города (или lat и lon)",
+                        "start": "начало окна, ISO 8601",
+                        "hours": "длина окна в часах",
+                        "variables": "переменные через запятую",
+                        "output": "ndjson или json"
+                    }
+                },
+                "cities_nearest": {
+                    "url": "/api/v1/cities/nearest/",
+                    "method": "GET",
+                    "description": "Ближайшие к координатам города (обратный геокодинг)",
+                    "parameters": {
+                        "lat": "широта",
+                        "lon": "долгота",
+                        "limit": "сколько городов вернуть"
+                    }
                 }
             },
             "data_source": "Open-Meteo API",
@@ -0,0 +1,99 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.views import APIView
+
+from apps.weather.api.api_views import UserHistoryAPIView, WeatherStatsAPIView, stats_schema, user_history_schema
+from apps.weather.api.http_cache import conditional_response
+from apps.weather.services.history_service import HistoryService
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView с асинхронными обработчиками для ASGI.
+
+    DRF вызывает обработчик синхронно, поэтому dispatch повторяет APIView.dispatch,
+    но ожидает обработчик. Аутентификация, права, throttling и выбор формата ответа
+    (initial) работают с сессией и кешем синхронно и выполняются через sync_to_async.
+    Django помечает представление асинхронным сам, раз все обработчики - корутины.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if hasattr(response, "__await__"):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncWeatherStatsAPIView(AsyncAPIView, WeatherStatsAPIView):
+    """API для статистики поиска для ASGI."""
+
+    @stats_schema
+    async def get(self, request):
+        history_service = HistoryService()
+        window = request.GET.get("window") or None
+
+        try:
+            etag = await sync_to_async(history_service.popular_cities_etag)(20, window)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
+
+        return await sync_to_async(conditional_response)(
+            request,
+            etag,
+            lambda: self.build_response(history_service, window),
+            max_age=settings.WEATHER_API_STATS_MAX_AGE
+        )
+
+
+class AsyncUserHistoryAPIView(AsyncAPIView, UserHistoryAPIView):
+    """API для истории пользователя для ASGI."""
+
+    @user_history_schema
+    async def get(self, request):
+        session_key = request.session.session_key
+
+        if not session_key:
+            return JsonResponse({
+                "status": "success",
+                "history": [],
+                "next_cursor": None,
+                "message": "Сессия не найдена"
+            })
+
+        try:
+            cursor, limit = self.parse_page_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({
+                "status": "error",
+                "message": str(e)
+            }, status=400)
+
+        history_service = HistoryService()
+        return await sync_to_async(conditional_response)(
+            request,
+            await sync_to_async(history_service.history_etag)(session_key, cursor, limit),
+            lambda: self.build_response(history_service, session_key, cursor, limit),
+            private=True
+        )
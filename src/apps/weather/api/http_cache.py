@@ -0,0 +1,25 @@
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def conditional_response(request, etag: str | None, build, private: bool = False, max_age: int = 0):
+    """
+    Условный ответ API по ETag.
+
+    Если If-None-Match клиента совпадает с etag, возвращает 304 без вызова
+    build(); иначе - ответ build(). Успешный ответ и 304 получают ETag и
+    Cache-Control: public с max-age для общих данных, private для данных сессии.
+    """
+    response = get_conditional_response(request, etag=etag) if etag else None
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+
+    if etag:
+        response.headers.setdefault("ETag", etag)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Cookie",))
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
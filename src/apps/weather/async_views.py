@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .forms import WeatherSearchForm
+from .services import async_http_client
+from .services.async_weather_service import AsyncWeatherService
+from .services.geocoding_cache import GeocodingCache
+from .services.history_service import HistoryService
+from .views import WeatherHomeView, AutocompleteView, autocomplete_cache
+
+logger = logging.getLogger(__name__)
+
+# Фоновые запросы автодополнения к API по циклу событий и нормализованному запросу:
+# ссылки не дают GC собрать задачу до завершения, одинаковые запросы разделяют одну задачу,
+# а число задач ограничено WEATHER_AUTOCOMPLETE_WORKERS, как и пул потоков WSGI-версии
+api_tasks = weakref.WeakKeyDictionary()
+
+
+class AsyncWeatherHomeView(WeatherHomeView):
+    """Главная страница с поиском погоды для ASGI."""
+
+    async def get(self, request, *args, **kwargs):
+        if "clear" in request.GET:
+            return self._clear_history()
+
+        if "city" in request.GET:
+            return await self._ahandle_weather_search()
+
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    async def _ahandle_weather_search(self):
+        """Асинхронно обрабатывает поиск погоды."""
+        form = WeatherSearchForm(self.request.GET)
+        context = self.get_context_data()
+
+        if form.is_valid():
+            city_name = form.cleaned_data["city"]
+
+            try:
+                weather_service = AsyncWeatherService()
+                weather_data = await weather_service.asearch_weather_by_city(city_name)
+
+                history_service = HistoryService()
+                session_key = await self._aget_or_create_session_key()
+                await sync_to_async(history_service.save_history)(session_key, city_name, weather_data)
+
+                self._update_previous_cities(city_name)
+                context.update(self._success_context(form, city_name, weather_data))
+
+            except ValueError as e:
+                context.update(self._error_context(form, str(e), city_name))
+        else:
+            context.update(self._error_context(form, "Пожалуйста, введите корректное название города"))
+
+        return self._render_search_response(context)
+
+    async def _aget_or_create_session_key(self):
+        """Асинхронно получает или создает ключ сессии."""
+        if not self.request.session.session_key:
+            await self.request.session.acreate()
+        return self.request.session.session_key
+
+
+class AsyncAutocompleteView(AutocompleteView):
+    """API для автодополнения поиска городов для ASGI."""
+
+    async def get(self, request):
+        query = request.GET.get("q", "").strip()
+
+        # Короткий запрос
+        if len(query) < 2:
+            return self._short_query_response(query)
+
+        deadline = settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS / 1000
+        started = time.monotonic()
+        suggestions = []
+        sources = {}
+
+        # Запрос к API запускаем сразу, параллельно с локальным поиском
+        api_suggestions = await autocomplete_cache.aget(query)
+        api_task = None
+        if api_suggestions is None:
+            api_task = self._start_api_fetch(query)
+
+        # Получаем локальные предложения
+        try:
+            local_suggestions = await sync_to_async(self.get_local_suggestions)(query)
+            suggestions.extend(local_suggestions)
+            sources['local'] = 'ok'
+        except Exception as e:
+            logger.error(f"Error getting local suggestions: {e}")
+            sources['local'] = 'error'
+
+        if api_suggestions is not None:
+            sources['api'] = 'cached'
+        elif api_task is None:
+            # Предел одновременных запросов к API: отвечаем локальными результатами
+            sources['api'] = 'busy'
+        elif len(suggestions) >= self.LOCAL_LIMIT:
+            # Локальный индекс дал полный список: ответ API не ждем, он попадет в кеш
+            sources['api'] = 'skipped'
+        else:
+            # Ждем API не дольше бюджета задержки, поздний ответ попадет в кеш
+            done, _ = await asyncio.wait({api_task}, timeout=max(deadline - (time.monotonic() - started), 0))
+            if api_task not in done:
+                sources['api'] = 'timeout'
+            elif api_task.exception() is not None:
+                logger.error(f"Error getting API suggestions: {api_task.exception()}")
+                sources['api'] = 'error'
+            else:
+                api_suggestions = api_task.result()
+                sources['api'] = 'ok'
+
+        suggestions.extend(api_suggestions or [])
+
+        return self._suggestions_response(query, suggestions, sources)
+
+    def _start_api_fetch(self, query):
+        """Запускает запрос к API или возвращает уже идущий такой же; None - достигнут предел."""
+        tasks = api_tasks.setdefault(asyncio.get_running_loop(), {})
+        key = GeocodingCache.normalize(query)
+        task = tasks.get(key)
+        if task is None and len(tasks) < settings.WEATHER_AUTOCOMPLETE_WORKERS:
+            task = tasks[key] = asyncio.ensure_future(self._afetch_api_suggestions(query))
+            task.add_done_callback(lambda done: _discard_background_task(tasks, key, done))
+        return task
+
+    async def aget_api_suggestions(self, query):
+        """Асинхронное получение предложений из внешнего API."""
+        cached = await autocomplete_cache.aget(query)
+        if cached is not None:
+            return cached
+
+        try:
+            return await self._afetch_api_suggestions(query)
+        except httpx.HTTPError as e:
+            logger.error(f"Error getting API suggestions: {e}")
+            return []
+
+    async def _afetch_api_suggestions(self, query):
+        """Асинхронно запрашивает предложения у Geocoding API и сохраняет их в кеш."""
+        weather_service = AsyncWeatherService()
+        params = weather_service._geocoding_params(query, count=5)
+
+        response = await async_http_client.get(weather_service.GEOCODING_API_URL, params=params, read_timeout=5)
+        response.raise_for_status()
+
+        suggestions = self._format_api_suggestions(response.json())
+        await autocomplete_cache.aset(query, suggestions)
+        return suggestions
+
+
+def _discard_background_task(tasks, key, task):
+    """Убирает завершенную задачу и забирает ее исключение, чтобы оно не логировалось asyncio."""
+    if tasks.get(key) is task:
+        del tasks[key]
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,82 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.weather.models import WeatherSearch
+from apps.weather.services.history_service import HistoryService
+
+# Отдельный шаг сортировки в плане PostgreSQL (узел Sort, но не Merge Append) и SQLite
+SORT_STEP = re.compile(r"(^|->)\s*(Incremental )?Sort\s+\(|USE TEMP B-TREE FOR ORDER BY", re.MULTILINE)
+
+# Индексы партиций наследуют имена от столбцов, а не от индекса родительской таблицы
+INDEX_NAMES = {
+    "weather_search_session_idx": ("weather_search_session_idx", "_session_key_search_date_id_idx"),
+    "weather_search_city_date_idx": ("weather_search_city_date_idx", "_city_id_search_date_idx"),
+}
+
+
+class Command(BaseCommand):
+    help = "Проверяет через EXPLAIN, что запросы истории поиска используют составные индексы"
+
+    def handle(self, *args, **options):
+        failures = []
+
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # На маленькой таблице планировщик и так выберет Seq Scan, проверяем, что индекс применим
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for name, queryset, index, ordered in self._queries():
+                plan = queryset.explain()
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{name}:\n{plan}\n")
+
+                if not any(index_name in plan for index_name in INDEX_NAMES[index]):
+                    failures.append(f"{name}: не используется индекс {index}")
+                elif ordered and SORT_STEP.search(plan):
+                    failures.append(f"{name}: в плане есть отдельная сортировка")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+
+        self.stdout.write(self.style.SUCCESS("Запросы истории используют составные индексы"))
+
+    @staticmethod
+    def _queries() -> list[tuple]:
+        """Запросы для проверки: (название, queryset, ожидаемый индекс, нужен ли порядок из индекса)."""
+        history_service = HistoryService()
+        page_size = settings.WEATHER_HISTORY_PAGE_SIZE + 1
+        cursor = history_service.encode_cursor({"search_date": timezone.now(), "id": 0})
+        session_key = "explain"
+
+        return [
+            (
+                "history_page",
+                history_service.history_queryset(session_key)[:page_size],
+                "weather_search_session_idx",
+                True,
+            ),
+            (
+                "history_page_cursor",
+                history_service.history_queryset(session_key, cursor)[:page_size],
+                "weather_search_session_idx",
+                True,
+            ),
+            (
+                "clear_history_batch",
+                WeatherSearch.objects.filter(session_key=session_key)
+                .order_by("-search_date", "-id").values_list("id", flat=True)[:settings.WEATHER_HISTORY_DELETE_BATCH_SIZE],
+                "weather_search_session_idx",
+                True,
+            ),
+            (
+                "city_period",
+                WeatherSearch.objects.filter(city_id=0, search_date__gte=timezone.now()).values("id"),
+                "weather_search_city_date_idx",
+                False,
+            ),
+        ]
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.weather.services.gazetteer import GazetteerImporter
+
+
+class Command(BaseCommand):
+    help = "Импортирует города из дампа GeoNames (cities500.txt, cities15000.zip и т.п.)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к дампу GeoNames: .txt или .zip")
+        parser.add_argument(
+            "--countries",
+            help="Путь к countryInfo.txt GeoNames, чтобы сохранять названия стран вместо кодов"
+        )
+        parser.add_argument(
+            "--min-population", type=int, default=settings.WEATHER_GAZETTEER_MIN_POPULATION,
+            help="Пропускать города с меньшим населением"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.WEATHER_GAZETTEER_BATCH_SIZE,
+            help="Сколько строк дампа обрабатывать за одну транзакцию"
+        )
+
+    def handle(self, *args, **options):
+        countries = GazetteerImporter.load_countries(options["countries"]) if options["countries"] else None
+        importer = GazetteerImporter(
+            batch_size=options["batch_size"],
+            min_population=options["min_population"],
+            countries=countries,
+        )
+
+        stats = importer.import_file(options["path"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Прочитано строк: {stats['read']}, добавлено городов: {stats['created']}, "
+            f"обновлено: {stats['updated']}, пропущено: {stats['skipped']}, "
+            f"тезок с историей не заменено: {stats['conflicts']}, "
+            f"альтернативных названий: {stats['alternate_names']}"
+        ))
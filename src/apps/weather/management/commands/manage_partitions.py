@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.weather.services.partitions import SearchPartitionService
+
+
+class Command(BaseCommand):
+    help = "Создает будущие месячные партиции истории поиска и отключает устаревшие (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=settings.WEATHER_HISTORY_PARTITIONS_AHEAD,
+            help="На сколько месяцев вперед создать партиции"
+        )
+        parser.add_argument(
+            "--expire-days", type=int, default=settings.WEATHER_HISTORY_RETENTION_DAYS,
+            help="Отключить партиции, все строки которых старше указанного числа дней (0 - не отключать)"
+        )
+        parser.add_argument(
+            "--detach-only", action="store_true",
+            help="Только отключить устаревшие партиции, оставив их отдельными таблицами"
+        )
+        parser.add_argument(
+            "--convert", action="store_true",
+            help="Перевести существующую обычную таблицу на партиции"
+        )
+
+    def handle(self, *args, **options):
+        partitions = SearchPartitionService()
+
+        if not partitions.is_supported():
+            self.stdout.write("Партиционирование поддерживается только на PostgreSQL, таблица остается обычной")
+            return
+
+        if options["convert"]:
+            partitions.convert(ahead=options["ahead"])
+
+        if not partitions.is_partitioned():
+            self.stdout.write("Таблица истории не секционирована, запустите команду с --convert")
+            return
+
+        for name in partitions.ensure_partitions(options["ahead"]):
+            self.stdout.write(f"Создана партиция {name}")
+
+        if options["expire_days"] > 0:
+            before = timezone.now() - timedelta(days=options["expire_days"])
+            expired = partitions.expire_partitions(before, drop=not options["detach_only"])
+            action = "Отключена" if options["detach_only"] else "Удалена"
+            for name, rows in expired.items():
+                self.stdout.write(f"{action} партиция {name} ({rows} строк)")
+
+        self.stdout.write(self.style.SUCCESS("Партиции истории обновлены"))
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from apps.weather.services.prefetch import ForecastPrefetcher
+
+
+class Command(BaseCommand):
+    help = "Держит в кеше свежие прогнозы для самых популярных городов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=settings.WEATHER_PREFETCH_TOP_CITIES,
+            help="Сколько самых популярных городов прогревать"
+        )
+        parser.add_argument(
+            "--budget", type=int, default=settings.WEATHER_PREFETCH_BUDGET,
+            help="Не больше указанного числа запросов к Open-Meteo за цикл"
+        )
+        parser.add_argument(
+            "--interval", type=int, default=settings.WEATHER_PREFETCH_INTERVAL,
+            help="Интервал между циклами в секундах"
+        )
+        parser.add_argument(
+            "--jitter", type=float, default=settings.WEATHER_PREFETCH_JITTER,
+            help="Максимальная случайная пауза между запросами в секундах"
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Выполнить один цикл и выйти (например, из cron)"
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Запустить, даже если кеш в памяти процесса и прогрев не дойдет до веб-воркеров"
+        )
+
+    def handle(self, *args, **options):
+        if ForecastPrefetcher.cache_is_process_local() and not options["force"]:
+            raise CommandError(
+                f"Кеш {settings.CACHES['default']['BACKEND']} виден только этому процессу, прогрев не дойдет "
+                "до веб-воркеров. Настройте общий кеш (CACHE_BACKEND, например Redis) или включите "
+                "WEATHER_PREFETCH_IN_PROCESS=True; --force - запустить все равно."
+            )
+
+        prefetcher = ForecastPrefetcher(top=options["top"], budget=options["budget"], jitter=options["jitter"])
+
+        try:
+            while True:
+                started = time.monotonic()
+                close_old_connections()
+                result = prefetcher.run_once()
+                if result is None:
+                    self.stdout.write("Предыдущий цикл прогрева еще выполняется, цикл пропущен")
+                else:
+                    self.stdout.write(
+                        f"Требуют обновления: {result['due']}, обновлено: {result['refreshed']}, "
+                        f"ошибок: {result['failed']}, запросов к API: {result['requests']}, "
+                        f"обновляются другим запуском: {result['busy']}"
+                    )
+                if options["once"]:
+                    break
+                time.sleep(max(options["interval"] - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("Прогрев кеша завершен"))
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.weather.services.retention import HistoryRetentionService
+
+
+class Command(BaseCommand):
+    help = "Удаляет старую историю поиска пачками и ограничивает число поисков на сессию"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.WEATHER_HISTORY_RETENTION_DAYS,
+            help="Удалить поиски старше указанного числа дней (0 - не удалять по возрасту)"
+        )
+        parser.add_argument(
+            "--per-session", type=int, default=settings.WEATHER_HISTORY_MAX_PER_SESSION,
+            help="Оставить в каждой сессии только последние K поисков (0 - без лимита)"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.WEATHER_HISTORY_DELETE_BATCH_SIZE,
+            help="Сколько строк удалять за одну транзакцию"
+        )
+        parser.add_argument(
+            "--pause", type=float, default=0.0,
+            help="Пауза между пачками в секундах, чтобы снизить нагрузку на БД"
+        )
+
+    def handle(self, *args, **options):
+        retention = HistoryRetentionService(batch_size=options["batch_size"], pause=options["pause"])
+
+        if options["days"] > 0:
+            deleted = retention.delete_older_than(options["days"])
+            self.stdout.write(f"Удалено поисков старше {options['days']} дн.: {deleted}")
+
+        if options["per_session"] > 0:
+            deleted = retention.trim_sessions(options["per_session"])
+            self.stdout.write(f"Удалено поисков сверх лимита {options['per_session']} на сессию: {deleted}")
+
+        if options["days"] > 0:
+            deleted = retention.delete_orphan_snapshots(options["days"])
+            self.stdout.write(f"Удалено неиспользуемых снимков прогнозов: {deleted}")
+
+        deleted = retention.delete_old_rollups(settings.WEATHER_STATS_ROLLUP_RETENTION_DAYS)
+        self.stdout.write(f"Удалено почасовых счетчиков поисков: {deleted}")
+
+        self.stdout.write(self.style.SUCCESS("Очистка истории завершена"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.weather.services.search_counters import SearchCounterService
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики поисков по городам из истории поиска"
+
+    def handle(self, *args, **options):
+        total = SearchCounterService().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано счетчиков: {total}"))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.weather.services.search_rollups import SearchRollupService
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает почасовые счетчики поисков по городам из истории поиска"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.WEATHER_STATS_ROLLUP_RETENTION_DAYS,
+            help="За сколько последних дней пересчитать счетчики"
+        )
+
+    def handle(self, *args, **options):
+        total = SearchRollupService().rebuild(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано почасовых счетчиков: {total}"))
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    CitySearchCounter = apps.get_model("weather", "CitySearchCounter")
+    WeatherSearch = apps.get_model("weather", "WeatherSearch")
+
+    rows = WeatherSearch.objects.values("city_id").annotate(search_count=Count("id")).order_by()
+    CitySearchCounter.objects.bulk_create(
+        (CitySearchCounter(city_id=row["city_id"], search_count=row["search_count"]) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CitySearchCounter",
+            fields=[
+                (
+                    "city",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_counter",
+                        serialize=False,
+                        to="weather.city",
+                        verbose_name="Город",
+                    ),
+                ),
+                (
+                    "search_count",
+                    models.IntegerField(
+                        db_index=True, default=0, verbose_name="Количество поисков"
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0002_citysearchcounter"),
+    ]
+
+    # Сначала создаем составные индексы, затем удаляем покрытые ими одиночные
+    operations = [
+        migrations.AddIndex(
+            model_name="weathersearch",
+            index=models.Index(
+                fields=["session_key", "-search_date", "-id"],
+                name="weather_search_session_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="weathersearch",
+            index=models.Index(
+                fields=["city", "search_date"], name="weather_search_city_date_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="weathersearch",
+            name="session_key",
+            field=models.CharField(max_length=255, verbose_name="Ключ сессии"),
+        ),
+        migrations.AlterField(
+            model_name="weathersearch",
+            name="city",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="weather.city",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0003_weathersearch_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ForecastSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField(verbose_name="Начало интервала")),
+                ("weather_data", models.JSONField(verbose_name="Данные о погоде")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Дата создания"),
+                ),
+                (
+                    "city",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="forecast_snapshots",
+                        to="weather.city",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="weathersearch",
+            name="snapshot",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="searches",
+                to="weather.forecastsnapshot",
+                verbose_name="Снимок прогноза",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="forecastsnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("city", "bucket"), name="weather_snapshot_city_bucket_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+
+def bucket_start(moment, bucket_seconds):
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % bucket_seconds, tz=timezone.utc)
+
+
+def move_to_snapshots(apps, schema_editor):
+    """
+    Переносит weather_data из WeatherSearch в снимки и очищает поле в самих записях.
+
+    Снимок один на город и интервал, поэтому к нему привязываются только поиски
+    с тем же прогнозом, что в снимке. Поиски интервала с другим прогнозом
+    сохраняют свой weather_data - история не теряется (чтение истории берет
+    weather_data, если снимка нет).
+    """
+    ForecastSnapshot = apps.get_model("weather", "ForecastSnapshot")
+    WeatherSearch = apps.get_model("weather", "WeatherSearch")
+    bucket_seconds = getattr(settings, "WEATHER_FORECAST_SNAPSHOT_BUCKET", 600)
+
+    last_id = 0
+    while True:
+        # Каждая пачка в своей транзакции, чтобы не держать блокировки на всей таблице
+        with transaction.atomic():
+            searches = list(
+                WeatherSearch.objects.filter(
+                    id__gt=last_id, snapshot__isnull=True, weather_data__isnull=False
+                ).order_by("id")[:CHUNK_SIZE]
+            )
+            if not searches:
+                return
+            last_id = searches[-1].id
+
+            keys = {}
+            for search in searches:
+                key = (search.city_id, bucket_start(search.search_date, bucket_seconds))
+                keys.setdefault(key, search.weather_data)
+
+            snapshots = {
+                (snapshot.city_id, snapshot.bucket): snapshot
+                for snapshot in ForecastSnapshot.objects.filter(
+                    city_id__in={city_id for city_id, _ in keys},
+                    bucket__in={bucket for _, bucket in keys},
+                )
+            }
+            missing = [
+                ForecastSnapshot(city_id=city_id, bucket=bucket, weather_data=weather_data)
+                for (city_id, bucket), weather_data in keys.items()
+                if (city_id, bucket) not in snapshots
+            ]
+            for snapshot in ForecastSnapshot.objects.bulk_create(missing):
+                snapshots[(snapshot.city_id, snapshot.bucket)] = snapshot
+
+            moved = []
+            for search in searches:
+                snapshot = snapshots[(search.city_id, bucket_start(search.search_date, bucket_seconds))]
+                if snapshot.weather_data != search.weather_data:
+                    continue
+                search.snapshot = snapshot
+                search.weather_data = None
+                moved.append(search)
+            WeatherSearch.objects.bulk_update(moved, ["snapshot", "weather_data"])
+
+
+def restore_weather_data(apps, schema_editor):
+    """Возвращает прогнозы из снимков в weather_data записей, чтобы откат не терял историю."""
+    WeatherSearch = apps.get_model("weather", "WeatherSearch")
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            searches = list(
+                WeatherSearch.objects.filter(id__gt=last_id, snapshot__isnull=False)
+                .select_related("snapshot")
+                .order_by("id")[:CHUNK_SIZE]
+            )
+            if not searches:
+                return
+            last_id = searches[-1].id
+
+            for search in searches:
+                search.weather_data = search.snapshot.weather_data
+                search.snapshot = None
+            WeatherSearch.objects.bulk_update(searches, ["weather_data", "snapshot"])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("weather", "0004_forecastsnapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(move_to_snapshots, restore_weather_data),
+    ]
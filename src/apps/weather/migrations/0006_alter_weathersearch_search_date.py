@@ -0,0 +1,20 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0005_move_weather_data_to_snapshots"),
+    ]
+
+    # Дата поиска задается явно при отложенной записи истории
+    operations = [
+        migrations.AlterField(
+            model_name="weathersearch",
+            name="search_date",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Дата поиска"
+            ),
+        ),
+    ]
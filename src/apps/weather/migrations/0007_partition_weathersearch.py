@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_table(apps, schema_editor):
+    """На PostgreSQL при WEATHER_HISTORY_PARTITIONING переводит WeatherSearch на месячные партиции."""
+    if schema_editor.connection.vendor != "postgresql" or not settings.WEATHER_HISTORY_PARTITIONING:
+        return
+
+    from apps.weather.services.partitions import SearchPartitionService
+
+    SearchPartitionService().convert(ahead=settings.WEATHER_HISTORY_PARTITIONS_AHEAD)
+
+
+def unpartition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    from apps.weather.services.partitions import SearchPartitionService
+
+    SearchPartitionService().revert()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0006_alter_weathersearch_search_date"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
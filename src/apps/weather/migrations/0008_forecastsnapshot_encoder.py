@@ -0,0 +1,20 @@
+import apps.weather.services.forecast_data
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0007_partition_weathersearch"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="forecastsnapshot",
+            name="weather_data",
+            field=models.JSONField(
+                encoder=apps.weather.services.forecast_data.ForecastJSONEncoder,
+                verbose_name="Данные о погоде",
+            ),
+        ),
+    ]
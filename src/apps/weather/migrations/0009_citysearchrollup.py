@@ -0,0 +1,63 @@
+from datetime import timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def fill_rollups(apps, schema_editor):
+    """Заполняет почасовые счетчики за последние 30 дней (самое длинное окно статистики)."""
+    CitySearchRollup = apps.get_model("weather", "CitySearchRollup")
+    WeatherSearch = apps.get_model("weather", "WeatherSearch")
+
+    since = (timezone.now() - timedelta(days=30)).replace(minute=0, second=0, microsecond=0)
+    rows = (
+        WeatherSearch.objects.filter(search_date__gte=since)
+        .annotate(hour=TruncHour("search_date", tzinfo=dt_timezone.utc))
+        .values("city_id", "hour")
+        .annotate(search_count=Count("id"))
+        .order_by()
+    )
+    CitySearchRollup.objects.bulk_create(
+        (
+            CitySearchRollup(city_id=row["city_id"], hour=row["hour"], search_count=row["search_count"])
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0008_forecastsnapshot_encoder"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CitySearchRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hour", models.DateTimeField(verbose_name="Начало часа (UTC)")),
+                ("search_count", models.IntegerField(default=0, verbose_name="Количество поисков")),
+                (
+                    "city",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_rollups",
+                        to="weather.city",
+                        verbose_name="Город",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["hour"], name="weather_rollup_hour_idx")],
+                "constraints": [
+                    models.UniqueConstraint(fields=("city", "hour"), name="weather_rollup_city_hour_uniq")
+                ],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0009_citysearchrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="city",
+            name="geoname_id",
+            field=models.IntegerField(blank=True, null=True, unique=True, verbose_name="ID GeoNames"),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="population",
+            field=models.IntegerField(default=0, verbose_name="Население"),
+        ),
+        migrations.CreateModel(
+            name="CityAlternateName",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=200, verbose_name="Название")),
+                (
+                    "normalized",
+                    models.CharField(db_index=True, max_length=200, verbose_name="Нормализованное название"),
+                ),
+                (
+                    "city",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alternate_names",
+                        to="weather.city",
+                        verbose_name="Город",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("city", "normalized"), name="weather_city_altname_uniq")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0010_gazetteer"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name="Набор данных"),
+                ),
+                ("version", models.BigIntegerField(default=0, verbose_name="Версия")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name="Обновлен"),
+        ),
+    ]
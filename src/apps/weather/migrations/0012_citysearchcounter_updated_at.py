@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0011_city_updated_at_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="citysearchcounter",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name="Обновлен"),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+
+from .services.forecast_data import ForecastJSONEncoder
 
 
 class City(models.Model):
@@ -8,18 +11,116 @@ class City(models.Model):
     country = models.CharField("Страна", max_length=100)
     latitude = models.FloatField("Широта")
     longitude = models.FloatField("Долгота")
+    # Заполняются импортом справочника GeoNames (команда import_gazetteer)
+    geoname_id = models.IntegerField("ID GeoNames", unique=True, null=True, blank=True)
+    population = models.IntegerField("Население", default=0)
+    # По нему индексы городов в памяти догружают изменения других процессов
+    updated_at = models.DateTimeField("Обновлен", auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name}, {self.country}"
 
 
+class CityAlternateName(models.Model):
+    """Альтернативное название города (из справочника GeoNames) для локального геокодинга."""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="alternate_names", verbose_name="Город")
+    name = models.CharField("Название", max_length=200)
+    # Название в виде GeocodingCache.normalize() - по нему идет поиск
+    normalized = models.CharField("Нормализованное название", max_length=200, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["city", "normalized"], name="weather_city_altname_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.city.name})"
+
+
+class ForecastSnapshot(models.Model):
+    """Модель для хранения полученного из Open-Meteo прогноза по городу."""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="forecast_snapshots")
+    # Время получения прогноза из Open-Meteo; если оно неизвестно - начало интервала времени поиска
+    bucket = models.DateTimeField("Начало интервала")
+    weather_data = models.JSONField("Данные о погоде", encoder=ForecastJSONEncoder)
+    created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["city", "bucket"], name="weather_snapshot_city_bucket_uniq"),
+        ]
+
+    def __str__(self):
+        return f"Прогноз для {self.city.name} ({self.bucket})"
+
+
 class WeatherSearch(models.Model):
     """Модель для хранения информации о поиске погоды по городу."""
 
-    session_key = models.CharField("Ключ сессии", max_length=255, db_index=True)
-    city = models.ForeignKey(City, on_delete=models.CASCADE)
-    search_date = models.DateTimeField("Дата поиска", auto_now_add=True)
+    session_key = models.CharField("Ключ сессии", max_length=255)
+    city = models.ForeignKey(City, on_delete=models.CASCADE, db_index=False)
+    search_date = models.DateTimeField("Дата поиска", default=timezone.now)
+    snapshot = models.ForeignKey(
+        ForecastSnapshot, on_delete=models.SET_NULL, null=True, blank=True, related_name="searches",
+        verbose_name="Снимок прогноза"
+    )
+    # Устаревшее поле: новые поиски ссылаются на snapshot, старые перенесены миграцией 0005
+    # (кроме поисков, прогноз которых отличается от снимка их интервала)
     weather_data = models.JSONField("Данные о погоде", blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # История сессии: фильтр по session_key, сортировка по (-search_date, -id)
+            models.Index(fields=["session_key", "-search_date", "-id"], name="weather_search_session_idx"),
+            # Статистика по городу за период
+            models.Index(fields=["city", "search_date"], name="weather_search_city_date_idx"),
+        ]
+
     def __str__(self):
         return f"Поиск погоды для {self.city.name} ({self.search_date})"
+
+
+class CitySearchCounter(models.Model):
+    """Материализованный счетчик поисков по городу для статистики популярности."""
+
+    city = models.OneToOneField(
+        City, on_delete=models.CASCADE, primary_key=True, related_name="search_counter", verbose_name="Город"
+    )
+    search_count = models.IntegerField("Количество поисков", default=0, db_index=True)
+    # Последнее изменение счетчиков - версия статистики для ETag
+    updated_at = models.DateTimeField("Обновлен", auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.city.name}: {self.search_count}"
+
+
+class CitySearchRollup(models.Model):
+    """Число поисков по городу за час - для статистики популярности за период."""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="search_rollups", verbose_name="Город")
+    hour = models.DateTimeField("Начало часа (UTC)")
+    search_count = models.IntegerField("Количество поисков", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["city", "hour"], name="weather_rollup_city_hour_uniq"),
+        ]
+        indexes = [
+            # Статистика за окно: все города за последние часы
+            models.Index(fields=["hour"], name="weather_rollup_hour_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.city.name} ({self.hour}): {self.search_count}"
+
+
+class DataVersion(models.Model):
+    """Версия набора данных, общая для всех процессов: увеличивается при каждом изменении."""
+
+    name = models.CharField("Набор данных", max_length=50, primary_key=True)
+    version = models.BigIntegerField("Версия", default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
@@ -0,0 +1,48 @@
+import asyncio
+import weakref
+
+import httpx
+from django.conf import settings
+
+# httpx.AsyncClient привязан к event loop, в котором создан,
+# поэтому клиент создается один раз на каждый loop процесса.
+_clients = weakref.WeakKeyDictionary()
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Создает асинхронный клиент с пулом keep-alive соединений."""
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_POOL_SIZE,
+        max_keepalive_connections=settings.HTTP_CLIENT_POOL_SIZE,
+    )
+    timeout = httpx.Timeout(
+        settings.HTTP_CLIENT_READ_TIMEOUT,
+        connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+    )
+    transport = httpx.AsyncHTTPTransport(retries=settings.HTTP_CLIENT_RETRIES, limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Возвращает общий асинхронный клиент для текущего event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[loop] = client
+    return client
+
+
+async def aclose() -> None:
+    """Закрывает клиент текущего event loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get(url: str, params: dict | None = None, read_timeout: float | None = None) -> httpx.Response:
+    """Выполняет асинхронный GET-запрос через общий клиент."""
+    timeout = httpx.USE_CLIENT_DEFAULT
+    if read_timeout is not None:
+        timeout = httpx.Timeout(read_timeout, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT)
+    return await get_client().get(url, params=params, timeout=timeout)
@@ -0,0 +1,104 @@
+import httpx
+from asgiref.sync import sync_to_async
+
+from ..models import City
+from . import async_http_client
+from .weather_service import WeatherService
+
+
+class AsyncWeatherService(WeatherService):
+    """Асинхронный вариант WeatherService для ASGI-представлений."""
+
+    async def aget_city_coordinates(self, city_name: str) -> tuple[float, float]:
+        """Асинхронно получает координаты города по его названию."""
+        cached = await self.geocoding_cache.aget(city_name)
+        if cached is not None:
+            return self._coordinates_from_cache(cached, city_name)
+
+        city = await sync_to_async(self.find_city)(city_name)
+        if city is None:
+            return await self._afetch_coordinates_from_api(city_name)
+
+        await self.geocoding_cache.aset_found(city_name, city.latitude, city.longitude)
+        return city.latitude, city.longitude
+
+    async def aget_weather_forecast(self, latitude: float, longitude: float) -> dict:
+        """Асинхронно получает прогноз погоды по координатам."""
+        return (await self.aget_weather_forecast_entry(latitude, longitude))["data"]
+
+    async def aget_weather_forecast_entry(self, latitude: float, longitude: float) -> dict:
+        """Асинхронная версия get_weather_forecast_entry(); фоновое обновление идет в потоке."""
+        latitude, longitude = self.snap_coordinates(latitude, longitude)
+        params = self._forecast_params(latitude, longitude)
+
+        cache_key = self.forecast_cache.make_key(latitude, longitude, params)
+        entry = await self.forecast_cache.aget_entry(cache_key)
+        if entry is None:
+            return await self.forecast_flight.ado(cache_key, lambda: self._arequest_forecast(params, cache_key))
+
+        if entry["stale"]:
+            await sync_to_async(self.forecast_refresher.submit)(
+                cache_key, lambda: self._request_forecast(params, cache_key)
+            )
+        return entry
+
+    async def _arequest_forecast(self, params: dict, cache_key: str) -> dict:
+        """Асинхронно запрашивает прогноз, сохраняет его в кеш и возвращает запись кеша."""
+        try:
+            response = await async_http_client.get(self.WEATHER_API_URL, params=params)
+            response.raise_for_status()
+
+            return await self.forecast_cache.aset(cache_key, response.json())
+
+        except httpx.HTTPError as e:
+            raise ValueError(f"Ошибка при получении данных о погоде: {str(e)}")
+
+    async def _afetch_coordinates_from_api(self, city_name: str) -> tuple[float, float]:
+        """Асинхронно получает координаты города через Geocoding API."""
+        return await self.geocoding_flight.ado(
+            self.geocoding_cache.make_key(city_name),
+            lambda: self._arequest_coordinates(city_name)
+        )
+
+    async def _arequest_coordinates(self, city_name: str) -> tuple[float, float]:
+        """Асинхронно запрашивает координаты и сохраняет город."""
+        try:
+            params = self._geocoding_params(city_name)
+
+            response = await async_http_client.get(self.GEOCODING_API_URL, params=params)
+            response.raise_for_status()
+
+            data = response.json()
+
+            if not data.get("results"):
+                await self.geocoding_cache.aset_not_found(city_name)
+                raise ValueError(f"Город '{city_name}' не найден.")
+
+            result = data["results"][0]
+
+            city, created = await City.objects.aget_or_create(
+                name__iexact=result.get("name", city_name),
+                defaults=self._city_defaults(result, city_name)
+            )
+            await sync_to_async(self._remember_alternate_name)(city, city_name)
+
+            await self.geocoding_cache.aset_found(city_name, result["latitude"], result["longitude"])
+            return result["latitude"], result["longitude"]
+
+        except httpx.HTTPError as e:
+            raise ValueError(f"Ошибка при получении координат города: {str(e)}")
+
+    async def asearch_weather_by_city(self, city_name: str) -> dict:
+        """Асинхронный полный поиск погоды по названию города."""
+        try:
+            latitude, longitude = await self.aget_city_coordinates(city_name)
+            forecast = await self.aget_weather_forecast_entry(latitude, longitude)
+
+            formatted_data = self.format_weather_data(forecast["data"])
+            formatted_data.update(self.forecast_age(forecast))
+            return formatted_data
+
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Неожиданная ошибка: {str(e)}")
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geocoding_cache import GeocodingCache
+
+
+class AutocompleteCache:
+    """Кеш предложений Geocoding API для автодополнения."""
+
+    KEY_PREFIX = "weather:autocomplete"
+
+    def __init__(self, ttl: int | None = None):
+        self.ttl = settings.WEATHER_AUTOCOMPLETE_CACHE_TTL if ttl is None else ttl
+
+    def make_key(self, query: str) -> str:
+        """Строит ключ кеша по нормализованному запросу."""
+        digest = hashlib.md5(GeocodingCache.normalize(query).encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def get(self, query: str) -> list[dict] | None:
+        """Возвращает сохраненные предложения или None при промахе."""
+        return cache.get(self.make_key(query))
+
+    def set(self, query: str, suggestions: list[dict]) -> None:
+        """Сохраняет предложения на время TTL."""
+        cache.set(self.make_key(query), suggestions, self.ttl)
+
+    async def aget(self, query: str) -> list[dict] | None:
+        """Асинхронная версия get()."""
+        return await cache.aget(self.make_key(query))
+
+    async def aset(self, query: str, suggestions: list[dict]) -> None:
+        """Асинхронная версия set()."""
+        await cache.aset(self.make_key(query), suggestions, self.ttl)
@@ -0,0 +1,85 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresher:
+    """
+    Фоновое обновление устаревших записей кеша (stale-while-revalidate).
+
+    Для каждого ключа одновременно выполняется не больше одного обновления
+    (несколько ключей можно обновить одним вызовом, см. submit_many()):
+    в пределах процесса - по набору ключей в работе, между воркерами - по
+    короткой блокировке в общем кеше. Ошибка обновления только логируется:
+    устаревшая запись остается в кеше до жесткого TTL. При
+    WEATHER_FORECAST_REFRESH_WORKERS=0 обновление выполняется сразу в
+    вызывающем потоке.
+    """
+
+    KEY_PREFIX = "weather:refresh"
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._executor = None
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn) -> bool:
+        """Запускает fn() для обновления key, если оно еще не идет; возвращает, запущено ли."""
+        return bool(self.submit_many([key], lambda keys: fn()))
+
+    def submit_many(self, keys: list[str], fn) -> list[str]:
+        """
+        Запускает одно обновление fn(claimed) для тех keys, обновление которых еще не идет.
+
+        Возвращает захваченные ключи (claimed): остальные уже обновляются в этом
+        или другом процессе.
+        """
+        with self._lock:
+            claimed = [
+                key for key in dict.fromkeys(keys)
+                if key not in self._running
+                and cache.add(self._lock_key(key), 1, settings.WEATHER_FORECAST_REFRESH_LOCK_TIMEOUT)
+            ]
+            if not claimed:
+                return []
+            self._running.update(claimed)
+            executor = self._get_executor()
+
+        if executor is None:
+            self._run(claimed, fn, background=False)
+        else:
+            executor.submit(self._run, claimed, fn, True)
+        return claimed
+
+    def _run(self, keys: list[str], fn, background: bool) -> None:
+        try:
+            fn(keys)
+        except Exception as e:
+            logger.warning(
+                f"Background refresh of {self.namespace} {', '.join(repr(key) for key in keys)} failed, "
+                f"serving stale data: {e}"
+            )
+        finally:
+            cache.delete_many([self._lock_key(key) for key in keys])
+            with self._lock:
+                self._running.difference_update(keys)
+            if background:
+                close_old_connections()
+
+    def _get_executor(self) -> ThreadPoolExecutor | None:
+        workers = settings.WEATHER_FORECAST_REFRESH_WORKERS
+        if workers <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{self.namespace}-refresh")
+        return self._executor
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:{self.namespace}:{key}"
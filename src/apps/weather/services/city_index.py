@@ -0,0 +1,124 @@
+import bisect
+import heapq
+import re
+
+from django.db.models import F
+
+from .city_index_base import CityIndexBase
+from .geocoding_cache import GeocodingCache
+
+WORD_SEPARATORS = re.compile(r"[\s\-]+")
+
+
+class CityPrefixIndex(CityIndexBase):
+    """
+    Префиксный индекс названий городов в памяти процесса.
+
+    Хранит отсортированный массив пар (ключ, id города), где ключи - нормализованное
+    название и каждое его слово ("санкт-петербург", "петербург"). Поиск по префиксу -
+    бинарный поиск по массиву, результаты ранжируются по популярности города,
+    затем по населению (для городов из справочника GeoNames).
+    Загрузка и синхронизация с другими процессами - в CityIndexBase.
+    """
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        """Возвращает до limit городов, название или слово которых начинается с query."""
+        prefix = GeocodingCache.normalize(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            self._ensure_fresh()
+
+            matched = {}
+            position = bisect.bisect_left(self._keys, (prefix,))
+            while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+                key, city_id = self._keys[position]
+                is_name_prefix = key == self._city_keys[city_id][0]
+                matched[city_id] = matched.get(city_id, False) or is_name_prefix
+                position += 1
+
+            ranked = heapq.nsmallest(limit, matched, key=lambda city_id: (
+                not matched[city_id],
+                -self._popularity.get(city_id, 0),
+                -self._population.get(city_id, 0),
+                len(self._cities[city_id]["name"]),
+                self._cities[city_id]["name"],
+            ))
+            return [dict(self._cities[city_id], id=city_id) for city_id in ranked]
+
+    def bump(self, city_id: int, count: int = 1) -> None:
+        """Увеличивает популярность города после нового поиска."""
+        with self._lock:
+            if self._loaded and city_id in self._cities:
+                self._popularity[city_id] = self._popularity.get(city_id, 0) + count
+
+    def _rows(self):
+        return super()._rows().annotate(search_count=F("search_counter__search_count"))
+
+    def _build(self, rows: list[dict]) -> dict:
+        keys = []
+        state = {"keys": keys, "city_keys": {}, "cities": {}, "popularity": {}, "population": {}}
+        for row in rows:
+            city_id = row["id"]
+            city_keys = self._make_keys(row["name"])
+            state["city_keys"][city_id] = city_keys
+            state["cities"][city_id] = self._city_data(row["name"], row["country"], row["latitude"], row["longitude"])
+            state["popularity"][city_id] = row["search_count"] or 0
+            state["population"][city_id] = row["population"]
+            keys.extend((key, city_id) for key in city_keys)
+        keys.sort()
+        return state
+
+    def _swap(self, state: dict) -> None:
+        self._keys = state["keys"]
+        self._city_keys = state["city_keys"]
+        self._cities = state["cities"]
+        self._popularity = state["popularity"]
+        self._population = state["population"]
+
+    def _apply(self, row: dict) -> None:
+        city_id = row["id"]
+        self._remove(city_id)
+        self._insert(city_id, row["name"], row["country"], row["latitude"], row["longitude"])
+        self._population[city_id] = row["population"]
+        if row.get("search_count") is not None:
+            self._popularity[city_id] = max(self._popularity[city_id], row["search_count"])
+
+    def _discard(self, city_id: int) -> None:
+        self._remove(city_id)
+        self._popularity.pop(city_id, None)
+        self._population.pop(city_id, None)
+
+    def _insert(self, city_id, name, country, latitude, longitude) -> None:
+        city_keys = self._make_keys(name)
+        self._city_keys[city_id] = city_keys
+        self._cities[city_id] = self._city_data(name, country, latitude, longitude)
+        self._popularity.setdefault(city_id, 0)
+        for key in city_keys:
+            bisect.insort(self._keys, (key, city_id))
+
+    def _remove(self, city_id: int) -> None:
+        for key in self._city_keys.pop(city_id, []):
+            position = bisect.bisect_left(self._keys, (key, city_id))
+            if position < len(self._keys) and self._keys[position] == (key, city_id):
+                del self._keys[position]
+        self._cities.pop(city_id, None)
+
+    @staticmethod
+    def _make_keys(name: str) -> list[str]:
+        """Ключи города: полное название и название, начиная с каждого следующего слова."""
+        normalized = GeocodingCache.normalize(name)
+        keys = [normalized]
+        for match in WORD_SEPARATORS.finditer(normalized):
+            suffix = normalized[match.end():]
+            if suffix and suffix not in keys:
+                keys.append(suffix)
+        return keys
+
+    @staticmethod
+    def _city_data(name, country, latitude, longitude) -> dict:
+        return {"name": name, "country": country, "latitude": latitude, "longitude": longitude}
+
+
+city_index = CityPrefixIndex()
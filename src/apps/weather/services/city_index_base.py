@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from ..models import City
+from .data_versions import DataVersionService
+
+logger = logging.getLogger(__name__)
+
+
+class CityIndexBase:
+    """
+    Индекс городов в памяти процесса, синхронизируемый с БД.
+
+    Индекс загружается из БД при первом обращении, изменения городов в этом
+    процессе применяются сразу (сигналы модели). Об изменениях в других
+    процессах и командах управления индекс узнает по версии городов в БД
+    (DataVersionService), проверяя ее не чаще раза в
+    WEATHER_CITY_INDEX_CHECK_INTERVAL секунд: новые и измененные города
+    догружаются по updated_at без перезагрузки таблицы. После удаления городов
+    или больше WEATHER_CITY_INDEX_MAX_INCREMENTAL изменений индекс
+    перестраивается целиком в фоновом потоке, а запросы до замены обслуживает
+    прежний индекс.
+
+    Подклассы реализуют _build() (новое состояние по строкам городов),
+    _swap() (подмена состояния) и _apply()/_discard() (изменение одного города).
+    """
+
+    ROW_FIELDS = ("id", "name", "country", "latitude", "longitude", "population", "updated_at")
+
+    # Транзакция может зафиксироваться позже более новой, поэтому изменения читаются с запасом
+    CHANGES_OVERLAP = timedelta(minutes=1)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reload_thread = None
+        self.versions = DataVersionService()
+        self.reset()
+
+    def reset(self) -> None:
+        """Сбрасывает индекс, следующий поиск загрузит его заново."""
+        with self._lock:
+            self._swap(self._build([]))
+            self._loaded = False
+            self._synced_versions = None
+            self._synced_until = None
+            self._checked_at = 0.0
+
+    def add(self, city: City) -> None:
+        """Добавляет или обновляет город в индексе."""
+        with self._lock:
+            if self._loaded:
+                self._apply({field: getattr(city, "pk" if field == "id" else field) for field in self.ROW_FIELDS})
+
+    def remove(self, city_id: int) -> None:
+        """Удаляет город из индекса."""
+        with self._lock:
+            if self._loaded:
+                self._discard(city_id)
+
+    def _ensure_fresh(self) -> None:
+        """Вызывается под self._lock перед каждым поиском."""
+        if not self._loaded:
+            self._reload()
+            return
+
+        now = time.monotonic()
+        if now - self._checked_at < settings.WEATHER_CITY_INDEX_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        versions = self.versions.get(DataVersionService.CITIES, DataVersionService.CITY_DELETIONS)
+        if versions == self._synced_versions:
+            return
+        if versions[DataVersionService.CITY_DELETIONS] != self._synced_versions[DataVersionService.CITY_DELETIONS]:
+            self._reload_later()
+            return
+
+        rows = self._rows()
+        if self._synced_until is not None:
+            rows = rows.filter(updated_at__gte=self._synced_until - self.CHANGES_OVERLAP)
+        rows = list(rows.order_by("updated_at")[:settings.WEATHER_CITY_INDEX_MAX_INCREMENTAL + 1])
+        if len(rows) > settings.WEATHER_CITY_INDEX_MAX_INCREMENTAL:
+            self._reload_later()
+            return
+
+        for row in rows:
+            self._apply(row)
+        self._synced_versions = versions
+        if rows:
+            self._synced_until = max(self._synced_until or rows[-1]["updated_at"], rows[-1]["updated_at"])
+
+    def _reload(self) -> None:
+        """Загружает индекс из БД целиком; строится без блокировки, под ней только подменяется."""
+        # Версии читаются до строк: изменения во время загрузки догрузятся при следующей проверке
+        versions = self.versions.get(DataVersionService.CITIES, DataVersionService.CITY_DELETIONS)
+        synced_until = None
+        rows = []
+        for row in self._rows().iterator():
+            rows.append(row)
+            if synced_until is None or row["updated_at"] > synced_until:
+                synced_until = row["updated_at"]
+        state = self._build(rows)
+
+        with self._lock:
+            self._swap(state)
+            self._loaded = True
+            self._synced_versions = versions
+            self._synced_until = synced_until
+            self._checked_at = time.monotonic()
+
+    def _reload_later(self) -> None:
+        """Перестраивает индекс в фоновом потоке (или сразу, если фон отключен)."""
+        if not settings.WEATHER_CITY_INDEX_BACKGROUND_RELOAD:
+            self._reload()
+            return
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+        self._reload_thread = threading.Thread(
+            target=self._background_reload, name=f"{type(self).__name__}-reload", daemon=True
+        )
+        self._reload_thread.start()
+
+    def _background_reload(self) -> None:
+        try:
+            self._reload()
+        except Exception as e:
+            logger.error(f"{type(self).__name__} reload failed, serving the previous index: {e}")
+        finally:
+            close_old_connections()
+
+    def _rows(self):
+        return City.objects.values(*self.ROW_FIELDS)
+
+    def _build(self, rows: list[dict]):
+        raise NotImplementedError
+
+    def _swap(self, state) -> None:
+        raise NotImplementedError
+
+    def _apply(self, row: dict) -> None:
+        raise NotImplementedError
+
+    def _discard(self, city_id: int) -> None:
+        raise NotImplementedError
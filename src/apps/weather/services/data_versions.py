@@ -0,0 +1,39 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import DataVersion
+
+
+class DataVersionService:
+    """
+    Версии наборов данных в БД.
+
+    Кеш по умолчанию (LocMemCache) у каждого процесса свой, поэтому об изменениях,
+    сделанных другими воркерами и командами управления, процессы узнают по версии
+    в БД: изменение увеличивает версию в той же транзакции, а читатели сравнивают
+    ее с запомненной - одна выборка по первичному ключу.
+    """
+
+    CITIES = "cities"
+    # Удаления нельзя догрузить по updated_at - после них индексы перестраиваются целиком
+    CITY_DELETIONS = "city_deletions"
+
+    def get(self, *names: str) -> dict[str, int]:
+        """Текущие версии наборов данных; набор, который еще не менялся, имеет версию 0."""
+        versions = dict(DataVersion.objects.filter(name__in=names).values_list("name", "version"))
+        return {name: versions.get(name, 0) for name in names}
+
+    def bump(self, *names: str) -> None:
+        """Увеличивает версии наборов данных после их изменения."""
+        for name in names:
+            if not self._increment(name):
+                try:
+                    with transaction.atomic():
+                        DataVersion.objects.create(name=name, version=1)
+                except IntegrityError:
+                    # Строку версии успел создать параллельный запрос
+                    self._increment(name)
+
+    @staticmethod
+    def _increment(name: str) -> bool:
+        return bool(DataVersion.objects.filter(name=name).update(version=F("version") + 1))
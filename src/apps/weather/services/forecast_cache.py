@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ForecastCache:
+    """
+    Кеш прогнозов погоды поверх Django cache framework.
+
+    Прогноз хранится вместе со временем получения. До мягкого TTL (ttl) запись
+    свежая, после него - устаревшая: ее еще можно отдать, пока она обновляется
+    в фоне. Из кеша запись исчезает по жесткому TTL (hard_ttl).
+    """
+
+    KEY_PREFIX = "weather:forecast:v2"
+
+    _stats = {"hits": 0, "stale": 0, "misses": 0}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, ttl: int | None = None, precision: int | None = None, hard_ttl: int | None = None):
+        self.ttl = settings.WEATHER_FORECAST_CACHE_TTL if ttl is None else ttl
+        self.hard_ttl = settings.WEATHER_FORECAST_CACHE_HARD_TTL if hard_ttl is None else hard_ttl
+        self.hard_ttl = max(self.hard_ttl, self.ttl)
+        self.precision = settings.WEATHER_FORECAST_CACHE_PRECISION if precision is None else precision
+
+    def make_key(self, latitude: float, longitude: float, params: dict) -> str:
+        """Строит ключ кеша по округленным координатам и запрошенным переменным."""
+        variables = "&".join(
+            f"{name}={value}" for name, value in sorted(params.items())
+            if name not in ("latitude", "longitude")
+        )
+        digest = hashlib.md5(variables.encode("utf-8")).hexdigest()
+        return (
+            f"{self.KEY_PREFIX}:{round(latitude, self.precision)}:"
+            f"{round(longitude, self.precision)}:{digest}"
+        )
+
+    def get(self, key: str) -> dict | None:
+        """Возвращает прогноз из кеша (в том числе устаревший) и обновляет счетчики."""
+        entry = self.get_entry(key)
+        return entry["data"] if entry is not None else None
+
+    def get_entry(self, key: str) -> dict | None:
+        """Возвращает {"data", "fetched_at", "age", "stale"} или None при промахе."""
+        return self._entry(cache.get(key))
+
+    def set(self, key: str, value: dict) -> dict:
+        """Сохраняет прогноз в кеш до жесткого TTL, возвращает сохраненную запись в формате get_entry()."""
+        stored = self._wrap(value)
+        cache.set(key, stored, self.hard_ttl)
+        return self._fresh_entry(stored)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Возвращает найденные в кеше прогнозы одним обращением к кешу."""
+        return {key: entry["data"] for key, entry in self.get_entries(keys).items()}
+
+    def get_entries(self, keys: list[str]) -> dict:
+        """Как get_many(), но значения - записи get_entry()."""
+        values = cache.get_many(keys)
+        self._count("misses", len(keys) - len(values))
+        return {key: self._entry(value) for key, value in values.items()}
+
+    def fetched_at_many(self, keys: list[str]) -> dict[str, float]:
+        """Время получения найденных прогнозов, не затрагивая счетчики попаданий."""
+        return {key: value["fetched_at"] for key, value in cache.get_many(keys).items()}
+
+    def set_many(self, values: dict) -> None:
+        """Сохраняет несколько прогнозов одним обращением к кешу."""
+        fetched_at = time.time()
+        cache.set_many({key: self._wrap(value, fetched_at) for key, value in values.items()}, self.hard_ttl)
+
+    async def aget(self, key: str) -> dict | None:
+        """Асинхронная версия get()."""
+        entry = await self.aget_entry(key)
+        return entry["data"] if entry is not None else None
+
+    async def aget_entry(self, key: str) -> dict | None:
+        """Асинхронная версия get_entry()."""
+        return self._entry(await cache.aget(key))
+
+    async def aset(self, key: str, value: dict) -> dict:
+        """Асинхронная версия set()."""
+        stored = self._wrap(value)
+        await cache.aset(key, stored, self.hard_ttl)
+        return self._fresh_entry(stored)
+
+    def _entry(self, stored: dict | None) -> dict | None:
+        if stored is None:
+            self._count("misses")
+            return None
+
+        age = max(time.time() - stored["fetched_at"], 0.0)
+        stale = age >= self.ttl
+        self._count("stale" if stale else "hits")
+        return {"data": stored["data"], "fetched_at": stored["fetched_at"], "age": int(age), "stale": stale}
+
+    @staticmethod
+    def _fresh_entry(stored: dict) -> dict:
+        return {"data": stored["data"], "fetched_at": stored["fetched_at"], "age": 0, "stale": False}
+
+    @staticmethod
+    def _wrap(value: dict, fetched_at: float | None = None) -> dict:
+        return {"data": value, "fetched_at": time.time() if fetched_at is None else fetched_at}
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Возвращает счетчики попаданий (свежих и устаревших) и промахов текущего процесса."""
+        with cls._stats_lock:
+            hits, stale, misses = cls._stats["hits"], cls._stats["stale"], cls._stats["misses"]
+        total = hits + stale + misses
+        return {
+            "hits": hits,
+            "stale": stale,
+            "misses": misses,
+            "hit_rate": round((hits + stale) / total, 4) if total else 0.0,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        """Обнуляет счетчики попаданий и промахов."""
+        with cls._stats_lock:
+            for name in cls._stats:
+                cls._stats[name] = 0
+
+    @classmethod
+    def _count(cls, name: str, value: int = 1) -> None:
+        with cls._stats_lock:
+            cls._stats[name] += value
@@ -0,0 +1,211 @@
+import bisect
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ..enums.weather_codes import weather_codes
+
+try:
+    import numpy as np
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+
+
+def weather_description(weather_code: int | None) -> str:
+    """Текстовое описание погоды по коду; отсутствующий код считается ясной погодой."""
+    return weather_codes.get(weather_code if weather_code is not None else 0, "Неизвестно")
+
+
+class DayView:
+    """Ленивое представление одного дня прогноза: значения читаются из столбцов по индексу."""
+
+    __slots__ = ("_forecast", "_index")
+
+    def __init__(self, forecast: "DailyForecast", index: int):
+        self._forecast = forecast
+        self._index = index
+
+    @property
+    def date(self):
+        return self._forecast.dates[self._index]
+
+    @property
+    def temp_max(self):
+        return self._forecast.value("temp_max", self._index)
+
+    @property
+    def temp_min(self):
+        return self._forecast.value("temp_min", self._index)
+
+    @property
+    def weather_code(self):
+        return self._forecast.value("weather_code", self._index)
+
+    @property
+    def description(self) -> str:
+        return weather_description(self.weather_code)
+
+    def __getitem__(self, key: str):
+        if key not in DailyForecast.DAY_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in DailyForecast.DAY_FIELDS}
+
+
+class DailyForecast:
+    """
+    Прогноз по дням в виде параллельных массивов.
+
+    Столбцы строятся за один проход по массивам Open-Meteo, без словаря на
+    каждый день. Числовые столбцы могут храниться в массивах NumPy
+    (WEATHER_FORECAST_NUMPY и установленный numpy), пропуски тогда - NaN.
+    Для шаблонов доступны ленивые DayView, для JSON - to_json().
+    """
+
+    __slots__ = ("dates", "temp_max", "temp_min", "weather_code")
+
+    # Столбец -> переменная Open-Meteo
+    COLUMNS = {
+        "temp_max": "temperature_2m_max",
+        "temp_min": "temperature_2m_min",
+        "weather_code": "weather_code",
+    }
+    DAY_FIELDS = ("date", "temp_max", "temp_min", "weather_code", "description")
+
+    def __init__(self, dates: list, temp_max, temp_min, weather_code):
+        self.dates = dates
+        self.temp_max = temp_max
+        self.temp_min = temp_min
+        self.weather_code = weather_code
+
+    @classmethod
+    def from_open_meteo(cls, daily: dict, use_numpy: bool | None = None) -> "DailyForecast":
+        """Строит прогноз из блока "daily" ответа Open-Meteo."""
+        if use_numpy is None:
+            use_numpy = settings.WEATHER_FORECAST_NUMPY
+        use_numpy = use_numpy and np is not None
+
+        dates = list(daily.get("time") or [])
+        size = len(dates)
+        columns = {
+            name: cls._column(daily.get(variable) or [], size, use_numpy)
+            for name, variable in cls.COLUMNS.items()
+        }
+        return cls(dates, **columns)
+
+    def value(self, column: str, index: int):
+        """Значение столбца для дня index; пропуск (в том числе NaN) - None."""
+        value = getattr(self, column)[index]
+        if np is not None and isinstance(value, np.generic):
+            value = None if np.isnan(value) else value.item()
+            if column == "weather_code" and value is not None:
+                value = int(value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __iter__(self):
+        return (DayView(self, index) for index in range(len(self.dates)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [DayView(self, position) for position in range(*index.indices(len(self.dates)))]
+        if index < 0:
+            index += len(self.dates)
+        if not 0 <= index < len(self.dates):
+            raise IndexError(index)
+        return DayView(self, index)
+
+    def to_json(self) -> list[dict]:
+        """Список дней в прежнем формате API: [{"date", "temp_max", ...}]."""
+        temp_max = self._plain(self.temp_max)
+        temp_min = self._plain(self.temp_min)
+        codes = self._plain(self.weather_code, integer=True)
+        return [
+            {
+                "date": date,
+                "temp_max": high,
+                "temp_min": low,
+                "weather_code": code,
+                "description": weather_description(code),
+            }
+            for date, high, low, code in zip(self.dates, temp_max, temp_min, codes)
+        ]
+
+    @staticmethod
+    def _column(values: list, size: int, use_numpy: bool):
+        """Выравнивает столбец по числу дней: лишнее отбрасывается, недостающее - пропуск."""
+        values = values[:size]
+        if use_numpy:
+            column = np.full(size, np.nan)
+            column[:len(values)] = [np.nan if value is None else value for value in values]
+            return column
+        if len(values) < size:
+            values = values + [None] * (size - len(values))
+        return values
+
+    @staticmethod
+    def _plain(column, integer: bool = False) -> list:
+        if np is None or not isinstance(column, np.ndarray):
+            return column
+        return [
+            None if np.isnan(value) else (int(value) if integer else float(value))
+            for value in column
+        ]
+
+
+class HourlyForecast:
+    """
+    Почасовой прогноз: время и столбцы переменных Open-Meteo без копирования.
+
+    Строки (час со значениями) создаются по одной при итерации по окну,
+    поэтому длинный ряд не превращается целиком в список словарей.
+    """
+
+    __slots__ = ("times", "columns")
+
+    def __init__(self, times: list[str], columns: dict[str, list]):
+        self.times = times
+        self.columns = columns
+
+    @classmethod
+    def from_open_meteo(cls, hourly: dict) -> "HourlyForecast":
+        """Строит прогноз из блока "hourly" ответа Open-Meteo."""
+        times = hourly.get("time") or []
+        columns = {name: values for name, values in hourly.items() if name != "time"}
+        return cls(times, columns)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def window(self, start: str | None, hours: int) -> tuple[int, int]:
+        """Границы окна [begin, end) из hours часов, начиная с первого часа не раньше start."""
+        begin = bisect.bisect_left(self.times, start) if start else 0
+        return begin, min(begin + hours, len(self.times))
+
+    def next_start(self, end: int) -> str | None:
+        """Начало следующего окна или None, если ряд закончился."""
+        return self.times[end] if end < len(self.times) else None
+
+    def iter_rows(self, begin: int, end: int, variables: list[str]):
+        """Генерирует строки {"time", переменная: значение} для часов окна."""
+        columns = [(name, self.columns.get(name) or []) for name in variables]
+        for index in range(begin, end):
+            row = {"time": self.times[index]}
+            for name, values in columns:
+                row[name] = values[index] if index < len(values) else None
+            yield row
+
+
+class ForecastJSONEncoder(DjangoJSONEncoder):
+    """JSON-кодировщик, понимающий столбцовый прогноз."""
+
+    def default(self, o):
+        if isinstance(o, DailyForecast):
+            return o.to_json()
+        if isinstance(o, DayView):
+            return o.to_dict()
+        return super().default(o)
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import City, ForecastSnapshot
+
+
+class ForecastSnapshotService:
+    """
+    Снимки прогнозов для истории поиска.
+
+    Снимок соответствует одному полученному из Open-Meteo прогнозу: поиски города,
+    обслуженные одной записью кеша (одно время получения updated_at), ссылаются на
+    один снимок вместо копии прогноза в каждой строке WeatherSearch, а обновленный
+    прогноз получает новый снимок. Если время получения неизвестно, поиски делят
+    снимок в пределах интервала WEATHER_FORECAST_SNAPSHOT_BUCKET по времени поиска.
+    """
+
+    def __init__(self, bucket_seconds: int | None = None):
+        self.bucket_seconds = settings.WEATHER_FORECAST_SNAPSHOT_BUCKET if bucket_seconds is None else bucket_seconds
+
+    def bucket_start(self, moment: datetime) -> datetime:
+        """Возвращает начало интервала, в который попадает moment."""
+        timestamp = int(moment.timestamp())
+        return datetime.fromtimestamp(timestamp - timestamp % self.bucket_seconds, tz=dt_timezone.utc)
+
+    def snapshot_time(self, weather_data: dict, moment: datetime | None = None) -> datetime:
+        """Ключ снимка: время получения прогноза, иначе начало интервала времени поиска moment."""
+        fetched_at = weather_data.get("updated_at") if isinstance(weather_data, dict) else None
+        if isinstance(fetched_at, str):
+            fetched_at = parse_datetime(fetched_at)
+        if isinstance(fetched_at, datetime) and timezone.is_aware(fetched_at):
+            # Буфер истории в файле хранит время в JSON с точностью до миллисекунд
+            return fetched_at.replace(microsecond=fetched_at.microsecond // 1000 * 1000)
+        return self.bucket_start(moment or timezone.now())
+
+    def get_or_create(self, city: City, weather_data: dict, moment: datetime | None = None) -> ForecastSnapshot:
+        """Возвращает снимок прогноза weather_data для города, создавая его при первом поиске."""
+        snapshot, created = ForecastSnapshot.objects.get_or_create(
+            city=city,
+            bucket=self.snapshot_time(weather_data, moment),
+            defaults={"weather_data": weather_data}
+        )
+        return snapshot
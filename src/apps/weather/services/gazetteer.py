@@ -0,0 +1,231 @@
+import io
+import zipfile
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import City, CityAlternateName, CitySearchCounter, CitySearchRollup, ForecastSnapshot, WeatherSearch
+from .data_versions import DataVersionService
+from .geocoding_cache import GeocodingCache
+
+# Столбцы дампа GeoNames (cities500.txt, cities15000.txt, allCountries.txt)
+GEONAME_ID = 0
+NAME = 1
+ALTERNATE_NAMES = 3
+LATITUDE = 4
+LONGITUDE = 5
+FEATURE_CLASS = 6
+COUNTRY_CODE = 8
+POPULATION = 14
+
+CITY_FIELDS = ("name", "country", "latitude", "longitude", "geoname_id", "population")
+
+
+class GazetteerImporter:
+    """
+    Импорт справочника городов GeoNames в City и CityAlternateName.
+
+    Файл читается построчно и обрабатывается пачками по batch_size строк:
+    на пачку - одна выборка существующих городов, bulk_create новых, bulk_update
+    измененных и bulk_create альтернативных названий, так что память не зависит
+    от размера дампа. Города сопоставляются по geoname_id, затем по названию,
+    поэтому повторный импорт того же файла ничего не дублирует. Название в City
+    уникально: из нескольких тезок остается самый населенный. Город, на который
+    уже ссылаются история поиска, счетчики или снимки прогнозов, более населенным
+    тезкой не заменяется - иначе они описывали бы другое место; такие строки
+    считаются в stats["conflicts"]. Индексы городов в памяти работающих процессов
+    подхватывают импорт без перезапуска.
+    """
+
+    def __init__(self, batch_size: int = 1000, min_population: int = 0, countries: dict[str, str] | None = None,
+                 feature_classes: tuple[str, ...] = ("P",)):
+        self.batch_size = batch_size
+        self.min_population = min_population
+        self.countries = countries or {}
+        self.feature_classes = feature_classes
+
+    def import_file(self, path: str | Path) -> dict:
+        """Импортирует дамп (.txt или .zip с .txt внутри), возвращает статистику."""
+        path = Path(path)
+        if path.suffix == ".zip":
+            with zipfile.ZipFile(path) as archive:
+                member = next(name for name in archive.namelist() if name.endswith(".txt"))
+                with archive.open(member) as raw:
+                    return self.import_lines(io.TextIOWrapper(raw, encoding="utf-8"))
+
+        with path.open(encoding="utf-8") as lines:
+            return self.import_lines(lines)
+
+    def import_lines(self, lines) -> dict:
+        """Импортирует строки дампа GeoNames, возвращает статистику."""
+        stats = {"read": 0, "created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "alternate_names": 0}
+
+        batch = []
+        for line in lines:
+            stats["read"] += 1
+            row = self.parse_line(line)
+            if row is None:
+                stats["skipped"] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._add_stats(stats, self._import_batch(batch))
+                batch = []
+        if batch:
+            self._add_stats(stats, self._import_batch(batch))
+        return stats
+
+    def parse_line(self, line: str) -> dict | None:
+        """Разбирает строку дампа; None - строка не подходит (не город, мало жителей, ошибка)."""
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) <= POPULATION or columns[FEATURE_CLASS] not in self.feature_classes:
+            return None
+
+        try:
+            row = {
+                "geoname_id": int(columns[GEONAME_ID]),
+                "name": columns[NAME].strip(),
+                "latitude": float(columns[LATITUDE]),
+                "longitude": float(columns[LONGITUDE]),
+                "population": int(columns[POPULATION] or 0),
+            }
+        except ValueError:
+            return None
+
+        if not row["name"] or len(row["name"]) > City._meta.get_field("name").max_length:
+            return None
+        if row["population"] < self.min_population:
+            return None
+
+        code = columns[COUNTRY_CODE]
+        row["country"] = self.countries.get(code, code)
+        row["alternate_names"] = [name for name in columns[ALTERNATE_NAMES].split(",") if name]
+        return row
+
+    @staticmethod
+    def load_countries(path: str | Path) -> dict[str, str]:
+        """Читает countryInfo.txt GeoNames: {ISO-код: название страны}."""
+        countries = {}
+        with Path(path).open(encoding="utf-8") as lines:
+            for line in lines:
+                if line.startswith("#"):
+                    continue
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) > 4:
+                    countries[columns[0]] = columns[4]
+        return countries
+
+    def _import_batch(self, rows: list[dict]) -> dict:
+        stats = {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "alternate_names": 0}
+
+        # Внутри пачки одно название - один город: самый населенный
+        unique = {}
+        for row in rows:
+            current = unique.get(row["name"])
+            if current is None or row["population"] > current["population"]:
+                unique[row["name"]] = row
+        stats["skipped"] += len(rows) - len(unique)
+        rows = list(unique.values())
+
+        existing = list(City.objects.filter(
+            Q(geoname_id__in=[row["geoname_id"] for row in rows]) | Q(name__in=list(unique))
+        ))
+        by_geoname = {city.geoname_id: city for city in existing if city.geoname_id is not None}
+        by_name = {city.name: city for city in existing}
+        referenced = self._referenced_city_ids([city.pk for city in existing if city.geoname_id is not None])
+
+        created, updated, replaced, imported, touched = [], [], [], [], set()
+        for row in rows:
+            city = by_geoname.get(row["geoname_id"])
+            if city is None:
+                city = by_name.get(row["name"])
+                if city is not None and city.geoname_id is not None:
+                    # Тезка из справочника: остается более населенный
+                    if city.population >= row["population"]:
+                        stats["skipped"] += 1
+                        continue
+                    if city.pk in referenced:
+                        stats["conflicts"] += 1
+                        continue
+                    replaced.append(city.pk)
+
+            if city is None:
+                created.append(City(**{field: row[field] for field in CITY_FIELDS}))
+                imported.append(row)
+                continue
+            if city.pk in touched:
+                stats["skipped"] += 1
+                continue
+            touched.add(city.pk)
+            imported.append(row)
+
+            values = {field: row[field] for field in CITY_FIELDS}
+            if row["name"] != city.name and row["name"] in by_name:
+                # Новое название уже занято другим городом - оставляем прежнее
+                values["name"] = city.name
+            if any(getattr(city, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(city, field, value)
+                updated.append(city)
+
+        # bulk_update не заполняет auto_now, а по updated_at индексы городов догружают изменения
+        now = timezone.now()
+        for city in updated:
+            city.updated_at = now
+
+        with transaction.atomic():
+            City.objects.bulk_create(created, batch_size=self.batch_size)
+            City.objects.bulk_update(updated, (*CITY_FIELDS, "updated_at"), batch_size=self.batch_size)
+            CityAlternateName.objects.filter(city_id__in=replaced).delete()
+
+            city_ids = dict(City.objects.filter(
+                geoname_id__in=[row["geoname_id"] for row in imported]
+            ).values_list("geoname_id", "id"))
+            alternate_names = [
+                CityAlternateName(city_id=city_ids[row["geoname_id"]], name=name, normalized=normalized)
+                for row in imported if row["geoname_id"] in city_ids
+                for name, normalized in self._alternate_names(row)
+            ]
+            CityAlternateName.objects.bulk_create(
+                alternate_names, batch_size=self.batch_size, ignore_conflicts=True
+            )
+            # bulk-операции не отправляют post_save: индексы во всех процессах узнают о пачке по версии в БД
+            if created or updated:
+                DataVersionService().bump(DataVersionService.CITIES)
+
+        stats["created"] += len(created)
+        stats["updated"] += len(updated)
+        stats["alternate_names"] += len(alternate_names)
+        return stats
+
+    @staticmethod
+    def _referenced_city_ids(city_ids: list[int]) -> set[int]:
+        """Города, на которые ссылаются история поиска, счетчики или снимки прогнозов."""
+        referenced = set()
+        if not city_ids:
+            return referenced
+        for model in (WeatherSearch, CitySearchCounter, CitySearchRollup, ForecastSnapshot):
+            referenced.update(
+                model.objects.filter(city_id__in=city_ids).values_list("city_id", flat=True).distinct()
+            )
+        return referenced
+
+    @staticmethod
+    def _alternate_names(row: dict) -> list[tuple[str, str]]:
+        """Альтернативные названия, отличные от основного, без повторов после нормализации."""
+        max_length = CityAlternateName._meta.get_field("name").max_length
+        seen = {GeocodingCache.normalize(row["name"])}
+        names = []
+        for name in row["alternate_names"]:
+            normalized = GeocodingCache.normalize(name)
+            if normalized and normalized not in seen and len(name) <= max_length:
+                seen.add(normalized)
+                names.append((name, normalized))
+        return names
+
+    @staticmethod
+    def _add_stats(stats: dict, batch_stats: dict) -> None:
+        for name, value in batch_stats.items():
+            stats[name] += value
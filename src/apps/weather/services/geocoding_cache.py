@@ -0,0 +1,49 @@
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class GeocodingCache:
+    """Кеш результатов геокодинга, включая отрицательные ("город не найден")."""
+
+    KEY_PREFIX = "weather:geocode"
+
+    def __init__(self, ttl: int | None = None, negative_ttl: int | None = None):
+        self.ttl = settings.WEATHER_GEOCODING_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = settings.WEATHER_GEOCODING_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+
+    @staticmethod
+    def normalize(city_name: str) -> str:
+        """Приводит запрос к каноническому виду: регистр, пробелы, юникод."""
+        return " ".join(unicodedata.normalize("NFKC", city_name).casefold().split())
+
+    def make_key(self, city_name: str) -> str:
+        """Строит ключ кеша по нормализованному названию города."""
+        digest = hashlib.md5(self.normalize(city_name).encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def get(self, city_name: str) -> dict | None:
+        """Возвращает {"latitude", "longitude"}, {"not_found": True} или None при промахе."""
+        return cache.get(self.make_key(city_name))
+
+    def set_found(self, city_name: str, latitude: float, longitude: float) -> None:
+        """Запоминает координаты города."""
+        cache.set(self.make_key(city_name), {"latitude": latitude, "longitude": longitude}, self.ttl)
+
+    def set_not_found(self, city_name: str) -> None:
+        """Запоминает, что город не найден, на отдельный (короткий) TTL."""
+        cache.set(self.make_key(city_name), {"not_found": True}, self.negative_ttl)
+
+    async def aget(self, city_name: str) -> dict | None:
+        """Асинхронная версия get()."""
+        return await cache.aget(self.make_key(city_name))
+
+    async def aset_found(self, city_name: str, latitude: float, longitude: float) -> None:
+        """Асинхронная версия set_found()."""
+        await cache.aset(self.make_key(city_name), {"latitude": latitude, "longitude": longitude}, self.ttl)
+
+    async def aset_not_found(self, city_name: str) -> None:
+        """Асинхронная версия set_not_found()."""
+        await cache.aset(self.make_key(city_name), {"not_found": True}, self.negative_ttl)
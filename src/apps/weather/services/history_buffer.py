@@ -0,0 +1,328 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils import timezone
+
+from .forecast_data import ForecastJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryQueue:
+    """Очередь записей истории в памяти процесса, теряется при аварийном завершении."""
+
+    def __init__(self):
+        self._items = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def put(self, record: dict) -> None:
+        with self._lock:
+            self._next_id += 1
+            self._items[self._next_id] = record
+
+    def take(self, limit: int) -> list[tuple[int, dict]]:
+        """Возвращает до limit самых старых записей, не удаляя их до ack()."""
+        with self._lock:
+            return [(item_id, self._items[item_id]) for item_id in sorted(self._items)[:limit]]
+
+    def ack(self, item_ids: list[int]) -> None:
+        with self._lock:
+            for item_id in item_ids:
+                self._items.pop(item_id, None)
+
+    def release(self, item_ids: list[int]) -> None:
+        """Возвращает записи в очередь после неудачной записи (для памяти ничего не нужно)."""
+
+    def discard(self, session_key: str) -> None:
+        with self._lock:
+            self._items = {
+                item_id: record for item_id, record in self._items.items()
+                if record["session_key"] != session_key
+            }
+
+
+class SqliteQueue:
+    """
+    Очередь записей истории в локальном файле SQLite, переживает перезапуск процесса.
+
+    Несколько процессов могут делить один файл: take() помечает записи временем
+    захвата, и другой процесс заберет их только после истечения lease.
+    """
+
+    def __init__(self, path: str, lease: float = 60.0):
+        self.path = str(path)
+        self.lease = lease
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS history_queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_key TEXT NOT NULL, "
+                "record TEXT NOT NULL, "
+                "claimed_at REAL)"
+            )
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM history_queue").fetchone()[0]
+
+    def put(self, record: dict) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO history_queue (session_key, record) VALUES (?, ?)",
+                (record["session_key"], json.dumps(record, cls=ForecastJSONEncoder))
+            )
+
+    def take(self, limit: int) -> list[tuple[int, dict]]:
+        """Захватывает до limit свободных записей на время lease."""
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, record FROM history_queue "
+                "WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+                (now - self.lease, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE history_queue SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows]
+            )
+        return [(item_id, self._decode(record)) for item_id, record in rows]
+
+    def ack(self, item_ids: list[int]) -> None:
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM history_queue WHERE id = ?", [(item_id,) for item_id in item_ids])
+
+    def release(self, item_ids: list[int]) -> None:
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE history_queue SET claimed_at = NULL WHERE id = ?", [(item_id,) for item_id in item_ids]
+            )
+
+    def discard(self, session_key: str) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM history_queue WHERE session_key = ?", (session_key,))
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _decode(raw: str) -> dict:
+        record = json.loads(raw)
+        record["search_date"] = datetime.fromisoformat(record["search_date"])
+        return record
+
+
+class HistoryBuffer:
+    """
+    Отложенная запись истории поиска (write-behind).
+
+    Записи копятся в очереди и пишутся в БД пачками через writer(records)
+    при накоплении flush_size записей, раз в flush_interval секунд и при
+    завершении процесса. Если БД недоступна, записи остаются в очереди до
+    следующей попытки; записи, которые не удается сохранить, отбрасываются.
+    """
+
+    _stats = {"buffered": 0, "flushed": 0, "failed": 0, "dropped": 0, "flushes": 0, "last_flush_ms": 0.0}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, writer, queue, flush_size: int = 100, flush_interval: float = 2.0,
+                 max_pending: int = 10000, background: bool = True):
+        self.writer = writer
+        self.queue = queue
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.background = background
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def add(self, session_key: str, city: str, weather_data: dict) -> None:
+        """Ставит запись истории в очередь."""
+        pending = len(self.queue)
+        if pending >= self.max_pending:
+            self._count("dropped")
+            logger.warning(f"History buffer is full ({pending} records), search dropped")
+            return
+
+        self.queue.put({
+            "session_key": session_key,
+            "city": city,
+            "weather_data": weather_data,
+            "search_date": timezone.now(),
+        })
+        self._count("buffered")
+
+        if not self.background:
+            if pending + 1 >= self.flush_size:
+                self.flush()
+            return
+
+        self._ensure_thread()
+        if pending + 1 >= self.flush_size:
+            self._wakeup.set()
+
+    def discard(self, session_key: str) -> None:
+        """Удаляет из очереди еще не записанные поиски сессии."""
+        self.queue.discard(session_key)
+
+    def flush(self) -> int:
+        """Записывает все накопленные записи, возвращает число сохраненных."""
+        saved = 0
+        with self._flush_lock:
+            started = time.perf_counter()
+            while True:
+                items = self.queue.take(self.flush_size)
+                if not items:
+                    break
+                written = self._write(items)
+                if written is None:
+                    break
+                saved += written
+
+            if saved:
+                self._count("flushes")
+                self._count("flushed", saved)
+                with self._stats_lock:
+                    self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return saved
+
+    def stop(self) -> None:
+        """Останавливает фоновый поток и дописывает очередь."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"History buffer final flush failed: {e}")
+
+    def _write(self, items: list[tuple[int, dict]]) -> int | None:
+        """Пишет пачку; None - БД недоступна, оставшиеся записи возвращены в очередь."""
+        item_ids = [item_id for item_id, _ in items]
+
+        try:
+            self.writer([record for _, record in items])
+        except (OperationalError, InterfaceError) as e:
+            self.queue.release(item_ids)
+            logger.error(f"History buffer flush failed, will retry: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"History batch failed, writing records one by one: {e}")
+        else:
+            self.queue.ack(item_ids)
+            return len(items)
+
+        # В пачке есть запись, которую нельзя сохранить: пишем по одной и отбрасываем ее
+        saved = 0
+        for position, (item_id, record) in enumerate(items):
+            try:
+                self.writer([record])
+                saved += 1
+            except (OperationalError, InterfaceError) as e:
+                self.queue.release(item_ids[position:])
+                logger.error(f"History buffer flush failed, will retry: {e}")
+                return None
+            except Exception as e:
+                self._count("failed")
+                logger.error(f"History record for '{record['city']}' dropped: {e}")
+            self.queue.ack([item_id])
+        return saved
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="history-buffer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"History buffer flush failed: {e}")
+        close_old_connections()
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Возвращает счетчики буфера текущего процесса."""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        buffer = _buffer
+        stats["pending"] = len(buffer.queue) if buffer is not None else 0
+        return stats
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        """Обнуляет счетчики буфера."""
+        with cls._stats_lock:
+            for name in cls._stats:
+                cls._stats[name] = 0
+
+    @classmethod
+    def _count(cls, name: str, value: int = 1) -> None:
+        with cls._stats_lock:
+            cls._stats[name] += value
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_history_buffer() -> HistoryBuffer:
+    """Возвращает буфер истории процесса, создавая его по настройкам при первом обращении."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                from .history_service import HistoryService
+
+                if settings.WEATHER_HISTORY_WRITE_MODE == "durable":
+                    queue = SqliteQueue(settings.WEATHER_HISTORY_QUEUE_PATH)
+                else:
+                    queue = MemoryQueue()
+
+                _buffer = HistoryBuffer(
+                    HistoryService().save_history_batch,
+                    queue,
+                    flush_size=settings.WEATHER_HISTORY_FLUSH_SIZE,
+                    flush_interval=settings.WEATHER_HISTORY_FLUSH_INTERVAL,
+                    max_pending=settings.WEATHER_HISTORY_BUFFER_MAX_PENDING,
+                )
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def reset_history_buffer() -> None:
+    """Дописывает и сбрасывает буфер истории процесса."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.stop)
+            _buffer.stop()
+        _buffer = None
@@ -1,56 +1,233 @@
-from django.db.models import Count
+import base64
+import binascii
+import hashlib
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
 
 from ..models import (
     WeatherSearch,
     City
 )
+from .city_index import city_index
+from .data_versions import DataVersionService
+from .forecast_snapshots import ForecastSnapshotService
+from .geocoding_cache import GeocodingCache
+from .history_buffer import get_history_buffer
+from .retention import HistoryRetentionService
+from .search_counters import SearchCounterService
+from .search_rollups import SearchRollupService
+from .weather_service import WeatherService
 
 
 class HistoryService:
     """Класс для работы с историей погоды."""
 
+    def __init__(self):
+        self.counters = SearchCounterService()
+        self.rollups = SearchRollupService()
+        self.snapshots = ForecastSnapshotService()
+        self.retention = HistoryRetentionService()
+
     def save_history(self, session_key: str, city: str, weather_data: dict) -> None:
-        """Сохраняет историю поиска погоды."""
+        """
+        Сохраняет историю поиска погоды.
 
-        city_obj, created = City.objects.get_or_create(name=city)
-        WeatherSearch.objects.create(
-            session_key=session_key,
-            city=city_obj,
-            weather_data=weather_data
-        )
+        В режимах WEATHER_HISTORY_WRITE_MODE "memory" и "durable" запись только
+        ставится в буфер и попадает в БД пачкой через save_history_batch().
+        """
+        if settings.WEATHER_HISTORY_WRITE_MODE != "sync":
+            get_history_buffer().add(session_key, city, weather_data)
+            return
+
+        city_obj = self.resolve_cities({city})[city]
+        with transaction.atomic():
+            search = WeatherSearch.objects.create(
+                session_key=session_key,
+                city=city_obj,
+                snapshot=self.snapshots.get_or_create(city_obj, weather_data)
+            )
+            self.rollups.add({(city_obj.id, self.rollups.hour_start(search.search_date)): 1})
+            self.counters.increment(city_obj.id)
+
+    def save_history_batch(self, records: list[dict]) -> None:
+        """Сохраняет пачку записей истории из буфера одним bulk_create."""
+        cities = self.resolve_cities({record['city'] for record in records})
+
+        with transaction.atomic():
+            snapshots = {}
+            searches = []
+            for record in records:
+                city_obj = cities[record['city']]
+                snapshot_time = self.snapshots.snapshot_time(record['weather_data'], record['search_date'])
+                snapshot_key = (city_obj.id, snapshot_time)
+                if snapshot_key not in snapshots:
+                    snapshots[snapshot_key] = self.snapshots.get_or_create(
+                        city_obj, record['weather_data'], record['search_date']
+                    )
+                searches.append(WeatherSearch(
+                    session_key=record['session_key'],
+                    city=city_obj,
+                    snapshot=snapshots[snapshot_key],
+                    search_date=record['search_date']
+                ))
+
+            WeatherSearch.objects.bulk_create(searches)
+            self.rollups.add(Counter(
+                (search.city_id, self.rollups.hour_start(search.search_date)) for search in searches
+            ))
+            counts = Counter(search.city_id for search in searches)
+            for city_id, count in counts.items():
+                self.counters.increment(city_id, count)
+
+        # bulk_create не отправляет post_save, популярность в индексе обновляем сами
+        for city_id, count in counts.items():
+            city_index.bump(city_id, count)
+
+    def resolve_cities(self, names: set[str]) -> dict[str, City]:
+        """
+        Города для названий из поиска: {название: City}.
+
+        Поиск мог найти город без учета регистра или по альтернативному названию,
+        поэтому сначала ищем так же, как WeatherService.find_city(). Город, которого
+        нет в БД, создается по координатам из кеша геокодинга; без них - ValueError.
+        """
+        cities = {city.name: city for city in City.objects.filter(name__in=names)}
+        for name in names - cities.keys():
+            city = WeatherService.find_city(name)
+            if city is None:
+                cached = GeocodingCache().get(name)
+                if cached is None or cached.get("not_found"):
+                    raise ValueError(f"Город '{name}' не найден.")
+                city, created = City.objects.get_or_create(
+                    name=name, defaults={"latitude": cached["latitude"], "longitude": cached["longitude"]}
+                )
+            cities[name] = city
+        return cities
 
     def get_history(self, session_key: str) -> list[dict]:
         """Получает историю поиска погоды по ключу сессии."""
+        return [self._history_item(row) for row in self.history_queryset(session_key)]
+
+    def get_history_page(self, session_key: str, cursor: str | None = None, limit: int | None = None) -> dict:
+        """
+        Получает страницу истории поиска, начиная с курсора.
+
+        Пагинация по ключу (search_date, id): каждая страница - один запрос
+        по индексу без OFFSET. Возвращает {"history": [...], "next_cursor": str | None}.
+        """
+        limit = self._page_size(limit)
+        rows = list(self.history_queryset(session_key, cursor)[:limit + 1])
+        next_cursor = self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+        return {
+            'history': [self._history_item(row) for row in rows[:limit]],
+            'next_cursor': next_cursor
+        }
+
+    @staticmethod
+    def encode_cursor(row: dict) -> str:
+        """Кодирует позицию (search_date, id) в непрозрачный курсор."""
+        raw = f"{row['search_date'].isoformat()}|{row['id']}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
 
-        searches = WeatherSearch.objects.filter(session_key=session_key).order_by('-search_date')
-        history = []
-        for search in searches:
-            history.append({
-                'city': search.city.name,
-                'country': search.city.country,
-                'search_date': search.search_date,
-                'weather_data': search.weather_data
-            })
-        return history
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        """Декодирует курсор, при некорректном значении выбрасывает ValueError."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            search_date, search_id = raw.split('|')
+            return datetime.fromisoformat(search_date), int(search_id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise ValueError("Некорректный курсор истории")
+
+    @staticmethod
+    def _page_size(limit: int | None) -> int:
+        if limit is None:
+            return settings.WEATHER_HISTORY_PAGE_SIZE
+        return max(1, min(limit, settings.WEATHER_HISTORY_MAX_PAGE_SIZE))
+
+    def history_queryset(self, session_key: str, cursor: str | None = None):
+        """
+        Поиски сессии вместе с полями города одним запросом, начиная с курсора.
+
+        Фильтр и сортировка совпадают с индексом (session_key, -search_date, -id),
+        поэтому запрос читает индекс по порядку без отдельной сортировки.
+        """
+        searches = WeatherSearch.objects.filter(session_key=session_key)
+
+        if cursor:
+            search_date, search_id = self.decode_cursor(cursor)
+            # search_date__lte ограничивает диапазон индекса, OR уточняет позицию внутри одной даты
+            searches = searches.filter(
+                Q(search_date__lt=search_date) | Q(search_date=search_date, id__lt=search_id),
+                search_date__lte=search_date
+            )
+
+        return searches.order_by('-search_date', '-id').values(
+            'id', 'search_date', 'snapshot__weather_data', 'weather_data', 'city__name', 'city__country'
+        )
+
+    @staticmethod
+    def _history_item(row: dict) -> dict:
+        return {
+            'id': row['id'],
+            'city': row['city__name'],
+            'country': row['city__country'],
+            'search_date': row['search_date'],
+            # Старые строки без снимка хранят прогноз в самой записи
+            'weather_data': (
+                row['snapshot__weather_data'] if row['snapshot__weather_data'] is not None
+                else row['weather_data']
+            )
+        }
 
     def clear_history(self, session_key: str) -> None:
-        """Очищает историю поиска погоды по ключу сессии."""
-        WeatherSearch.objects.filter(session_key=session_key).delete()
+        """Очищает историю поиска погоды по ключу сессии пачками."""
+        if settings.WEATHER_HISTORY_WRITE_MODE != "sync":
+            get_history_buffer().discard(session_key)
+
+        self.retention.delete_session(session_key)
 
     def delete_search(self, search_id: int) -> None:
         """Удаляет конкретный поиск по его ID."""
-        try:
-            search = WeatherSearch.objects.get(id=search_id)
-            search.delete()
-        except WeatherSearch.DoesNotExist:
+        if not self.retention.delete_ids([search_id]):
             raise ValueError(f"Поиск с ID {search_id} не найден")
 
-    def get_popular_cities(self, limit: int = 10) -> list[dict]:
-        """Получает список популярных городов на основе истории поиска."""
+    def get_popular_cities(self, limit: int = 10, window: str | None = None) -> list[dict]:
+        """Получает список популярных городов: за все время или за окно ("1h", "24h", "7d", "30d")."""
+        if window is not None:
+            return self.rollups.get_popular(window, limit)
+        return self.counters.get_popular(limit)
+
+    def popular_cities_etag(self, limit: int = 10, window: str | None = None) -> str:
+        """
+        ETag статистики: версия счетчиков и версия справочника городов в БД.
 
-        popular_cities = (
-            WeatherSearch.objects.values('city__name', 'city__country')
-            .annotate(search_count=Count('id'))
-            .order_by('-search_count')[:limit]
+        Для окна учитывается и его первый час: старые часы выпадают из окна без новых поисков.
+        """
+        window_start = self.rollups.window_start(window).isoformat() if window is not None else None
+        cities_version = DataVersionService().get(DataVersionService.CITIES)[DataVersionService.CITIES]
+        return self._etag("popular", self.counters.version(), cities_version, limit, window, window_start)
+
+    def history_etag(self, session_key: str, cursor: str | None = None, limit: int | None = None) -> str:
+        """
+        ETag страницы истории сессии.
+
+        Строится по последнему поиску (search_date, id) и числу поисков сессии:
+        один агрегат по индексу сессии вместо выборки страницы с прогнозами.
+        Число поисков учитывает удаления, не затрагивающие последний поиск.
+        """
+        state = WeatherSearch.objects.filter(session_key=session_key).aggregate(
+            count=Count('id'), last_id=Max('id'), last_date=Max('search_date')
         )
-        return [{'city': item['city__name'], 'country': item['city__country'], 'search_count': item['search_count']} for item in popular_cities]
+        last_date = state['last_date'].isoformat() if state['last_date'] else None
+        return self._etag("history", state['count'], state['last_id'], last_date, cursor, self._page_size(limit))
+
+    @staticmethod
+    def _etag(*parts) -> str:
+        digest = hashlib.md5(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+        return f'"{digest}"'
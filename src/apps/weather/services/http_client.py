@@ -0,0 +1,61 @@
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    """Создает сессию с пулом keep-alive соединений и повторами запросов."""
+    # Повторяются только ошибки соединения и ответы из status_forcelist: таймаут чтения
+    # означает, что upstream уже обрабатывает запрос, повтор лишь умножил бы ожидание
+    retry = Retry(
+        total=settings.HTTP_CLIENT_RETRIES,
+        read=0,
+        backoff_factor=settings.HTTP_CLIENT_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_CLIENT_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_CLIENT_POOL_SIZE,
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Возвращает общую для процесса HTTP-сессию."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session() -> None:
+    """Закрывает общую сессию, следующая будет создана заново."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get(url: str, params: dict | None = None, read_timeout: float | None = None) -> requests.Response:
+    """Выполняет GET-запрос через общую сессию с таймаутами из настроек."""
+    timeout = (
+        settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+        settings.HTTP_CLIENT_READ_TIMEOUT if read_timeout is None else read_timeout,
+    )
+    return get_session().get(url, params=params, timeout=timeout)
@@ -0,0 +1,190 @@
+import heapq
+import logging
+import math
+import threading
+from operator import itemgetter
+
+from django.conf import settings
+
+from .city_index_base import CityIndexBase
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Размер поддерева, которое проще перебрать целиком, чем спускаться дальше
+LEAF_SIZE = 8
+
+
+def unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    """Точка на единичной сфере: евклидово расстояние между такими точками монотонно расстоянию по поверхности."""
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    """Расстояние по поверхности Земли (км) по квадрату хорды между единичными векторами."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(squared_chord) / 2, 1.0))
+
+
+class NearestCityIndex(CityIndexBase):
+    """
+    Индекс ближайших городов в памяти процесса (обратный геокодинг).
+
+    Города хранятся как точки (x, y, z) на единичной сфере в неявном k-d дереве:
+    список точек упорядочен так, что середина каждого отрезка - узел, левая и
+    правая половины - поддеревья. Поиск k ближайших - спуск с отсечением веток,
+    без полного перебора; на сфере нет проблем с полюсами и линией перемены дат.
+
+    Дерево строится при первом обращении. Изменения городов (сигналы модели)
+    не перестраивают его сразу: новые и измененные города попадают в небольшой
+    список, который перебирается целиком, а удаленные пропускаются при поиске.
+    Когда изменений набирается больше WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD,
+    дерево перестраивается из памяти в фоновом потоке (WEATHER_CITY_INDEX_BACKGROUND_RELOAD),
+    а до подмены поиск обслуживают прежнее дерево и список изменений. Загрузка и синхронизация с другими
+    процессами - в CityIndexBase, как и у префиксного индекса.
+    """
+
+    def __init__(self):
+        self._rebuild_thread = None
+        super().__init__()
+
+    def nearest(self, latitude: float, longitude: float, limit: int = 5) -> list[dict]:
+        """Возвращает до limit ближайших к точке городов с расстоянием distance_km."""
+        query = unit_vector(latitude, longitude)
+
+        with self._lock:
+            self._ensure_fresh()
+
+            # Max-куча из (-квадрат хорды, id): в вершине худший из найденных
+            found = []
+            self._search(query, 0, len(self._points), 0, limit, found)
+            for point in self._pending.values():
+                self._consider(point, query, limit, found)
+
+            ranked = sorted((-distance, city_id) for distance, city_id in found)
+            return [
+                dict(self._cities[city_id], id=city_id, distance_km=round(chord_to_km(distance), 3))
+                for distance, city_id in ranked
+            ]
+
+    def _build(self, rows: list[dict]) -> tuple:
+        cities = {}
+        points = []
+        for row in rows:
+            cities[row["id"]] = self._city_data(row["name"], row["country"], row["latitude"], row["longitude"])
+            points.append(self._point(row["id"], row["latitude"], row["longitude"]))
+        return self._build_tree(points), cities
+
+    def _swap(self, state: tuple) -> None:
+        self._points, self._cities = state
+        self._pending = {}
+        self._stale = set()
+        # Города, измененные во время фоновой перестройки дерева (None - перестройки нет)
+        self._changed_during_rebuild = None
+
+    def _apply(self, row: dict) -> None:
+        city_id = row["id"]
+        self._stale.add(city_id)
+        self._cities[city_id] = self._city_data(row["name"], row["country"], row["latitude"], row["longitude"])
+        self._pending[city_id] = self._point(city_id, row["latitude"], row["longitude"])
+        self._maybe_rebuild(city_id)
+
+    def _discard(self, city_id: int) -> None:
+        self._stale.add(city_id)
+        self._pending.pop(city_id, None)
+        self._cities.pop(city_id, None)
+        self._maybe_rebuild(city_id)
+
+    def _maybe_rebuild(self, city_id: int) -> None:
+        """Вызывается под self._lock после изменения города."""
+        if self._changed_during_rebuild is not None:
+            self._changed_during_rebuild.add(city_id)
+            return
+        if len(self._pending) + len(self._stale) <= settings.WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD:
+            return
+        points = [point for point in self._points if point[3] not in self._stale]
+        points.extend(self._pending.values())
+        self._changed_during_rebuild = set()
+
+        if not settings.WEATHER_CITY_INDEX_BACKGROUND_RELOAD:
+            self._rebuild(self._points, points)
+            return
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(self._points, points), name=f"{type(self).__name__}-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+
+    def _rebuild(self, base: list[tuple], points: list[tuple]) -> None:
+        """Строит дерево без блокировки и подменяет им base, сохраняя изменения, сделанные во время сборки."""
+        try:
+            tree = self._build_tree(points)
+        except Exception as e:
+            logger.error(f"{type(self).__name__} rebuild failed, serving the previous tree: {e}")
+            tree = None
+
+        with self._lock:
+            # Пока дерево строилось, индекс мог быть перезагружен из БД (_swap) - тогда сборка устарела
+            if self._points is not base:
+                return
+            changed = self._changed_during_rebuild
+            self._changed_during_rebuild = None
+            if tree is None:
+                return
+            self._points = tree
+            self._pending = {city_id: point for city_id, point in self._pending.items() if city_id in changed}
+            self._stale = changed
+
+    @staticmethod
+    def _build_tree(points: list[tuple]) -> list[tuple]:
+        """Упорядочивает точки в неявное k-d дерево (оси x, y, z по очереди)."""
+        stack = [(0, len(points), 0)]
+        while stack:
+            begin, end, axis = stack.pop()
+            if end - begin <= LEAF_SIZE:
+                continue
+            points[begin:end] = sorted(points[begin:end], key=itemgetter(axis))
+            middle = (begin + end) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((begin, middle, next_axis))
+            stack.append((middle + 1, end, next_axis))
+        return points
+
+    def _search(self, query: tuple, begin: int, end: int, axis: int, limit: int, found: list) -> None:
+        if end - begin <= LEAF_SIZE:
+            for position in range(begin, end):
+                self._consider(self._points[position], query, limit, found)
+            return
+
+        middle = (begin + end) // 2
+        point = self._points[middle]
+        self._consider(point, query, limit, found)
+
+        next_axis = (axis + 1) % 3
+        offset = query[axis] - point[axis]
+        near, far = ((begin, middle), (middle + 1, end)) if offset < 0 else ((middle + 1, end), (begin, middle))
+        self._search(query, near[0], near[1], next_axis, limit, found)
+        # Дальнюю половину смотрим, только если плоскость разбиения ближе худшего найденного
+        if len(found) < limit or offset * offset < -found[0][0]:
+            self._search(query, far[0], far[1], next_axis, limit, found)
+
+    def _consider(self, point: tuple, query: tuple, limit: int, found: list) -> None:
+        x, y, z, city_id = point
+        if city_id in self._stale and self._pending.get(city_id) is not point:
+            return
+        distance = (x - query[0]) ** 2 + (y - query[1]) ** 2 + (z - query[2]) ** 2
+        if len(found) < limit:
+            heapq.heappush(found, (-distance, city_id))
+        elif distance < -found[0][0]:
+            heapq.heapreplace(found, (-distance, city_id))
+
+    @staticmethod
+    def _point(city_id: int, latitude, longitude) -> tuple:
+        return (*unit_vector(float(latitude), float(longitude)), city_id)
+
+    @staticmethod
+    def _city_data(name, country, latitude, longitude) -> dict:
+        return {"name": name, "country": country, "latitude": latitude, "longitude": longitude}
+
+
+nearest_city_index = NearestCityIndex()
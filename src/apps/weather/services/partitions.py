@@ -0,0 +1,216 @@
+import re
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import City, ForecastSnapshot, WeatherSearch
+from .search_counters import SearchCounterService
+from .search_rollups import SearchRollupService
+
+PARTITION_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_start(moment: date | datetime) -> date:
+    """Первое число месяца, в который попадает moment."""
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    """Сдвигает первое число месяца на count месяцев."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class SearchPartitionService:
+    """
+    Месячные партиции таблицы WeatherSearch по search_date.
+
+    Работает только на PostgreSQL: таблица секционируется по диапазону
+    search_date, партиция на каждый месяц (weather_weathersearch_pYYYYMM) и
+    партиция по умолчанию для строк вне созданных диапазонов. На других БД
+    таблица остается обычной, а методы ничего не делают.
+    """
+
+    def __init__(self):
+        self.table = WeatherSearch._meta.db_table
+        self.counters = SearchCounterService()
+        self.rollups = SearchRollupService()
+
+    def is_supported(self) -> bool:
+        return connection.vendor == "postgresql"
+
+    def is_partitioned(self) -> bool:
+        """Проверяет, что таблица WeatherSearch уже секционирована."""
+        if not self.is_supported():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = %s AND pg_table_is_visible(c.oid))",
+                [self.table]
+            )
+            return cursor.fetchone()[0]
+
+    def partitions(self) -> dict[date, str]:
+        """Возвращает подключенные месячные партиции: {первое число месяца: имя таблицы}."""
+        if not self.is_partitioned():
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = %s AND pg_table_is_visible(p.oid)",
+                [self.table]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        partitions = {}
+        for name in names:
+            match = PARTITION_SUFFIX.search(name)
+            if match:
+                partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+        return partitions
+
+    def ensure_partitions(self, ahead: int, start: date | None = None) -> list[str]:
+        """Создает партиции от месяца start (по умолчанию текущего) на ahead месяцев вперед."""
+        if not self.is_partitioned():
+            return []
+
+        existing = self.partitions()
+        first = month_start(start or timezone.now())
+        last = add_months(month_start(timezone.now()), ahead)
+
+        created = []
+        month = first
+        while month <= last:
+            if month not in existing:
+                with connection.cursor() as cursor:
+                    self._create_partition(cursor, month)
+                created.append(self._partition_name(month))
+            month = add_months(month, 1)
+        return created
+
+    def expire_partitions(self, before: datetime, drop: bool = True) -> dict[str, int]:
+        """
+        Отключает партиции, все строки которых старше before, и уменьшает счетчики городов.
+
+        При drop=False партиция остается отдельной таблицей (например, для архива).
+        Возвращает {имя партиции: число строк в ней}.
+        """
+        expired = {}
+        for month, name in sorted(self.partitions().items()):
+            if self._bound(add_months(month, 1)) > before:
+                continue
+
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT city_id, COUNT(*) FROM "{name}" GROUP BY city_id')
+                    counts = dict(cursor.fetchall())
+                    hourly = self._hourly_counts(cursor, name, month)
+                    cursor.execute(f'ALTER TABLE "{self.table}" DETACH PARTITION "{name}"')
+                    if drop:
+                        cursor.execute(f'DROP TABLE "{name}"')
+                self.rollups.subtract(hourly)
+                self.counters.decrement(counts)
+            expired[name] = sum(counts.values())
+        return expired
+
+    def _hourly_counts(self, cursor, name: str, month: date) -> dict:
+        """Поиски партиции по (city_id, час) - только если партиция еще попадает в окна статистики."""
+        longest_window = max(self.rollups.WINDOWS.values())
+        if self._bound(add_months(month, 1)) <= timezone.now() - longest_window - timedelta(hours=1):
+            return {}
+
+        cursor.execute(
+            f"SELECT city_id, date_trunc('hour', search_date AT TIME ZONE 'UTC'), COUNT(*) "
+            f'FROM "{name}" GROUP BY 1, 2'
+        )
+        return {
+            (city_id, hour.replace(tzinfo=dt_timezone.utc)): count
+            for city_id, hour, count in cursor.fetchall()
+        }
+
+    def convert(self, ahead: int) -> None:
+        """Превращает обычную таблицу WeatherSearch в секционированную с переносом данных."""
+        if not self.is_supported() or self.is_partitioned():
+            return
+
+        table, legacy = self.table, f"{self.table}_legacy"
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+            cursor.execute(
+                f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE (search_date)'
+            )
+            cursor.execute(f'CREATE SEQUENCE "{table}_pid_seq"')
+            cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval(\'"{table}_pid_seq"\')')
+
+            cursor.execute(f'SELECT MIN(search_date) FROM "{legacy}"')
+            oldest = cursor.fetchone()[0] or timezone.now()
+            month = month_start(oldest)
+            last = add_months(month_start(timezone.now()), ahead)
+            while month <= last:
+                self._create_partition(cursor, month)
+                month = add_months(month, 1)
+            cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+            cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+            cursor.execute(
+                f'SELECT setval(\'"{table}_pid_seq"\', COALESCE((SELECT MAX(id) FROM "{table}"), 0) + 1, false)'
+            )
+            cursor.execute(f'DROP TABLE "{legacy}"')
+            cursor.execute(f'ALTER SEQUENCE "{table}_pid_seq" RENAME TO "{table}_id_seq"')
+            cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+
+            # Первичный ключ секционированной таблицы обязан включать ключ секционирования
+            cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, search_date)')
+            self._create_constraints(cursor)
+
+    def revert(self) -> None:
+        """Возвращает обычную таблицу WeatherSearch, собирая строки из всех партиций."""
+        if not self.is_partitioned():
+            return
+
+        table, partitioned = self.table, f"{self.table}_partitioned"
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{partitioned}"')
+            cursor.execute(f'CREATE TABLE "{table}" (LIKE "{partitioned}" INCLUDING DEFAULTS)')
+            cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"')
+            cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+            cursor.execute(f'DROP TABLE "{partitioned}" CASCADE')
+            cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+            self._create_constraints(cursor)
+
+    def _create_partition(self, cursor, month: date) -> None:
+        # Границы подставляются литералами: параметры в DDL поддерживают не все драйверы
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self._partition_name(month)}" PARTITION OF "{self.table}" '
+            f"FOR VALUES FROM ('{self._bound(month).isoformat()}') "
+            f"TO ('{self._bound(add_months(month, 1)).isoformat()}')"
+        )
+
+    def _create_constraints(self, cursor) -> None:
+        """Внешние ключи и индексы WeatherSearch после пересоздания таблицы."""
+        table = self.table
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_city_id_fk" FOREIGN KEY (city_id) '
+            f'REFERENCES "{City._meta.db_table}" (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_snapshot_id_fk" FOREIGN KEY (snapshot_id) '
+            f'REFERENCES "{ForecastSnapshot._meta.db_table}" (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(
+            f'CREATE INDEX "weather_search_session_idx" ON "{table}" (session_key, search_date DESC, id DESC)'
+        )
+        cursor.execute(f'CREATE INDEX "weather_search_city_date_idx" ON "{table}" (city_id, search_date)')
+        cursor.execute(f'CREATE INDEX "{table}_snapshot_id_idx" ON "{table}" (snapshot_id)')
+
+    def _partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month:%Y%m}"
+
+    @staticmethod
+    def _bound(month: date) -> datetime:
+        return timezone.make_aware(datetime.combine(month, datetime.min.time()))
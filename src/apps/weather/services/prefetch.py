@@ -0,0 +1,165 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from ..models import CitySearchCounter
+from .weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+# Бэкенды кеша, содержимое которых видно только текущему процессу
+PROCESS_LOCAL_CACHES = ("LocMemCache", "DummyCache")
+
+
+class ForecastPrefetcher:
+    """
+    Прогрев кеша прогнозов для самых популярных городов.
+
+    За цикл выбирает top городов по счетчикам поисков, находит те, чьи прогнозы
+    отсутствуют в кеше или станут устаревшими (мягкий TTL) в ближайшие margin
+    секунд, и обновляет их пакетными запросами к Open-Meteo - не больше budget
+    запросов за цикл, начиная с самых популярных, со случайной паузой до jitter
+    секунд между запросами. Время получения читается из записи общего кеша, а цикл
+    и каждый город захватываются блокировкой cache.add, поэтому параллельные
+    запуски не дублируют работу друг друга.
+
+    Отдельный процесс прогрева имеет смысл только с общим кешем (Redis, Memcached):
+    LocMemCache у каждого процесса свой. С ним прогрев запускается в фоновом потоке
+    каждого веб-процесса (WEATHER_PREFETCH_IN_PROCESS, см. PrefetchScheduler).
+    """
+
+    KEY_PREFIX = "weather:prefetch"
+
+    def __init__(self, top: int | None = None, budget: int | None = None, chunk_size: int | None = None,
+                 jitter: float | None = None, margin: int | None = None, sleep=time.sleep):
+        self.top = settings.WEATHER_PREFETCH_TOP_CITIES if top is None else top
+        self.budget = settings.WEATHER_PREFETCH_BUDGET if budget is None else budget
+        self.chunk_size = settings.WEATHER_FORECAST_BATCH_CHUNK_SIZE if chunk_size is None else chunk_size
+        self.jitter = settings.WEATHER_PREFETCH_JITTER if jitter is None else jitter
+        self.margin = settings.WEATHER_PREFETCH_REFRESH_MARGIN if margin is None else margin
+        self.sleep = sleep
+        self.weather_service = WeatherService()
+
+    def top_locations(self) -> list[tuple[float, float]]:
+        """Координаты top самых популярных городов, от самого популярного."""
+        rows = (
+            CitySearchCounter.objects.filter(search_count__gt=0)
+            .order_by('-search_count', 'city_id')
+            .values_list('city__latitude', 'city__longitude')[:self.top]
+        )
+        return list(rows)
+
+    def due_locations(self) -> dict[str, tuple[float, float]]:
+        """Точки, прогноз которых пора обновить: {ключ кеша: координаты} в порядке популярности."""
+        locations = {}
+        for latitude, longitude in self.top_locations():
+            locations.setdefault(self.weather_service.forecast_key(latitude, longitude), (latitude, longitude))
+
+        fetched_at = self.weather_service.forecast_cache.fetched_at_many(list(locations))
+        refresh_before = time.time() - max(self.weather_service.forecast_cache.ttl - self.margin, 0)
+        return {
+            key: location for key, location in locations.items()
+            if fetched_at.get(key, 0) <= refresh_before
+        }
+
+    @staticmethod
+    def cache_is_process_local() -> bool:
+        """Кеш по умолчанию виден только текущему процессу, прогрев из другого процесса ему бесполезен."""
+        return settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1] in PROCESS_LOCAL_CACHES
+
+    def run_once(self) -> dict | None:
+        """
+        Один цикл прогрева, возвращает {"due", "refreshed", "failed", "requests", "busy"}.
+
+        busy - города, которые сейчас обновляет другой запуск. None - предыдущий цикл
+        с тем же кешем еще не закончился, этот пропущен.
+        """
+        run_key = f"{self.KEY_PREFIX}:run"
+        if not cache.add(run_key, 1, settings.WEATHER_PREFETCH_LOCK_TIMEOUT):
+            logger.info("Forecast prefetch is already running, skipping this cycle")
+            return None
+        try:
+            return self._prefetch()
+        finally:
+            cache.delete(run_key)
+
+    def _prefetch(self) -> dict:
+        due = list(self.due_locations().items())
+        result = {"due": len(due), "refreshed": 0, "failed": 0, "requests": 0, "busy": 0}
+
+        # Захватываем не больше городов, чем успеем обновить за бюджет
+        claimed = []
+        for key, location in due:
+            if len(claimed) >= self.budget * self.chunk_size:
+                break
+            if cache.add(self._claim_key(key), 1, settings.WEATHER_PREFETCH_LOCK_TIMEOUT):
+                claimed.append((key, location))
+            else:
+                result["busy"] += 1
+
+        try:
+            for start in range(0, len(claimed), self.chunk_size):
+                if result["requests"] >= self.budget:
+                    break
+                if result["requests"] and self.jitter:
+                    self.sleep(random.uniform(0, self.jitter))
+
+                chunk = claimed[start:start + self.chunk_size]
+                result["requests"] += 1
+                try:
+                    self.weather_service.refresh_forecast_batch([location for _, location in chunk])
+                except ValueError as e:
+                    result["failed"] += len(chunk)
+                    logger.warning(f"Forecast prefetch failed for {len(chunk)} locations: {e}")
+                    continue
+                result["refreshed"] += len(chunk)
+        finally:
+            cache.delete_many([self._claim_key(key) for key, _ in claimed])
+        return result
+
+    def _claim_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:claim:{key}"
+
+
+class PrefetchScheduler:
+    """
+    Прогрев кеша в фоновом потоке веб-процесса.
+
+    Нужен, когда кеш живет в памяти процесса (LocMemCache): отдельная команда
+    prefetch_forecasts прогревала бы только свой кеш. Поток запускается при первом
+    запросе к процессу, если WEATHER_PREFETCH_IN_PROCESS включен, и выполняет цикл
+    раз в WEATHER_PREFETCH_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Запускает поток прогрева, если он еще не запущен; возвращает, запущен ли сейчас."""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._loop, name="forecast-prefetch", daemon=True)
+            self._thread.start()
+            return True
+
+    def _loop(self) -> None:
+        prefetcher = ForecastPrefetcher()
+        while True:
+            started = time.monotonic()
+            try:
+                prefetcher.run_once()
+            except Exception as e:
+                logger.error(f"Forecast prefetch cycle failed: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(max(settings.WEATHER_PREFETCH_INTERVAL - (time.monotonic() - started), 0))
+
+
+prefetch_scheduler = PrefetchScheduler()
@@ -0,0 +1,120 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import ForecastSnapshot, WeatherSearch
+from .partitions import SearchPartitionService
+from .search_counters import SearchCounterService
+from .search_rollups import SearchRollupService
+
+
+class HistoryRetentionService:
+    """
+    Удаление старой истории поиска пачками.
+
+    Каждая пачка - отдельная короткая транзакция: выбираем до batch_size id,
+    удаляем их по первичному ключу и уменьшаем счетчики городов. Так удаление
+    не держит долгих блокировок и не раздувает одну транзакцию на всю таблицу.
+    Если таблица секционирована по месяцам, целиком устаревшие партиции
+    удаляются без построчного DELETE.
+    """
+
+    def __init__(self, batch_size: int | None = None, pause: float = 0.0):
+        self.batch_size = settings.WEATHER_HISTORY_DELETE_BATCH_SIZE if batch_size is None else batch_size
+        self.pause = pause
+        self.counters = SearchCounterService()
+        self.rollups = SearchRollupService()
+
+    def delete_older_than(self, days: int) -> int:
+        """Удаляет поиски старше days дней, возвращает число удаленных."""
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted = sum(SearchPartitionService().expire_partitions(cutoff).values())
+
+        # Индекса по search_date нет: верхняя граница id ищется один раз обратным проходом по
+        # первичному ключу (до первой старой строки), дальше пачки идут по диапазону id
+        old = WeatherSearch.objects.filter(search_date__lt=cutoff)
+        max_id = old.order_by('-id').values_list('id', flat=True).first()
+        if max_id is None:
+            return deleted
+
+        last_id = 0
+        while True:
+            ids = list(
+                old.filter(id__gt=last_id, id__lte=max_id).order_by('id').values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += self.delete_ids(ids)
+            last_id = ids[-1]
+            self._sleep()
+
+    def delete_session(self, session_key: str) -> int:
+        """Удаляет всю историю сессии, возвращает число удаленных."""
+        searches = WeatherSearch.objects.filter(session_key=session_key).order_by('-search_date', '-id')
+        return self._delete_in_batches(searches)
+
+    def trim_sessions(self, keep: int) -> int:
+        """Оставляет в каждой сессии только keep последних поисков, возвращает число удаленных."""
+        sessions = (
+            WeatherSearch.objects.values('session_key')
+            .annotate(search_count=Count('id'))
+            .filter(search_count__gt=keep)
+            .values_list('session_key', flat=True)
+            .order_by()
+        )
+
+        deleted = 0
+        for session_key in sessions.iterator():
+            searches = WeatherSearch.objects.filter(session_key=session_key).order_by('-search_date', '-id')
+            while True:
+                ids = list(searches.values_list('id', flat=True)[keep:keep + self.batch_size])
+                if not ids:
+                    break
+                deleted += self.delete_ids(ids)
+                self._sleep()
+        return deleted
+
+    def delete_orphan_snapshots(self, days: int) -> int:
+        """Удаляет снимки прогнозов старше days дней, на которые больше не ссылается история."""
+        cutoff = timezone.now() - timedelta(days=days)
+        snapshots = ForecastSnapshot.objects.filter(bucket__lt=cutoff, searches__isnull=True).order_by('id')
+
+        deleted = 0
+        while True:
+            ids = list(snapshots.values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return deleted
+            deleted += ForecastSnapshot.objects.filter(id__in=ids).delete()[0]
+            self._sleep()
+
+    def delete_old_rollups(self, days: int) -> int:
+        """Удаляет почасовые счетчики старше days дней, возвращает число удаленных."""
+        return self.rollups.delete_older_than(days, self.batch_size)
+
+    def delete_ids(self, ids: list[int]) -> int:
+        """Удаляет поиски по id одной транзакцией и уменьшает счетчики городов, в том числе почасовые."""
+        searches = WeatherSearch.objects.filter(id__in=ids)
+        with transaction.atomic():
+            counts = dict(searches.values_list('city_id').annotate(Count('id')).order_by())
+            hourly = self.rollups.count_searches(searches)
+            deleted, _ = searches.delete()
+            self.rollups.subtract(hourly)
+            self.counters.decrement(counts)
+        return deleted
+
+    def _delete_in_batches(self, searches) -> int:
+        deleted = 0
+        while True:
+            ids = list(searches.values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return deleted
+            deleted += self.delete_ids(ids)
+            self._sleep()
+
+    def _sleep(self) -> None:
+        if self.pause:
+            time.sleep(self.pause)
@@ -0,0 +1,70 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from ..models import CitySearchCounter, WeatherSearch
+
+
+class SearchCounterService:
+    """
+    Счетчики поисков по городам.
+
+    Обновляются при сохранении и удалении истории, поэтому статистика
+    популярности читает не более limit строк вместо агрегации всей таблицы
+    WeatherSearch. При расхождении счетчики пересчитываются командой
+    rebuild_search_counters. Каждое изменение обновляет updated_at счетчика,
+    последний updated_at - версия счетчиков для ETag статистики, одна и та же
+    во всех процессах.
+    """
+
+    def increment(self, city_id: int, count: int = 1) -> None:
+        """Увеличивает счетчик города на count."""
+        if not self._add(city_id, count):
+            try:
+                with transaction.atomic():
+                    CitySearchCounter.objects.create(city_id=city_id, search_count=count)
+            except IntegrityError:
+                # Счетчик успел создать параллельный запрос
+                self._add(city_id, count)
+
+    def decrement(self, counts: dict[int, int]) -> None:
+        """Уменьшает счетчики городов: {city_id: количество удаленных поисков}."""
+        for city_id, count in counts.items():
+            self._add(city_id, -count)
+
+    def get_popular(self, limit: int = 10) -> list[dict]:
+        """Возвращает limit самых популярных городов."""
+        counters = (
+            CitySearchCounter.objects.filter(search_count__gt=0)
+            .order_by('-search_count', 'city_id')
+            .values('city__name', 'city__country', 'search_count')[:limit]
+        )
+        return [
+            {'city': item['city__name'], 'country': item['city__country'], 'search_count': item['search_count']}
+            for item in counters
+        ]
+
+    def rebuild(self) -> int:
+        """Пересчитывает все счетчики по таблице WeatherSearch, возвращает число городов."""
+        rows = WeatherSearch.objects.values('city_id').annotate(search_count=Count('id')).order_by()
+
+        with transaction.atomic():
+            CitySearchCounter.objects.all().delete()
+            counters = CitySearchCounter.objects.bulk_create(
+                (CitySearchCounter(city_id=row['city_id'], search_count=row['search_count'])
+                 for row in rows.iterator()),
+                batch_size=1000
+            )
+        return len(counters)
+
+    def version(self) -> str | None:
+        """Текущая версия счетчиков: время последнего изменения (выборка по индексу updated_at)."""
+        updated_at = CitySearchCounter.objects.aggregate(updated_at=Max('updated_at'))['updated_at']
+        return updated_at.isoformat() if updated_at else None
+
+    @staticmethod
+    def _add(city_id: int, count: int) -> bool:
+        updated = CitySearchCounter.objects.filter(city_id=city_id).update(
+            search_count=F('search_count') + count, updated_at=timezone.now()
+        )
+        return bool(updated)
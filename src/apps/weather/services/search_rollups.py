@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from ..models import CitySearchRollup, WeatherSearch
+
+
+class SearchRollupService:
+    """
+    Почасовые счетчики поисков по городам.
+
+    Обновляются вместе со счетчиками SearchCounterService при сохранении и
+    удалении истории. Статистика за окно (последний час, сутки, неделя, месяц)
+    суммирует не больше "городов x часов окна" строк и никогда не читает
+    WeatherSearch. Точность окна - час: в него попадает и текущий неполный час.
+    """
+
+    WINDOWS = {
+        "1h": timedelta(hours=1),
+        "24h": timedelta(hours=24),
+        "7d": timedelta(days=7),
+        "30d": timedelta(days=30),
+    }
+
+    @staticmethod
+    def hour_start(moment: datetime) -> datetime:
+        """Начало часа (UTC), в который попадает moment."""
+        return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    def window_start(self, window: str, now: datetime | None = None) -> datetime:
+        """Первый час окна; ValueError для неизвестного окна."""
+        if window not in self.WINDOWS:
+            raise ValueError(f"Параметр window должен быть одним из: {', '.join(self.WINDOWS)}")
+        return self.hour_start((now or timezone.now()) - self.WINDOWS[window])
+
+    def add(self, counts: dict[tuple[int, datetime], int]) -> None:
+        """Увеличивает счетчики: {(city_id, начало часа): количество поисков}."""
+        for (city_id, hour), count in counts.items():
+            if self._add(city_id, hour, count):
+                continue
+            try:
+                with transaction.atomic():
+                    CitySearchRollup.objects.create(city_id=city_id, hour=hour, search_count=count)
+            except IntegrityError:
+                # Строку успел создать параллельный запрос
+                self._add(city_id, hour, count)
+
+    def subtract(self, counts: dict[tuple[int, datetime], int]) -> None:
+        """Уменьшает счетчики после удаления истории."""
+        for (city_id, hour), count in counts.items():
+            self._add(city_id, hour, -count)
+
+    def count_searches(self, searches) -> dict[tuple[int, datetime], int]:
+        """Считает поиски выборки WeatherSearch по (city_id, час)."""
+        rows = (
+            searches.annotate(hour=TruncHour('search_date', tzinfo=dt_timezone.utc))
+            .values_list('city_id', 'hour')
+            .annotate(search_count=Count('id'))
+            .order_by()
+        )
+        return {(city_id, hour): search_count for city_id, hour, search_count in rows}
+
+    def get_popular(self, window: str, limit: int = 10) -> list[dict]:
+        """Возвращает limit самых популярных городов за окно."""
+        rows = (
+            CitySearchRollup.objects.filter(hour__gte=self.window_start(window))
+            .values('city_id', 'city__name', 'city__country')
+            .annotate(total=Sum('search_count'))
+            .filter(total__gt=0)
+            .order_by('-total', 'city_id')[:limit]
+        )
+        return [
+            {'city': row['city__name'], 'country': row['city__country'], 'search_count': row['total']}
+            for row in rows
+        ]
+
+    def rebuild(self, days: int) -> int:
+        """Пересчитывает счетчики за последние days дней по WeatherSearch, возвращает число строк."""
+        since = self.hour_start(timezone.now() - timedelta(days=days))
+        counts = self.count_searches(WeatherSearch.objects.filter(search_date__gte=since))
+
+        with transaction.atomic():
+            CitySearchRollup.objects.filter(hour__gte=since).delete()
+            rollups = CitySearchRollup.objects.bulk_create(
+                (CitySearchRollup(city_id=city_id, hour=hour, search_count=count)
+                 for (city_id, hour), count in counts.items()),
+                batch_size=1000
+            )
+        return len(rollups)
+
+    def delete_older_than(self, days: int, batch_size: int = 1000) -> int:
+        """Удаляет счетчики часов старше days дней пачками, возвращает число удаленных."""
+        rollups = CitySearchRollup.objects.filter(hour__lt=timezone.now() - timedelta(days=days)).order_by('id')
+
+        deleted = 0
+        while True:
+            ids = list(rollups.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += CitySearchRollup.objects.filter(id__in=ids).delete()[0]
+
+    @staticmethod
+    def _add(city_id: int, hour: datetime, count: int) -> bool:
+        updated = CitySearchRollup.objects.filter(city_id=city_id, hour=hour).update(
+            search_count=F('search_count') + count
+        )
+        return bool(updated)
@@ -0,0 +1,213 @@
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Call:
+    """Выполняемый запрос, результат которого ждут остальные вызывающие."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы к upstream.
+
+    Первый вызывающий для ключа выполняет запрос, остальные ждут и получают
+    тот же результат или то же исключение. Режим задается настройкой
+    WEATHER_SINGLE_FLIGHT_MODE: "local" - в пределах процесса, "cache" -
+    дополнительно между воркерами через блокировку в общем кеше, "off" -
+    без объединения.
+    """
+
+    KEY_PREFIX = "weather:flight"
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._async_calls = weakref.WeakKeyDictionary()
+
+    def do(self, key: str, fn):
+        """Выполняет fn() один раз для всех одновременных вызовов с ключом key."""
+        mode = settings.WEATHER_SINGLE_FLIGHT_MODE
+        if mode == "off":
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            return call.outcome()
+
+        try:
+            call.result = self._do_shared(key, fn) if mode == "cache" else fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.outcome()
+
+    async def ado(self, key: str, fn):
+        """Асинхронная версия do(), fn возвращает корутину."""
+        mode = settings.WEATHER_SINGLE_FLIGHT_MODE
+        if mode == "off":
+            return await fn()
+
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.setdefault(loop, {})
+
+        future = calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Отменен ведущий (например, его клиент отключился), а не этот вызов - запрос повторяется
+                if not future.cancelled():
+                    raise
+                return await self.ado(key, fn)
+
+        future = calls[key] = loop.create_future()
+        try:
+            result = await (self._ado_shared(key, fn) if mode == "cache" else fn())
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            calls.pop(key, None)
+            # CancelledError - не Exception: без отмены future ожидающие ждали бы вечно
+            if not future.done():
+                future.cancel()
+
+        return future.result()
+
+    def _do_shared(self, key: str, fn):
+        """
+        Выполняет fn() под блокировкой в общем кеше.
+
+        Ведущий записывает результат вместе со временем получения и только потом
+        снимает блокировку. Ожидающий (заставший чужую блокировку) берет результат,
+        полученный после его прихода; захватив освободившуюся блокировку, он сначала
+        еще раз проверяет результат - ведущий мог закончить между проверками, и тогда
+        повторный запрос не нужен.
+
+        Значение блокировки - токен ведущего: блокировку снимает только ее владелец,
+        чтобы ведущий, работавший дольше timeout, не снял блокировку следующего.
+        Проверка и удаление не атомарны (в Django cache нет compare-and-delete),
+        но окно между ними - два обращения к кешу, а не время запроса к upstream.
+        """
+        lock_key, result_key = self._lock_key(key), self._result_key(key)
+        timeout = settings.WEATHER_SINGLE_FLIGHT_LOCK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        arrived = time.time()
+        waited = False
+
+        while True:
+            token = uuid.uuid4().hex
+            if cache.add(lock_key, token, timeout):
+                try:
+                    outcome = self._finished_after(cache.get(result_key), arrived) if waited else None
+                    if outcome is None:
+                        outcome = self._run(fn)
+                        cache.set(result_key, (time.time(), outcome), timeout)
+                finally:
+                    # После истечения timeout блокировка может принадлежать следующему ведущему
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+                return self._unpack(outcome)
+
+            waited = True
+            outcome = self._finished_after(cache.get(result_key), arrived)
+            if outcome is not None:
+                return self._unpack(outcome)
+
+            if time.monotonic() >= deadline:
+                return fn()
+            time.sleep(settings.WEATHER_SINGLE_FLIGHT_POLL_INTERVAL)
+
+    async def _ado_shared(self, key: str, fn):
+        """Асинхронная версия _do_shared()."""
+        lock_key, result_key = self._lock_key(key), self._result_key(key)
+        timeout = settings.WEATHER_SINGLE_FLIGHT_LOCK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        arrived = time.time()
+        waited = False
+
+        while True:
+            token = uuid.uuid4().hex
+            if await cache.aadd(lock_key, token, timeout):
+                try:
+                    outcome = self._finished_after(await cache.aget(result_key), arrived) if waited else None
+                    if outcome is None:
+                        outcome = await self._arun(fn)
+                        await cache.aset(result_key, (time.time(), outcome), timeout)
+                finally:
+                    if await cache.aget(lock_key) == token:
+                        await cache.adelete(lock_key)
+                return self._unpack(outcome)
+
+            waited = True
+            outcome = self._finished_after(await cache.aget(result_key), arrived)
+            if outcome is not None:
+                return self._unpack(outcome)
+
+            if time.monotonic() >= deadline:
+                return await fn()
+            await asyncio.sleep(settings.WEATHER_SINGLE_FLIGHT_POLL_INTERVAL)
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:{self.namespace}:{key}:lock"
+
+    def _result_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:{self.namespace}:{key}:result"
+
+    @staticmethod
+    def _finished_after(stored: tuple | None, arrived: float) -> tuple | None:
+        """Результат запроса, завершившегося после прихода вызывающего (с допуском на интервал опроса)."""
+        if stored is None:
+            return None
+        finished_at, outcome = stored
+        if finished_at < arrived - settings.WEATHER_SINGLE_FLIGHT_POLL_INTERVAL:
+            return None
+        return outcome
+
+    @staticmethod
+    def _run(fn) -> tuple:
+        try:
+            return "ok", fn()
+        except Exception as e:
+            return "error", e
+
+    @staticmethod
+    async def _arun(fn) -> tuple:
+        try:
+            return "ok", await fn()
+        except Exception as e:
+            return "error", e
+
+    @staticmethod
+    def _unpack(outcome: tuple):
+        status, value = outcome
+        if status == "error":
+            raise value
+        return value
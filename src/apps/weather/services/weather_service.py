@@ -1,8 +1,17 @@
+from datetime import datetime, timezone
+
 import requests
 from decouple import config
+from django.conf import settings
 
 from ..enums.weather_codes import weather_codes
-from ..models import City
+from ..models import City, CityAlternateName
+from . import http_client
+from .background_refresh import BackgroundRefresher
+from .forecast_cache import ForecastCache
+from .forecast_data import DailyForecast, HourlyForecast
+from .geocoding_cache import GeocodingCache
+from .single_flight import SingleFlight
 
 
 class WeatherService:
@@ -11,34 +20,191 @@ class WeatherService:
     GEOCODING_API_URL = config("GEOCODING_API_URL", default="https://geocoding-api.open-meteo.com/v1/search")
     WEATHER_API_URL = config("WEATHER_API_BASE_URL", default="https://api.open-meteo.com/v1/forecast")
 
+    # Почасовые переменные Open-Meteo, которые отдает API
+    HOURLY_VARIABLES = (
+        "temperature_2m",
+        "relative_humidity_2m",
+        "precipitation",
+        "weather_code",
+        "wind_speed_10m",
+    )
+
+    # Общие для процесса: объединяют одинаковые запросы из разных экземпляров сервиса
+    forecast_flight = SingleFlight("forecast")
+    geocoding_flight = SingleFlight("geocoding")
+    forecast_refresher = BackgroundRefresher("forecast")
+
+    def __init__(self):
+        self.forecast_cache = ForecastCache()
+        self.geocoding_cache = GeocodingCache()
+
     def get_city_coordinates(self, city_name: str) -> tuple[float, float]:
         """Получает координаты города по его названию."""
-        try:
-            city = City.objects.get(name__iexact=city_name)
-            return city.latitude, city.longitude
-        except City.DoesNotExist:
+        cached = self.geocoding_cache.get(city_name)
+        if cached is not None:
+            return self._coordinates_from_cache(cached, city_name)
+
+        city = self.find_city(city_name)
+        if city is None:
             return self._fetch_coordinates_from_api(city_name)
 
+        self.geocoding_cache.set_found(city_name, city.latitude, city.longitude)
+        return city.latitude, city.longitude
+
+    @staticmethod
+    def find_city(city_name: str) -> City | None:
+        """
+        Город из БД по названию без учета регистра, затем по альтернативному названию
+        (из справочника GeoNames или запомненному после геокодинга), самый населенный.
+        """
+        city = City.objects.filter(name__iexact=city_name).first()
+        if city is None:
+            city = (
+                City.objects.filter(alternate_names__normalized=GeocodingCache.normalize(city_name))
+                .order_by('-population', 'id')
+                .first()
+            )
+        return city
+
     def get_weather_forecast(self, latitude: float, longitude: float) -> dict:
         """Получает прогноз погоды по координатам через Open-Meteo."""
+        return self.get_weather_forecast_entry(latitude, longitude)["data"]
+
+    def get_weather_forecast_entry(self, latitude: float, longitude: float) -> dict:
+        """
+        Получает прогноз вместе с его возрастом: {"data", "fetched_at", "age", "stale"}.
+
+        Прогноз старше мягкого TTL отдается сразу и обновляется в фоне,
+        запрос к Open-Meteo в самом вызове бывает только при промахе кеша.
+        """
+        latitude, longitude = self.snap_coordinates(latitude, longitude)
+        params = self._forecast_params(latitude, longitude)
+        return self._cached_forecast(params, self.forecast_cache.make_key(latitude, longitude, params))
+
+    def get_hourly_forecast(self, latitude: float, longitude: float) -> HourlyForecast:
+        """
+        Получает почасовой прогноз по координатам.
+
+        Всегда запрашивается полный ряд всех HOURLY_VARIABLES, чтобы любые окна
+        и наборы переменных обслуживались из одной записи кеша.
+        """
+        latitude, longitude = self.snap_coordinates(latitude, longitude)
+        params = self._hourly_params(latitude, longitude)
+        entry = self._cached_forecast(params, self.forecast_cache.make_key(latitude, longitude, params))
+        return HourlyForecast.from_open_meteo(entry["data"].get("hourly", {}))
+
+    def _cached_forecast(self, params: dict, cache_key: str) -> dict:
+        """Запись кеша для запроса (stale-while-revalidate), при промахе - прогноз из Open-Meteo."""
+        entry = self.forecast_cache.get_entry(cache_key)
+        if entry is None:
+            # Время получения - то же, что в кеше: по нему строятся ключи фрагментов и снимков
+            return self.forecast_flight.do(cache_key, lambda: self._request_forecast(params, cache_key))
+
+        if entry["stale"]:
+            self.forecast_refresher.submit(cache_key, lambda: self._request_forecast(params, cache_key))
+        return entry
+
+    def _request_forecast(self, params: dict, cache_key: str) -> dict:
+        """Запрашивает прогноз у Open-Meteo, сохраняет его в кеш и возвращает запись кеша."""
         try:
-            params = {
-                "latitude": latitude,
-                "longitude": longitude,
-                "current": "temperature_2m,weather_code,wind_speed_10m,relative_humidity_2m",
-                "daily": "temperature_2m_max,temperature_2m_min,weather_code",
-                "timezone": "auto",
-                "forecast_days": 7
-            }
-
-            response = requests.get(self.WEATHER_API_URL, params=params, timeout=10)
+            response = http_client.get(self.WEATHER_API_URL, params=params)
             response.raise_for_status()
 
-            return response.json()
+            return self.forecast_cache.set(cache_key, response.json())
+
+        except requests.RequestException as e:
+            raise ValueError(f"Ошибка при получении данных о погоде: {str(e)}")
+
+    def get_weather_forecast_batch(self, locations: list[tuple[float, float]]) -> list[dict]:
+        """Получает прогнозы для нескольких точек минимальным числом запросов к Open-Meteo."""
+        # Точки из одной ячейки сетки запрашиваются один раз
+        locations = [self.snap_coordinates(latitude, longitude) for latitude, longitude in locations]
+        keys = [self.forecast_key(latitude, longitude) for latitude, longitude in locations]
+        entries = self.forecast_cache.get_entries(keys)
+        forecasts = {key: entry["data"] for key, entry in entries.items()}
+
+        missing, stale = {}, {}
+        for key, location in zip(keys, locations):
+            if key not in forecasts:
+                missing.setdefault(key, location)
+            elif entries[key]["stale"]:
+                stale.setdefault(key, location)
+
+        # Устаревшие прогнозы обновляются в фоне, как и недостающие - одним запросом на пачку точек
+        stale_keys = list(stale)
+        chunk_size = settings.WEATHER_FORECAST_BATCH_CHUNK_SIZE
+        for start in range(0, len(stale_keys), chunk_size):
+            self.forecast_refresher.submit_many(
+                stale_keys[start:start + chunk_size],
+                lambda claimed: self.refresh_forecast_batch([stale[key] for key in claimed])
+            )
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), chunk_size):
+            chunk = missing_items[start:start + chunk_size]
+            fetched = dict(zip(
+                [key for key, _ in chunk],
+                self._request_forecast_batch([location for _, location in chunk])
+            ))
+            self.forecast_cache.set_many(fetched)
+            forecasts.update(fetched)
+
+        return [forecasts[key] for key in keys]
+
+    def refresh_forecast_batch(self, locations: list[tuple[float, float]]) -> list[dict]:
+        """Запрашивает прогнозы для точек одним запросом к Open-Meteo и обновляет их в кеше."""
+        locations = [self.snap_coordinates(latitude, longitude) for latitude, longitude in locations]
+        forecasts = self._request_forecast_batch(locations)
+        self.forecast_cache.set_many({
+            self.forecast_key(latitude, longitude): forecast
+            for (latitude, longitude), forecast in zip(locations, forecasts)
+        })
+        return forecasts
+
+    def forecast_key(self, latitude: float, longitude: float) -> str:
+        """Ключ кеша прогноза по дням для точки."""
+        latitude, longitude = self.snap_coordinates(latitude, longitude)
+        return self.forecast_cache.make_key(latitude, longitude, self._forecast_params(latitude, longitude))
+
+    @staticmethod
+    def snap_coordinates(latitude: float, longitude: float) -> tuple[float, float]:
+        """
+        Привязывает точку к узлу сетки с шагом WEATHER_FORECAST_GRID_STEP градусов.
 
+        Open-Meteo считает прогноз по сетке модели, поэтому соседние точки получают
+        одни и те же данные; после привязки у них общие ключ кеша и запрос к API.
+        Шаг 0 отключает привязку. Координаты в ответах остаются исходными.
+        """
+        step = settings.WEATHER_FORECAST_GRID_STEP
+        if not step:
+            return latitude, longitude
+        return (
+            min(max(round(round(latitude / step) * step, 6), -90.0), 90.0),
+            min(max(round(round(longitude / step) * step, 6), -180.0), 180.0),
+        )
+
+    def _request_forecast_batch(self, locations: list[tuple[float, float]]) -> list[dict]:
+        """Запрашивает прогнозы для списка точек одним запросом к Open-Meteo."""
+        params = self._forecast_params(
+            ",".join(str(latitude) for latitude, _ in locations),
+            ",".join(str(longitude) for _, longitude in locations)
+        )
+
+        try:
+            response = http_client.get(self.WEATHER_API_URL, params=params)
+            response.raise_for_status()
+
+            data = response.json()
         except requests.RequestException as e:
             raise ValueError(f"Ошибка при получении данных о погоде: {str(e)}")
 
+        # Для одной точки Open-Meteo возвращает объект, для нескольких - список
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) != len(locations):
+            raise ValueError("Ошибка при получении данных о погоде: неполный ответ API")
+        return data
+
     def format_weather_data(self, weather_data: dict) -> dict:
         """Форматирует данные о погоде для отображения."""
         current = weather_data.get("current", {})
@@ -53,21 +219,8 @@ class WeatherService:
             "description": self._get_weather_description(current.get("weather_code", 0)),
         }
 
-        # Прогноз на неделю
-        daily_forecast = []
-        if daily.get("time"):
-            for i in range(len(daily["time"])):
-                daily_forecast.append({
-                    "date": daily["time"][i],
-                    "temp_max": daily.get("temperature_2m_max", [])[i] if i < len(
-                        daily.get("temperature_2m_max", [])) else None,
-                    "temp_min": daily.get("temperature_2m_min", [])[i] if i < len(
-                        daily.get("temperature_2m_min", [])) else None,
-                    "weather_code": daily.get("weather_code", [])[i] if i < len(
-                        daily.get("weather_code", [])) else None,
-                    "description": self._get_weather_description(
-                        daily.get("weather_code", [])[i] if i < len(daily.get("weather_code", [])) else 0),
-                })
+        # Прогноз на неделю: столбцы вместо словаря на каждый день
+        daily_forecast = DailyForecast.from_open_meteo(daily)
 
         return {
             "current": current_weather,
@@ -76,43 +229,103 @@ class WeatherService:
 
     def _fetch_coordinates_from_api(self, city_name: str) -> tuple[float, float]:
         """Получает координаты города через Open-Meteo Geocoding API."""
+        return self.geocoding_flight.do(
+            self.geocoding_cache.make_key(city_name),
+            lambda: self._request_coordinates(city_name)
+        )
+
+    def _request_coordinates(self, city_name: str) -> tuple[float, float]:
+        """Запрашивает координаты у Geocoding API и сохраняет город."""
         try:
-            params = {
-                "name": city_name,
-                "count": 1,
-                "language": "ru",
-                "format": "json"
-            }
-
-            response = requests.get(self.GEOCODING_API_URL, params=params, timeout=10)
+            params = self._geocoding_params(city_name)
+
+            response = http_client.get(self.GEOCODING_API_URL, params=params)
             response.raise_for_status()
 
             data = response.json()
 
             if not data.get("results"):
+                self.geocoding_cache.set_not_found(city_name)
                 raise ValueError(f"Город '{city_name}' не найден.")
 
             result = data["results"][0]
             latitude = result["latitude"]
             longitude = result["longitude"]
-            country = result.get("country", "")
-            api_city_name = result.get("name", city_name)
 
             city, created = City.objects.get_or_create(
-                name__iexact=api_city_name,
-                defaults={
-                    "name": api_city_name,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "country": country
-                }
+                name__iexact=result.get("name", city_name),
+                defaults=self._city_defaults(result, city_name)
             )
+            self._remember_alternate_name(city, city_name)
 
+            self.geocoding_cache.set_found(city_name, latitude, longitude)
             return latitude, longitude
 
         except requests.RequestException as e:
             raise ValueError(f"Ошибка при получении координат города: {str(e)}")
 
+    @staticmethod
+    def _remember_alternate_name(city: City, city_name: str) -> None:
+        """Запоминает запрос как альтернативное название города, если Geocoding API вернул другое."""
+        normalized = GeocodingCache.normalize(city_name)
+        if normalized != GeocodingCache.normalize(city.name):
+            CityAlternateName.objects.get_or_create(
+                city=city, normalized=normalized[:200], defaults={"name": city_name[:200]}
+            )
+
+    def _coordinates_from_cache(self, cached: dict, city_name: str) -> tuple[float, float]:
+        """Координаты из кеша геокодинга или ошибка для отрицательной записи."""
+        if cached.get("not_found"):
+            raise ValueError(f"Город '{city_name}' не найден.")
+        return cached["latitude"], cached["longitude"]
+
+    def _forecast_params(self, latitude: float, longitude: float) -> dict:
+        """Параметры запроса прогноза погоды к Open-Meteo."""
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "current": "temperature_2m,weather_code,wind_speed_10m,relative_humidity_2m",
+            "daily": "temperature_2m_max,temperature_2m_min,weather_code",
+            "timezone": "auto",
+            "forecast_days": 7
+        }
+
+    def _hourly_params(self, latitude: float, longitude: float) -> dict:
+        """Параметры запроса почасового прогноза к Open-Meteo."""
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "hourly": ",".join(self.HOURLY_VARIABLES),
+            "timezone": "auto",
+            "forecast_days": settings.WEATHER_HOURLY_FORECAST_DAYS
+        }
+
+    def _geocoding_params(self, city_name: str, count: int = 1) -> dict:
+        """Параметры запроса к Open-Meteo Geocoding API."""
+        return {
+            "name": city_name,
+            "count": count,
+            "language": "ru",
+            "format": "json"
+        }
+
+    def _city_defaults(self, result: dict, city_name: str) -> dict:
+        """Поля нового города из результата геокодинга."""
+        return {
+            "name": result.get("name", city_name),
+            "latitude": result["latitude"],
+            "longitude": result["longitude"],
+            "country": result.get("country", "")
+        }
+
+    @staticmethod
+    def forecast_age(entry: dict) -> dict:
+        """Когда получен прогноз и сколько ему секунд - для отображения рядом с данными."""
+        return {
+            "updated_at": datetime.fromtimestamp(entry["fetched_at"], tz=timezone.utc),
+            "age_seconds": entry["age"],
+        }
+
     def _get_weather_description(self, weather_code: int) -> str:
         """Получает текстовое описание погоды по коду погоды."""
         weather_descriptions = weather_codes
@@ -122,9 +335,10 @@ class WeatherService:
         """Полный поиск погоды по названию города."""
         try:
             latitude, longitude = self.get_city_coordinates(city_name)
-            raw_weather_data = self.get_weather_forecast(latitude, longitude)
+            forecast = self.get_weather_forecast_entry(latitude, longitude)
 
-            formatted_data = self.format_weather_data(raw_weather_data)
+            formatted_data = self.format_weather_data(forecast["data"])
+            formatted_data.update(self.forecast_age(forecast))
             return formatted_data
 
         except ValueError:
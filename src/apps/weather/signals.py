@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import City, WeatherSearch
+from .services.city_index import city_index
+from .services.data_versions import DataVersionService
+from .services.nearest_cities import nearest_city_index
+from .services.prefetch import prefetch_scheduler
+
+
+@receiver(post_save, sender=City)
+def update_city_index(sender, instance, **kwargs):
+    """Обновляет индексы городов при создании или изменении города."""
+    DataVersionService().bump(DataVersionService.CITIES)
+    city_index.add(instance)
+    nearest_city_index.add(instance)
+
+
+@receiver(post_delete, sender=City)
+def remove_from_city_index(sender, instance, **kwargs):
+    """Удаляет город из индексов городов."""
+    DataVersionService().bump(DataVersionService.CITIES, DataVersionService.CITY_DELETIONS)
+    city_index.remove(instance.pk)
+    nearest_city_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=WeatherSearch)
+def bump_city_popularity(sender, instance, created, **kwargs):
+    """Учитывает новый поиск в популярности города."""
+    if created:
+        city_index.bump(instance.city_id)
+
+
+@receiver(request_started)
+def start_in_process_prefetch(sender, **kwargs):
+    """Запускает прогрев кеша в потоке веб-процесса при первом запросе (WEATHER_PREFETCH_IN_PROCESS)."""
+    if settings.WEATHER_PREFETCH_IN_PROCESS:
+        prefetch_scheduler.start()
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 
 from .views import (
@@ -7,6 +8,9 @@ from .views import (
     AboutSiteView
 )
 
+if settings.WEATHER_ASYNC_VIEWS:
+    from .async_views import AsyncWeatherHomeView as WeatherHomeView
+
 app_name = 'weather'
 
 
@@ -1,18 +1,45 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from urllib.parse import quote, unquote
 
 import requests
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.views import View
 from django.views.generic import TemplateView
 
 from .forms import WeatherSearchForm
+from .services import http_client
+from .services.autocomplete_cache import AutocompleteCache
+from .services.city_index import city_index
+from .services.geocoding_cache import GeocodingCache
 from .services.history_service import HistoryService
 from .services.weather_service import WeatherService
 
 logger = logging.getLogger(__name__)
 
+# Пул для запросов автодополнения к API: запрос продолжается после ответа клиенту,
+# чтобы поздний результат попал в кеш к следующему нажатию клавиши
+autocomplete_executor = ThreadPoolExecutor(
+    max_workers=settings.WEATHER_AUTOCOMPLETE_WORKERS,
+    thread_name_prefix="autocomplete"
+)
+autocomplete_cache = AutocompleteCache()
+# Запросы к API в работе по нормализованному запросу: одинаковые запросы разделяют один,
+# а их число не больше числа потоков пула, чтобы задачи не копились в очереди
+autocomplete_in_flight = {}
+autocomplete_in_flight_lock = threading.Lock()
+
+
+def _forget_in_flight(key, future):
+    """Убирает завершенный запрос к API из списка идущих."""
+    with autocomplete_in_flight_lock:
+        if autocomplete_in_flight.get(key) is future:
+            del autocomplete_in_flight[key]
+
 
 class WeatherHomeView(TemplateView):
     """Главная страница с поиском погоды."""
@@ -50,28 +77,55 @@ class WeatherHomeView(TemplateView):
                 history_service.save_history(session_key, city_name, weather_data)
 
                 self._update_previous_cities(city_name)
-
-                context.update({
-                    "status": "success",
-                    "weather_data": weather_data,
-                    "searched_city": city_name,
-                    "form": form
-                })
+                context.update(self._success_context(form, city_name, weather_data))
 
             except ValueError as e:
-                context.update({
-                    "status": "error",
-                    "error_message": str(e),
-                    "searched_city": city_name,
-                    "form": form
-                })
+                context.update(self._error_context(form, str(e), city_name))
         else:
-            context.update({
-                "status": "error",
-                "error_message": "Пожалуйста, введите корректное название города",
-                "form": form
-            })
+            context.update(self._error_context(form, "Пожалуйста, введите корректное название города"))
+
+        return self._render_search_response(context)
+
+    def _success_context(self, form, city_name, weather_data):
+        """Контекст успешного поиска погоды."""
+        return {
+            "status": "success",
+            "weather_data": weather_data,
+            "searched_city": city_name,
+            "form": form,
+            **self._forecast_fragment(city_name, weather_data)
+        }
 
+    def _forecast_fragment(self, city_name, weather_data):
+        """
+        Ключ и время жизни кешированного блока прогноза в шаблоне.
+
+        Блок зависит только от города и версии прогноза (времени его получения),
+        поэтому одинаковые поиски разных пользователей рендерят его один раз.
+        Без версии блок не кешируется.
+        """
+        updated_at = weather_data.get("updated_at")
+        if updated_at is None:
+            return {"forecast_fragment_key": None, "forecast_fragment_ttl": 0}
+
+        return {
+            "forecast_fragment_key": f"{GeocodingCache.normalize(city_name)}:{updated_at.timestamp()}",
+            "forecast_fragment_ttl": settings.WEATHER_FORECAST_FRAGMENT_TTL
+        }
+
+    def _error_context(self, form, error_message, city_name=None):
+        """Контекст неудачного поиска погоды."""
+        context = {
+            "status": "error",
+            "error_message": error_message,
+            "form": form
+        }
+        if city_name is not None:
+            context["searched_city"] = city_name
+        return context
+
+    def _render_search_response(self, context):
+        """Рендерит страницу с результатом поиска и обновляет cookie."""
         response = render(self.request, self.template_name, context)
         self._set_previous_cities_cookie(response)
         return response
@@ -132,7 +186,6 @@ class CityAutocompleteView(View):
         try:
             weather_service = WeatherService()
 
-            import requests
             params = {
                 "name": query,
                 "count": 5,
@@ -140,7 +193,7 @@ class CityAutocompleteView(View):
                 "format": "json"
             }
 
-            response = requests.get(weather_service.GEOCODING_API_URL, params=params, timeout=5)
+            response = http_client.get(weather_service.GEOCODING_API_URL, params=params, read_timeout=5)
             response.raise_for_status()
 
             data = response.json()
@@ -179,10 +232,16 @@ class WeatherHistoryView(TemplateView):
         history_service = HistoryService()
         session_key = self.request.session.session_key
 
+        context["user_history"] = []
+        context["next_cursor"] = None
+
         if session_key:
-            context["user_history"] = history_service.get_history(session_key)
-        else:
-            context["user_history"] = []
+            try:
+                page = history_service.get_history_page(session_key, cursor=self.request.GET.get("cursor"))
+            except ValueError:
+                page = history_service.get_history_page(session_key)
+            context["user_history"] = page["history"]
+            context["next_cursor"] = page["next_cursor"]
 
         context["popular_cities"] = history_service.get_popular_cities(10)
 
@@ -192,37 +251,83 @@ class WeatherHistoryView(TemplateView):
 class AutocompleteView(View):
     """API для автодополнения поиска городов."""
 
+    # Сколько городов берется из локального индекса; набралось столько - API не запрашивается
+    LOCAL_LIMIT = 5
+
     def get(self, request):
         query = request.GET.get("q", "").strip()
 
         # Короткий запрос
         if len(query) < 2:
-            return JsonResponse({
-                'status': 'success',
-                'suggestions': [],
-                'message': 'Минимум 2 символа для поиска',
-                'query': query,
-                'total_found': 0
-            })
+            return self._short_query_response(query)
 
+        deadline = time.monotonic() + settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS / 1000
         suggestions = []
+        sources = {}
+
+        # Запрос к API запускаем сразу, параллельно с локальным поиском
+        api_suggestions = autocomplete_cache.get(query)
+        api_future = None
+        if api_suggestions is None:
+            api_future = self._submit_api_fetch(query)
 
         # Получаем локальные предложения
         try:
             local_suggestions = self.get_local_suggestions(query)
             suggestions.extend(local_suggestions)
+            sources['local'] = 'ok'
         except Exception as e:
             logger.error(f"Error getting local suggestions: {e}")
+            sources['local'] = 'error'
+
+        if api_suggestions is not None:
+            sources['api'] = 'cached'
+        elif api_future is None:
+            # Все потоки пула заняты: отвечаем локальными результатами, а не ставим запрос в очередь
+            sources['api'] = 'busy'
+        elif len(suggestions) >= self.LOCAL_LIMIT:
+            # Локальный индекс дал полный список: ответ API не ждем, он попадет в кеш
+            sources['api'] = 'skipped'
+        else:
+            # Ждем API не дольше бюджета задержки, поздний ответ попадет в кеш
+            try:
+                api_suggestions = api_future.result(timeout=max(deadline - time.monotonic(), 0))
+                sources['api'] = 'ok'
+            except FuturesTimeoutError:
+                sources['api'] = 'timeout'
+            except Exception as e:
+                logger.error(f"Error getting API suggestions: {e}")
+                sources['api'] = 'error'
+
+        suggestions.extend(api_suggestions or [])
+
+        return self._suggestions_response(query, suggestions, sources)
+
+    def _submit_api_fetch(self, query):
+        """Запускает запрос к API или возвращает уже идущий такой же; None - пул занят."""
+        key = GeocodingCache.normalize(query)
+        with autocomplete_in_flight_lock:
+            future = autocomplete_in_flight.get(key)
+            if future is not None:
+                return future
+            if len(autocomplete_in_flight) >= settings.WEATHER_AUTOCOMPLETE_WORKERS:
+                return None
+            future = autocomplete_in_flight[key] = autocomplete_executor.submit(self._fetch_api_suggestions, query)
+        future.add_done_callback(lambda done: _forget_in_flight(key, done))
+        return future
+
+    def _short_query_response(self, query):
+        """Ответ на слишком короткий запрос."""
+        return JsonResponse({
+            'status': 'success',
+            'suggestions': [],
+            'message': 'Минимум 2 символа для поиска',
+            'query': query,
+            'total_found': 0
+        })
 
-        # Получаем предложения из API
-        try:
-            api_suggestions = self.get_api_suggestions(query)
-            suggestions.extend(api_suggestions)
-        except Exception as e:
-            logger.error(f"Error getting API suggestions: {e}")
-            # Не прерываем выполнение, продолжаем с локальными результатами
-
-        # Убираем дубликаты
+    def _suggestions_response(self, query, suggestions, sources):
+        """Убирает дубликаты, ограничивает результаты и формирует ответ."""
         unique_suggestions = []
         seen_values = set()
         for suggestion in suggestions:
@@ -237,28 +342,42 @@ class AutocompleteView(View):
             'status': 'success',
             'suggestions': unique_suggestions,
             'query': query,
-            'total_found': len(unique_suggestions)
+            'total_found': len(unique_suggestions),
+            'sources': sources
         })
 
     def get_local_suggestions(self, query):
-        """Получение предложений из локальной базы данных."""
-        cities = City.objects.filter(name__icontains=query)[:5]
+        """Получение предложений из префиксного индекса городов в памяти."""
+        cities = city_index.search(query, limit=self.LOCAL_LIMIT)
 
         suggestions = []
         for city in cities:
             suggestions.append({
-                'value': city.name,
-                'label': f"{city.name}, {city.country}",
+                'value': city['name'],
+                'label': f"{city['name']}, {city['country']}",
                 'source': 'local',
-                'latitude': float(city.latitude) if city.latitude else None,
-                'longitude': float(city.longitude) if city.longitude else None,
-                'country': city.country
+                'latitude': float(city['latitude']) if city['latitude'] else None,
+                'longitude': float(city['longitude']) if city['longitude'] else None,
+                'country': city['country']
             })
 
         return suggestions
 
     def get_api_suggestions(self, query):
         """Получение предложений из внешнего API."""
+        cached = autocomplete_cache.get(query)
+        if cached is not None:
+            return cached
+
+        try:
+            return self._fetch_api_suggestions(query)
+        except requests.RequestException as e:
+            return []
+        except Exception as e:
+            return []
+
+    def _fetch_api_suggestions(self, query):
+        """Запрашивает предложения у Geocoding API и сохраняет их в кеш."""
         weather_service = WeatherService()
 
         params = {
@@ -268,43 +387,42 @@ class AutocompleteView(View):
             "format": "json"
         }
 
-        try:
-            response = requests.get(weather_service.GEOCODING_API_URL, params=params, timeout=5)
-            response.raise_for_status()
-
-            data = response.json()
-            suggestions = []
-
-            if data.get("results"):
-                for result in data["results"]:
-                    city_name = result.get("name", "")
-                    country = result.get("country", "")
-                    admin1 = result.get("admin1", "")
+        response = http_client.get(weather_service.GEOCODING_API_URL, params=params, read_timeout=5)
+        response.raise_for_status()
 
-                    # Формируем название
-                    display_name = city_name
-                    if admin1 and admin1 != city_name:
-                        display_name += f", {admin1}"
-                    if country:
-                        display_name += f", {country}"
+        suggestions = self._format_api_suggestions(response.json())
+        autocomplete_cache.set(query, suggestions)
+        return suggestions
 
-                    suggestions.append({
-                        "value": city_name,
-                        "label": display_name,
-                        "source": "api",
-                        "latitude": result.get("latitude"),
-                        "longitude": result.get("longitude"),
-                        "country": country,
-                        "admin1": admin1,
-                        "population": result.get("population")
-                    })
+    def _format_api_suggestions(self, data):
+        """Преобразует ответ Geocoding API в список предложений."""
+        suggestions = []
 
-            return suggestions
+        if data.get("results"):
+            for result in data["results"]:
+                city_name = result.get("name", "")
+                country = result.get("country", "")
+                admin1 = result.get("admin1", "")
+
+                # Формируем название
+                display_name = city_name
+                if admin1 and admin1 != city_name:
+                    display_name += f", {admin1}"
+                if country:
+                    display_name += f", {country}"
+
+                suggestions.append({
+                    "value": city_name,
+                    "label": display_name,
+                    "source": "api",
+                    "latitude": result.get("latitude"),
+                    "longitude": result.get("longitude"),
+                    "country": country,
+                    "admin1": admin1,
+                    "population": result.get("population")
+                })
 
-        except requests.RequestException as e:
-            return []
-        except Exception as e:
-            return []
+        return suggestions
 
 
 class AboutAPIView(View):
@@ -0,0 +1,18 @@
+import os
+
+from settings.test import *
+
+# Файловая БД вместо :memory:, чтобы таблицы были видны из всех потоков
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["BENCHMARK_DB_PATH"],
+    }
+}
+
+ALLOWED_HOSTS = ["testserver"]
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": True,
+}
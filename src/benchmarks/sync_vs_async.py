@@ -0,0 +1,225 @@
+"""
+Сравнение пропускной способности синхронного (WSGI) и асинхронного (ASGI) режимов.
+
+Запускает медленный фейковый Open-Meteo Geocoding API и прогоняет одинаковую
+нагрузку на /api/v1/autocomplete/ через WSGI-приложение с ограниченным числом
+потоков-воркеров и через ASGI-приложение в одном event loop. Бюджет задержки
+автодополнения (WEATHER_AUTOCOMPLETE_DEADLINE_MS) по умолчанию больше задержки
+upstream, чтобы каждый запрос дожидался ответа API, а не отвечал по таймауту.
+
+Запуск из каталога src:
+
+    python -m benchmarks.sync_vs_async --requests 200 --concurrency 50 --workers 4 --delay 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_GEOCODING_RESPONSE = json.dumps({
+    "results": [
+        {
+            "name": "Москва",
+            "latitude": 55.7558,
+            "longitude": 37.6176,
+            "country": "Россия",
+            "admin1": "Москва",
+            "population": 12506000
+        }
+    ]
+}).encode("utf-8")
+
+
+def start_fake_upstream(delay: float) -> ThreadingHTTPServer:
+    """Запускает фейковый upstream, отвечающий с задержкой delay секунд."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(FAKE_GEOCODING_RESPONSE)))
+            self.end_headers()
+            self.wfile.write(FAKE_GEOCODING_RESPONSE)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_sync(path: str, query: str, total: int, workers: int) -> float:
+    """Прогоняет запросы через WSGI-приложение пулом из workers потоков."""
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+
+    def request(_):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http",
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        body = application(environ, lambda status, headers: None)
+        b"".join(body)
+        body.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(request, range(total)))
+    return time.perf_counter() - started
+
+
+def run_async(path: str, query: str, total: int, concurrency: int) -> float:
+    """Прогоняет запросы через ASGI-приложение в одном event loop."""
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def request(semaphore):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Клиент не отключается, Django отменит ожидание после ответа
+            await asyncio.Event().wait()
+
+        async def send(message):
+            pass
+
+        async with semaphore:
+            await application(scope, receive, send)
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(request(semaphore) for _ in range(total)))
+        return time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def child(args) -> None:
+    """Выполняет замер в отдельном процессе для одного режима."""
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+    if args.mode == "sync":
+        elapsed = run_sync(args.path, args.query, args.requests, args.workers)
+    else:
+        elapsed = run_async(args.path, args.query, args.requests, args.concurrency)
+
+    print(json.dumps({"mode": args.mode, "elapsed": elapsed, "requests": args.requests}))
+
+
+def parent(args) -> None:
+    """Запускает фейковый upstream и замеры обоих режимов."""
+    server = start_fake_upstream(args.delay)
+    upstream_url = f"http://127.0.0.1:{server.server_address[1]}/v1/search"
+    deadline_ms = args.deadline_ms if args.deadline_ms is not None else int(args.delay * 1000) + 1000
+
+    results = []
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE="benchmarks.settings",
+                BENCHMARK_DB_PATH=os.path.join(tmp_dir, "benchmark.sqlite3"),
+                GEOCODING_API_URL=upstream_url,
+                WEATHER_ASYNC_VIEWS=str(mode == "async"),
+                HTTP_CLIENT_POOL_SIZE=str(max(args.concurrency, args.workers)),
+                WEATHER_AUTOCOMPLETE_DEADLINE_MS=str(deadline_ms),
+            )
+            for name in ("SECRET_KEY", "DATABASE_NAME", "DATABASE_USER", "DATABASE_PASSWORD"):
+                env.setdefault(name, "benchmark")
+
+            process = subprocess.run(
+                [sys.executable, "-m", "benchmarks.sync_vs_async", "--child", "--mode", mode,
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                 "--workers", str(args.workers), "--path", args.path, "--query", args.query],
+                cwd=SRC_DIR, env=env, capture_output=True, text=True,
+            )
+            if process.returncode != 0:
+                sys.exit(f"{mode} benchmark failed:\n{process.stderr}")
+            results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    server.shutdown()
+
+    print(f"upstream delay: {args.delay:.3f}s, deadline: {deadline_ms}ms, requests: {args.requests}, "
+          f"sync workers: {args.workers}, async concurrency: {args.concurrency}")
+    for result in results:
+        rps = result["requests"] / result["elapsed"]
+        print(f"{result['mode']:>6}: {result['elapsed']:8.2f}s  {rps:8.1f} req/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="запросов в полете для ASGI")
+    parser.add_argument("--workers", type=int, default=4, help="потоков-воркеров для WSGI")
+    parser.add_argument("--delay", type=float, default=0.2, help="задержка фейкового upstream, с")
+    parser.add_argument(
+        "--deadline-ms", type=int, default=None,
+        help="бюджет ожидания API в автодополнении, мс (по умолчанию задержка upstream + 1000)"
+    )
+    parser.add_argument("--path", default="/api/v1/autocomplete/")
+    parser.add_argument("--query", default="q=%D0%9C%D0%BE%D1%81%D0%BA")
+    parser.add_argument("--mode", choices=("sync", "async"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+    else:
+        parent(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings.development")
+os.environ.setdefault("WEATHER_ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
@@ -169,4 +169,125 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Weather API
 WEATHER_API_BASE_URL = config("WEATHER_API_BASE_URL", default="https://api.open-meteo.com/v1/")
-GEOCODING_API_URL = config("GEOCODING_API_URL", default="https://geocoding-api.open-meteo.com/v1/")
\ No newline at end of file
+GEOCODING_API_URL = config("GEOCODING_API_URL", default="https://geocoding-api.open-meteo.com/v1/")
+
+# Cache
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="weather-forecast"),
+        "OPTIONS": {
+            "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", default=5000, cast=int),
+        },
+    }
+}
+
+# Forecast cache: мягкий TTL (после него прогноз обновляется в фоне) и жесткий TTL, с
+WEATHER_FORECAST_CACHE_TTL = config("WEATHER_FORECAST_CACHE_TTL", default=600, cast=int)
+WEATHER_FORECAST_CACHE_HARD_TTL = config("WEATHER_FORECAST_CACHE_HARD_TTL", default=3600, cast=int)
+WEATHER_FORECAST_CACHE_PRECISION = config("WEATHER_FORECAST_CACHE_PRECISION", default=2, cast=int)
+
+# Шаг сетки (градусы), к которой привязываются координаты перед кешем и запросом прогноза; 0 - без привязки
+WEATHER_FORECAST_GRID_STEP = config("WEATHER_FORECAST_GRID_STEP", default=0.05, cast=float)
+
+# HTTP client for Open-Meteo
+HTTP_CLIENT_POOL_CONNECTIONS = config("HTTP_CLIENT_POOL_CONNECTIONS", default=4, cast=int)
+HTTP_CLIENT_POOL_SIZE = config("HTTP_CLIENT_POOL_SIZE", default=20, cast=int)
+HTTP_CLIENT_CONNECT_TIMEOUT = config("HTTP_CLIENT_CONNECT_TIMEOUT", default=3.05, cast=float)
+HTTP_CLIENT_READ_TIMEOUT = config("HTTP_CLIENT_READ_TIMEOUT", default=10, cast=float)
+HTTP_CLIENT_RETRIES = config("HTTP_CLIENT_RETRIES", default=2, cast=int)
+HTTP_CLIENT_BACKOFF_FACTOR = config("HTTP_CLIENT_BACKOFF_FACTOR", default=0.3, cast=float)
+
+# Async views (включаются ASGI-точкой входа)
+WEATHER_ASYNC_VIEWS = config("WEATHER_ASYNC_VIEWS", default=False, cast=bool)
+
+# Single-flight: "local" - в пределах процесса, "cache" - между воркерами, "off"
+WEATHER_SINGLE_FLIGHT_MODE = config("WEATHER_SINGLE_FLIGHT_MODE", default="local")
+WEATHER_SINGLE_FLIGHT_LOCK_TIMEOUT = config("WEATHER_SINGLE_FLIGHT_LOCK_TIMEOUT", default=15, cast=int)
+WEATHER_SINGLE_FLIGHT_POLL_INTERVAL = config("WEATHER_SINGLE_FLIGHT_POLL_INTERVAL", default=0.05, cast=float)
+
+# Пакетные запросы прогнозов
+WEATHER_FORECAST_BATCH_CHUNK_SIZE = config("WEATHER_FORECAST_BATCH_CHUNK_SIZE", default=50, cast=int)
+WEATHER_FORECAST_BATCH_MAX_LOCATIONS = config("WEATHER_FORECAST_BATCH_MAX_LOCATIONS", default=100, cast=int)
+
+# Кеш геокодинга: найденные города и отрицательные ответы
+WEATHER_GEOCODING_CACHE_TTL = config("WEATHER_GEOCODING_CACHE_TTL", default=86400, cast=int)
+WEATHER_GEOCODING_NEGATIVE_TTL = config("WEATHER_GEOCODING_NEGATIVE_TTL", default=3600, cast=int)
+
+# Индексы городов в памяти: как часто проверять версию городов в БД (с), сколько изменений
+# догружать по одному (больше - полная перестройка) и перестраивать ли индекс в фоновом потоке
+WEATHER_CITY_INDEX_CHECK_INTERVAL = config("WEATHER_CITY_INDEX_CHECK_INTERVAL", default=5, cast=float)
+WEATHER_CITY_INDEX_MAX_INCREMENTAL = config("WEATHER_CITY_INDEX_MAX_INCREMENTAL", default=1000, cast=int)
+WEATHER_CITY_INDEX_BACKGROUND_RELOAD = config("WEATHER_CITY_INDEX_BACKGROUND_RELOAD", default=True, cast=bool)
+
+# Поиск ближайших городов: после скольких изменений перестраивать k-d дерево, максимум городов в ответе
+WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD = config("WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD", default=256, cast=int)
+WEATHER_NEAREST_MAX_CITIES = config("WEATHER_NEAREST_MAX_CITIES", default=50, cast=int)
+
+# Автодополнение: бюджет задержки на ответ API, пул потоков и кеш предложений
+WEATHER_AUTOCOMPLETE_DEADLINE_MS = config("WEATHER_AUTOCOMPLETE_DEADLINE_MS", default=150, cast=int)
+WEATHER_AUTOCOMPLETE_WORKERS = config("WEATHER_AUTOCOMPLETE_WORKERS", default=8, cast=int)
+WEATHER_AUTOCOMPLETE_CACHE_TTL = config("WEATHER_AUTOCOMPLETE_CACHE_TTL", default=3600, cast=int)
+
+# История поиска: размер страницы по умолчанию и максимальный
+WEATHER_HISTORY_PAGE_SIZE = config("WEATHER_HISTORY_PAGE_SIZE", default=20, cast=int)
+WEATHER_HISTORY_MAX_PAGE_SIZE = config("WEATHER_HISTORY_MAX_PAGE_SIZE", default=100, cast=int)
+
+# Снимки прогнозов в истории: длина интервала, в котором поиски по городу делят один снимок,
+# если время получения прогноза неизвестно, с
+WEATHER_FORECAST_SNAPSHOT_BUCKET = config("WEATHER_FORECAST_SNAPSHOT_BUCKET", default=600, cast=int)
+
+# Запись истории поиска: "sync" - сразу в запросе, "memory" - буфер в памяти процесса,
+# "durable" - буфер в локальном файле SQLite, переживающий перезапуск
+WEATHER_HISTORY_WRITE_MODE = config("WEATHER_HISTORY_WRITE_MODE", default="sync")
+WEATHER_HISTORY_QUEUE_PATH = config("WEATHER_HISTORY_QUEUE_PATH", default=str(BASE_DIR / "history_queue.sqlite3"))
+WEATHER_HISTORY_FLUSH_SIZE = config("WEATHER_HISTORY_FLUSH_SIZE", default=100, cast=int)
+WEATHER_HISTORY_FLUSH_INTERVAL = config("WEATHER_HISTORY_FLUSH_INTERVAL", default=2.0, cast=float)
+WEATHER_HISTORY_BUFFER_MAX_PENDING = config("WEATHER_HISTORY_BUFFER_MAX_PENDING", default=10000, cast=int)
+
+# Хранение истории: срок в днях, лимит поисков на сессию (0 - без лимита) и размер пачки удаления
+WEATHER_HISTORY_RETENTION_DAYS = config("WEATHER_HISTORY_RETENTION_DAYS", default=90, cast=int)
+WEATHER_HISTORY_MAX_PER_SESSION = config("WEATHER_HISTORY_MAX_PER_SESSION", default=0, cast=int)
+WEATHER_HISTORY_DELETE_BATCH_SIZE = config("WEATHER_HISTORY_DELETE_BATCH_SIZE", default=1000, cast=int)
+
+# Месячные партиции WeatherSearch на PostgreSQL: включение и сколько месяцев создавать заранее
+WEATHER_HISTORY_PARTITIONING = config("WEATHER_HISTORY_PARTITIONING", default=False, cast=bool)
+WEATHER_HISTORY_PARTITIONS_AHEAD = config("WEATHER_HISTORY_PARTITIONS_AHEAD", default=3, cast=int)
+
+# Хранить числовые столбцы прогноза в массивах NumPy (если numpy установлен)
+WEATHER_FORECAST_NUMPY = config("WEATHER_FORECAST_NUMPY", default=False, cast=bool)
+
+# Почасовой прогноз: глубина ряда в днях, размер окна по умолчанию и максимальный, ч
+WEATHER_HOURLY_FORECAST_DAYS = config("WEATHER_HOURLY_FORECAST_DAYS", default=16, cast=int)
+WEATHER_HOURLY_PAGE_HOURS = config("WEATHER_HOURLY_PAGE_HOURS", default=24, cast=int)
+WEATHER_HOURLY_MAX_HOURS = config("WEATHER_HOURLY_MAX_HOURS", default=168, cast=int)
+
+# Прогрев кеша популярных городов: сколько городов, лимит запросов к API за цикл,
+# интервал циклов и случайная пауза между запросами (с), за сколько секунд до истечения обновлять
+WEATHER_PREFETCH_TOP_CITIES = config("WEATHER_PREFETCH_TOP_CITIES", default=50, cast=int)
+WEATHER_PREFETCH_BUDGET = config("WEATHER_PREFETCH_BUDGET", default=10, cast=int)
+WEATHER_PREFETCH_INTERVAL = config("WEATHER_PREFETCH_INTERVAL", default=60, cast=int)
+WEATHER_PREFETCH_JITTER = config("WEATHER_PREFETCH_JITTER", default=2.0, cast=float)
+WEATHER_PREFETCH_REFRESH_MARGIN = config("WEATHER_PREFETCH_REFRESH_MARGIN", default=120, cast=int)
+# Время блокировки цикла и городов от параллельных запусков, с; прогрев в потоке веб-процесса
+# (для кеша в памяти процесса вместо команды prefetch_forecasts)
+WEATHER_PREFETCH_LOCK_TIMEOUT = config("WEATHER_PREFETCH_LOCK_TIMEOUT", default=300, cast=int)
+WEATHER_PREFETCH_IN_PROCESS = config("WEATHER_PREFETCH_IN_PROCESS", default=False, cast=bool)
+
+# Фоновое обновление устаревших прогнозов: число потоков (0 - обновлять в запросе)
+# и время блокировки, не дающей нескольким воркерам обновлять один прогноз, с
+WEATHER_FORECAST_REFRESH_WORKERS = config("WEATHER_FORECAST_REFRESH_WORKERS", default=2, cast=int)
+WEATHER_FORECAST_REFRESH_LOCK_TIMEOUT = config("WEATHER_FORECAST_REFRESH_LOCK_TIMEOUT", default=30, cast=int)
+
+# Кеш отрендеренного блока прогноза на главной странице, с (0 - не кешировать)
+WEATHER_FORECAST_FRAGMENT_TTL = config("WEATHER_FORECAST_FRAGMENT_TTL", default=3600, cast=int)
+
+# Cache-Control: max-age для статистики популярных городов, с
+WEATHER_API_STATS_MAX_AGE = config("WEATHER_API_STATS_MAX_AGE", default=30, cast=int)
+
+# Почасовые счетчики поисков для статистики за окно: сколько дней хранить
+WEATHER_STATS_ROLLUP_RETENTION_DAYS = config("WEATHER_STATS_ROLLUP_RETENTION_DAYS", default=35, cast=int)
+
+# Импорт справочника городов GeoNames: размер пачки и минимальное население города
+WEATHER_GAZETTEER_BATCH_SIZE = config("WEATHER_GAZETTEER_BATCH_SIZE", default=1000, cast=int)
+WEATHER_GAZETTEER_MIN_POPULATION = config("WEATHER_GAZETTEER_MIN_POPULATION", default=0, cast=int)
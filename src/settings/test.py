@@ -43,3 +43,9 @@ MEDIA_ROOT = BASE_DIR / 'test_media'
 # Тестовые URL для внешних API
 GEOCODING_API_URL = 'https://test-geocoding-api.example.com/v1/search'
 WEATHER_API_BASE_URL = 'https://test-weather-api.example.com/v1/forecast'
+
+# Без повторов запросов к внешним API в тестах
+HTTP_CLIENT_RETRIES = 0
+
+# База в памяти не видна фоновым потокам, индексы городов перестраиваются в потоке запроса
+WEATHER_CITY_INDEX_BACKGROUND_RELOAD = False
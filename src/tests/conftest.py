@@ -2,7 +2,6 @@ import os
 import sys
 import django
 import pytest
-import requests
 
 from unittest.mock import patch
 from django.conf import settings
@@ -60,8 +59,10 @@ def sample_session_key():
 
 @pytest.fixture
 def mock_requests():
-    """Фикстура для мокирования requests."""
-    with patch.object(requests, 'get') as mock_get:
+    """Фикстура для мокирования HTTP-клиента Open-Meteo."""
+    from apps.weather.services import http_client
+
+    with patch.object(http_client, 'get') as mock_get:
         yield mock_get
 
 
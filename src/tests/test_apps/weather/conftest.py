@@ -158,3 +158,34 @@ def sample_weather_data():
         ]
     }
 
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    """Фикстура для включения локального кеша вместо DummyCache."""
+    from django.core.cache import cache
+    from apps.weather.services.forecast_cache import ForecastCache
+
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'weather-tests',
+        }
+    }
+    cache.clear()
+    ForecastCache.reset_stats()
+    yield cache
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_city_index():
+    """Сбрасывает индексы городов (префиксный и ближайших) между тестами."""
+    from apps.weather.services.city_index import city_index
+    from apps.weather.services.nearest_cities import nearest_city_index
+
+    city_index.reset()
+    nearest_city_index.reset()
+    yield
+    city_index.reset()
+    nearest_city_index.reset()
@@ -1,8 +1,12 @@
+import json
+
 import pytest
 from unittest.mock import Mock, patch
+from django.test import override_settings
 from django.urls import reverse
 
 from apps.weather.models import City, WeatherSearch
+from apps.weather.services.weather_service import WeatherService
 from test_apps.weather.conftest import mock_geocoding_api_response
 
 
@@ -93,6 +97,94 @@ def test_get_history_multiple_sessions(api_client, sample_cities):
     assert data['history'][0]['city'] == "Тест Город 2"
 
 
+@pytest.mark.django_db
+@override_settings(WEATHER_HISTORY_PAGE_SIZE=2)
+def test_get_history_pagination(api_client, sample_city):
+    """Тест постраничной истории через next_cursor."""
+    session = api_client.session
+    session.save()
+
+    for temperature in range(3):
+        WeatherSearch.objects.create(
+            session_key=session.session_key,
+            city=sample_city,
+            weather_data={"temperature": temperature}
+        )
+
+    first = api_client.get('/api/v1/user-history/').json()
+    assert len(first['history']) == 2
+    assert first['next_cursor']
+
+    second = api_client.get('/api/v1/user-history/', {'cursor': first['next_cursor']}).json()
+    assert len(second['history']) == 1
+    assert second['next_cursor'] is None
+    assert second['history'][0]['weather_data'] == {"temperature": 0}
+
+
+@pytest.mark.django_db
+def test_get_history_invalid_cursor(api_client):
+    """Тест некорректного курсора истории."""
+    session = api_client.session
+    session.save()
+
+    response = api_client.get('/api/v1/user-history/', {'cursor': '%%%'})
+
+    assert response.status_code == 400
+    assert response.json()['status'] == 'error'
+
+
+@pytest.mark.django_db
+def test_get_stats_window(api_client, history_service, sample_cities):
+    """Тест статистики за окно и проверки параметра window."""
+    history_service.save_history("s", sample_cities[0].name, {})
+
+    data = api_client.get('/api/v1/stats/', {'window': '24h'}).json()
+    assert data['window'] == '24h'
+    assert [item['city'] for item in data['popular_cities']] == [sample_cities[0].name]
+
+    assert api_client.get('/api/v1/stats/', {'window': '1y'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_get_stats_not_modified(api_client, history_service, sample_cities):
+    """Тест 304 для статистики по версии счетчиков в БД (без общего кеша)."""
+    history_service.save_history("s", sample_cities[0].name, {})
+
+    first = api_client.get('/api/v1/stats/')
+    etag = first['ETag']
+    assert 'max-age=30' in first['Cache-Control']
+
+    with patch('apps.weather.services.search_counters.SearchCounterService.get_popular') as get_popular:
+        cached = api_client.get('/api/v1/stats/', HTTP_IF_NONE_MATCH=etag)
+    assert cached.status_code == 304
+    get_popular.assert_not_called()
+
+    history_service.save_history("s", sample_cities[1].name, {})
+    changed = api_client.get('/api/v1/stats/', HTTP_IF_NONE_MATCH=etag)
+    assert changed.status_code == 200
+    assert changed['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_get_history_not_modified(api_client, sample_cities):
+    """Тест 304 для истории: ETag меняется при новом поиске и при удалении."""
+    session = api_client.session
+    session.save()
+    searches = [
+        WeatherSearch.objects.create(session_key=session.session_key, city=city, weather_data={})
+        for city in sample_cities[:2]
+    ]
+
+    first = api_client.get('/api/v1/user-history/')
+    etag = first['ETag']
+    assert 'private' in first['Cache-Control']
+    assert api_client.get('/api/v1/user-history/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert api_client.get('/api/v1/user-history/', {'limit': 1}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    searches[0].delete()
+    assert api_client.get('/api/v1/user-history/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
 @pytest.mark.django_db
 def test_autocomplete_empty_query(api_client):
     """Тест автодополнения с пустым запросом."""
@@ -119,7 +211,7 @@ def test_autocomplete_local_cities(api_client, sample_cities):
 
 
 @pytest.mark.django_db
-@patch('requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_autocomplete_api_error(mock_get, api_client):
     """Тест обработки ошибки API."""
     mock_get.side_effect = Exception("API Error")
@@ -165,3 +257,244 @@ def test_autocomplete_response_format(api_client, sample_cities):
         required_fields = ['value', 'label', 'source']
         for field in required_fields:
             assert field in suggestion
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_forecast_batch(mock_get, api_client, create_test_cities, mock_open_meteo_weather):
+    """Тест пакетного получения прогнозов по городам и координатам."""
+    mock_response = Mock()
+    mock_response.json.return_value = [mock_open_meteo_weather] * 3
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    response = api_client.get('/api/v1/forecast/batch/', {
+        'cities': 'Москва,Санкт-Петербург',
+        'locations': '10.5,20.5'
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'success'
+    assert data['total_count'] == 3
+    assert [item['city'] for item in data['forecasts']] == ['Москва', 'Санкт-Петербург', None]
+    assert data['forecasts'][2]['latitude'] == 10.5
+    assert data['forecasts'][0]['weather_data']['current']['temperature'] == 22.5
+    mock_get.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_forecast_batch_validation(api_client, settings):
+    """Тест валидации параметров пакетного запроса."""
+    settings.WEATHER_FORECAST_BATCH_MAX_LOCATIONS = 2
+
+    assert api_client.get('/api/v1/forecast/batch/').status_code == 400
+    assert api_client.get('/api/v1/forecast/batch/', {'locations': 'abc'}).status_code == 400
+    assert api_client.get('/api/v1/forecast/batch/', {'locations': '95,10'}).status_code == 400
+    assert api_client.get('/api/v1/forecast/batch/', {'locations': '1,1;2,2;3,3'}).status_code == 400
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_forecast_batch_unknown_city(mock_get, api_client, create_test_cities, mock_open_meteo_weather):
+    """Тест того, что ненайденный город попадает в errors, а не ломает пакет."""
+    not_found = Mock()
+    not_found.json.return_value = {"results": []}
+    not_found.raise_for_status.return_value = None
+    forecast = Mock()
+    forecast.json.return_value = mock_open_meteo_weather
+    forecast.raise_for_status.return_value = None
+    mock_get.side_effect = [not_found, forecast]
+
+    response = api_client.get('/api/v1/forecast/batch/', {'cities': 'Москва,Несуществующий'})
+
+    data = response.json()
+    assert response.status_code == 200
+    assert data['total_count'] == 1
+    assert data['errors'][0]['city'] == 'Несуществующий'
+
+
+def hourly_response(hours=72):
+    """Ответ Open-Meteo с почасовым рядом длиной hours с 2024-01-01T00:00."""
+    times = [f"2024-01-{1 + hour // 24:02d}T{hour % 24:02d}:00" for hour in range(hours)]
+    response = Mock()
+    response.json.return_value = {"hourly": {
+        "time": times,
+        "temperature_2m": [float(hour) for hour in range(hours)],
+        "relative_humidity_2m": [50] * hours,
+        "precipitation": [0.0] * hours,
+        "weather_code": [1] * hours,
+        "wind_speed_10m": [3.5] * hours,
+    }}
+    response.raise_for_status.return_value = None
+    return response
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_forecast_hourly_ndjson_window(mock_get, api_client):
+    """Тест потоковой отдачи окна почасового прогноза в NDJSON."""
+    mock_get.return_value = hourly_response()
+
+    response = api_client.get('/api/v1/forecast/hourly/', {
+        'lat': '55.75', 'lon': '37.62', 'start': '2024-01-02T06:00',
+        'hours': '30', 'variables': 'temperature_2m'
+    })
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    meta, rows = lines[0]['meta'], lines[1:]
+    assert meta['hours'] == 30
+    assert meta['next_start'] == '2024-01-03T12:00'
+    assert rows[0] == {'time': '2024-01-02T06:00', 'temperature_2m': 30.0}
+    assert len(rows) == 30
+
+    # Последнее окно обрезается по концу ряда
+    response = api_client.get('/api/v1/forecast/hourly/', {
+        'lat': '55.75', 'lon': '37.62', 'start': meta['next_start'], 'hours': '168', 'output': 'json'
+    })
+    data = json.loads(b''.join(response.streaming_content))
+    assert data['meta']['next_start'] is None
+    assert len(data['hours']) == 12
+    assert set(data['hours'][0]) == {'time', *WeatherService.HOURLY_VARIABLES}
+
+
+@pytest.mark.django_db
+def test_forecast_hourly_validation(api_client):
+    """Тест валидации параметров почасового прогноза."""
+    url = '/api/v1/forecast/hourly/'
+    assert api_client.get(url).status_code == 400
+    assert api_client.get(url, {'lat': '95', 'lon': '10'}).status_code == 400
+    assert api_client.get(url, {'lat': '1', 'lon': '1', 'start': 'вчера'}).status_code == 400
+    assert api_client.get(url, {'lat': '1', 'lon': '1', 'variables': 'snow'}).status_code == 400
+    assert api_client.get(url, {'lat': '1', 'lon': '1', 'output': 'xml'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_nearest_cities(api_client, create_test_cities):
+    """Тест API ближайших городов и проверки параметров."""
+    url = '/api/v1/cities/nearest/'
+
+    response = api_client.get(url, {'lat': '59.9', 'lon': '30.3', 'limit': '2'})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [city['name'] for city in data['cities']] == ["Санкт-Петербург", "Москва"]
+    assert data['cities'][0]['distance_km'] < data['cities'][1]['distance_km']
+    assert data['total_count'] == 2
+
+    assert api_client.get(url, {'lat': '59.9'}).status_code == 400
+    assert api_client.get(url, {'lat': '91', 'lon': '0'}).status_code == 400
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_autocomplete_sources_in_time(mock_get, api_client, sample_cities):
+    """Тест ответа с обоими источниками, успевшими в бюджет задержки."""
+    mock_response = Mock()
+    mock_response.json.return_value = {"results": [{"name": "Тестово", "country": "Россия"}]}
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    response = api_client.get('/api/v1/autocomplete/', {'q': 'Тест'})
+
+    data = response.json()
+    assert data['sources'] == {'local': 'ok', 'api': 'ok'}
+    assert {s['source'] for s in data['suggestions']} == {'local', 'api'}
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_autocomplete_local_only(mock_get, api_client):
+    """Тест ответа без ожидания внешнего API, если локальный индекс дал полный список."""
+    City.objects.bulk_create([
+        City(name=f"Тест Город {i}", latitude=55.0, longitude=37.0 + i, country="Россия")
+        for i in range(5)
+    ])
+    mock_response = Mock()
+    mock_response.json.return_value = {'results': [{'name': 'Тестово', 'country': 'Россия'}]}
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    data = api_client.get('/api/v1/autocomplete/', {'q': 'Тест'}).json()
+
+    # Запрос к API стартует параллельно с локальным поиском, но его результат не используется
+    assert data['sources'] == {'local': 'ok', 'api': 'skipped'}
+    assert [s['source'] for s in data['suggestions']] == ['local'] * 5
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_autocomplete_deadline(mock_get, api_client, settings, locmem_cache, sample_cities):
+    """Тест возврата локальных результатов по дедлайну и кеширования позднего ответа API."""
+    import threading
+    from apps.weather.views import autocomplete_cache
+
+    settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS = 20
+    release = threading.Event()
+    finished = threading.Event()
+    mock_response = Mock()
+    mock_response.json.return_value = {"results": [{"name": "Тестово", "country": "Россия"}]}
+    mock_response.raise_for_status.return_value = None
+
+    def slow_upstream(*args, **kwargs):
+        release.wait(5)
+        return mock_response
+
+    mock_get.side_effect = slow_upstream
+    original_set = autocomplete_cache.set
+
+    def set_and_notify(query, suggestions):
+        original_set(query, suggestions)
+        finished.set()
+
+    with patch.object(autocomplete_cache, 'set', side_effect=set_and_notify):
+        data = api_client.get('/api/v1/autocomplete/', {'q': 'Тест'}).json()
+        release.set()
+        assert finished.wait(5)
+
+    assert data['sources'] == {'local': 'ok', 'api': 'timeout'}
+    assert {s['source'] for s in data['suggestions']} == {'local'}
+
+    data = api_client.get('/api/v1/autocomplete/', {'q': 'тест'}).json()
+
+    assert data['sources'] == {'local': 'ok', 'api': 'cached'}
+    assert 'Тестово' in [s['value'] for s in data['suggestions']]
+    mock_get.assert_called_once()
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_autocomplete_shares_and_bounds_api_requests(mock_get, api_client, settings, sample_cities):
+    """Тест автодополнения: одинаковые запросы разделяют один запрос к API, при занятом пуле API пропускается."""
+    import threading
+
+    settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS = 20
+    settings.WEATHER_AUTOCOMPLETE_WORKERS = 1
+    release = threading.Event()
+    mock_response = Mock()
+    mock_response.json.return_value = {"results": [{"name": "Тестово", "country": "Россия"}]}
+    mock_response.raise_for_status.return_value = None
+
+    def slow_upstream(*args, **kwargs):
+        release.wait(5)
+        return mock_response
+
+    mock_get.side_effect = slow_upstream
+
+    try:
+        first = api_client.get('/api/v1/autocomplete/', {'q': 'Тест'}).json()
+        # Тот же запрос в другом регистре ждет уже идущий запрос к API
+        second = api_client.get('/api/v1/autocomplete/', {'q': ' тест'}).json()
+        # Пул занят: другой запрос не ставится в очередь
+        third = api_client.get('/api/v1/autocomplete/', {'q': 'Тес'}).json()
+    finally:
+        release.set()
+
+    assert first['sources'] == second['sources'] == {'local': 'ok', 'api': 'timeout'}
+    assert third['sources'] == {'local': 'ok', 'api': 'busy'}
+    assert {s['source'] for s in third['suggestions']} == {'local'}
+    mock_get.assert_called_once()
+
@@ -240,3 +240,19 @@ def test_multiple_cities_searches(sample_weather_data):
 
     session_searches = WeatherSearch.objects.filter(session_key="multi_test")
     assert session_searches.count() == 2
+
+
+@pytest.mark.django_db
+def test_forecast_snapshot_unique_per_bucket(sample_city, sample_weather_data):
+    """Тест уникальности снимка прогноза для города и интервала."""
+    from apps.weather.models import ForecastSnapshot
+
+    bucket = timezone.now().replace(second=0, microsecond=0)
+    snapshot = ForecastSnapshot.objects.create(city=sample_city, bucket=bucket, weather_data=sample_weather_data)
+    search = WeatherSearch.objects.create(session_key="s", city=sample_city, snapshot=snapshot)
+
+    assert search.snapshot.weather_data == sample_weather_data
+    assert search.weather_data is None
+
+    with pytest.raises(IntegrityError):
+        ForecastSnapshot.objects.create(city=sample_city, bucket=bucket, weather_data={})
@@ -1,12 +1,15 @@
+from io import StringIO
+
 import pytest
 from unittest.mock import Mock, patch
 import requests
 
 from apps.weather.models import City, WeatherSearch
+from apps.weather.services.history_service import HistoryService
 
 
 @pytest.mark.django_db
-@patch('apps.weather.services.weather_service.requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_get_city_coordinates_from_api(mock_get, client, weather_service, mock_geocoding_response):
     """Тест получения координат города через API."""
     mock_response = Mock()
@@ -26,7 +29,7 @@ def test_get_city_coordinates_from_api(mock_get, client, weather_service, mock_g
 
 
 @pytest.mark.django_db
-@patch('apps.weather.services.weather_service.requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_get_city_coordinates_api_not_found(mock_get, client, weather_service):
     """Тест обработки случая когда город не найден в API."""
     mock_response = Mock()
@@ -39,7 +42,7 @@ def test_get_city_coordinates_api_not_found(mock_get, client, weather_service):
 
 
 @pytest.mark.django_db
-@patch('apps.weather.services.weather_service.requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_get_city_coordinates_api_error(mock_get, client, weather_service):
     """Тест обработки ошибки API."""
     mock_get.side_effect = requests.RequestException("API недоступен")
@@ -49,7 +52,7 @@ def test_get_city_coordinates_api_error(mock_get, client, weather_service):
 
 
 @pytest.mark.django_db
-@patch('apps.weather.services.weather_service.requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_get_weather_forecast(mock_get, client, weather_service, mock_weather_response):
     """Тест получения прогноза погоды."""
     mock_response = Mock()
@@ -64,7 +67,7 @@ def test_get_weather_forecast(mock_get, client, weather_service, mock_weather_re
 
 
 @pytest.mark.django_db
-@patch('apps.weather.services.weather_service.requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_get_weather_forecast_api_error(mock_get, client, weather_service):
     """Тест обработки ошибки при получении прогноза."""
     mock_get.side_effect = requests.RequestException("Weather API недоступен")
@@ -93,6 +96,44 @@ def test_format_weather_data(client, weather_service, mock_weather_response):
     assert daily[0]['temp_min'] == -8
 
 
+def test_daily_forecast_columns():
+    """Тест столбцового прогноза: выравнивание столбцов, ленивые дни и JSON."""
+    import json
+    from apps.weather.services.forecast_data import DailyForecast, ForecastJSONEncoder
+
+    forecast = DailyForecast.from_open_meteo({
+        "time": ["2024-01-01", "2024-01-02", "2024-01-03"],
+        "temperature_2m_max": [1.5, 2.5, 3.5, 4.5],
+        "temperature_2m_min": [-1.0, -2.0],
+        "weather_code": [0, 71, 95],
+    }, use_numpy=False)
+
+    assert len(forecast) == 3
+    assert forecast[2].temp_min is None
+    assert forecast[-1]['description'] == "Гроза"
+    assert [day.date for day in forecast[:2]] == ["2024-01-01", "2024-01-02"]
+    assert json.loads(json.dumps({"daily_forecast": forecast}, cls=ForecastJSONEncoder))["daily_forecast"][1] == {
+        "date": "2024-01-02", "temp_max": 2.5, "temp_min": -2.0, "weather_code": 71, "description": "Легкий снег"
+    }
+
+
+def test_daily_forecast_numpy_backend():
+    """Тест хранения столбцов прогноза в массивах NumPy."""
+    np = pytest.importorskip("numpy")
+    from apps.weather.services.forecast_data import DailyForecast
+
+    forecast = DailyForecast.from_open_meteo({
+        "time": ["2024-01-01", "2024-01-02"],
+        "temperature_2m_max": [1.5, None],
+        "weather_code": [3],
+    }, use_numpy=True)
+
+    assert isinstance(forecast.temp_max, np.ndarray)
+    assert forecast[0].weather_code == 3
+    assert forecast[1].temp_max is None
+    assert forecast.to_json()[1]["weather_code"] is None
+
+
 @pytest.mark.django_db
 def test_get_weather_description(client, weather_service):
     """Тест получения описания погоды по коду."""
@@ -124,4 +165,1234 @@ def test_get_history(client, history_service, sample_city):
 
     history = history_service.get_history("test_session")
 
-    assert len(history) == 2
\ No newline at end of file
+    assert len(history) == 2
+
+
+@pytest.mark.django_db
+def test_get_history_page_keyset(history_service, sample_city, django_assert_num_queries):
+    """Тест постраничной истории: страницы не пересекаются при одинаковой дате поиска."""
+    searches = WeatherSearch.objects.bulk_create([
+        WeatherSearch(session_key="test_session", city=sample_city, weather_data={"temp": i})
+        for i in range(5)
+    ])
+    WeatherSearch.objects.filter(id__in=[search.id for search in searches[:3]]).update(
+        search_date=searches[0].search_date
+    )
+
+    seen = []
+    cursor = None
+    while True:
+        with django_assert_num_queries(1):
+            page = history_service.get_history_page("test_session", cursor=cursor, limit=2)
+        seen.extend(item['id'] for item in page['history'])
+        assert all(item['city'] == sample_city.name for item in page['history'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(search.id for search in searches)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.django_db
+def test_save_history_shares_forecast_snapshot(history_service, sample_city, sample_weather_data):
+    """Тест: поиски города в одном интервале ссылаются на один снимок прогноза."""
+    from apps.weather.models import ForecastSnapshot
+
+    history_service.save_history("first", sample_city.name, sample_weather_data)
+    history_service.save_history("second", sample_city.name, sample_weather_data)
+
+    assert ForecastSnapshot.objects.count() == 1
+    assert not WeatherSearch.objects.filter(weather_data__isnull=False).exists()
+    assert history_service.get_history("second")[0]['weather_data'] == sample_weather_data
+
+
+@pytest.mark.django_db
+def test_save_history_serializes_columnar_forecast(history_service, weather_service, sample_city,
+                                                   mock_weather_response):
+    """Тест: отформатированный прогноз со столбцами сохраняется в историю как обычный JSON."""
+    weather_data = weather_service.format_weather_data(mock_weather_response)
+
+    history_service.save_history("s", sample_city.name, weather_data)
+
+    saved = history_service.get_history("s")[0]['weather_data']
+    assert saved['daily_forecast'] == weather_data['daily_forecast'].to_json()
+
+
+@pytest.mark.django_db
+def test_forecast_snapshot_keyed_by_fetch_time(history_service, sample_city, sample_weather_data):
+    """Тест: снимок - один полученный прогноз, а не интервал времени поиска."""
+    from datetime import datetime, timezone
+    from apps.weather.models import ForecastSnapshot
+
+    fetched = datetime(2025, 5, 28, 7, 31, 0, 123456, tzinfo=timezone.utc)
+    refreshed = datetime(2025, 5, 28, 7, 35, tzinfo=timezone.utc)
+
+    history_service.save_history("s", sample_city.name, dict(sample_weather_data, updated_at=fetched))
+    # Тот же прогноз из файлового буфера истории - время строкой JSON с миллисекундами
+    history_service.save_history_batch([{
+        "session_key": "s", "city": sample_city.name, "search_date": refreshed,
+        "weather_data": dict(sample_weather_data, updated_at="2025-05-28T07:31:00.123Z"),
+    }])
+    history_service.save_history("s", sample_city.name, dict(sample_weather_data, updated_at=refreshed))
+
+    assert list(ForecastSnapshot.objects.order_by("bucket").values_list("bucket", flat=True)) == [
+        fetched.replace(microsecond=123000), refreshed
+    ]
+
+
+@pytest.mark.django_db
+def test_snapshot_migration_reverse_restores_weather_data(history_service, sample_city, sample_weather_data):
+    """Тест отката миграции 0005: прогнозы возвращаются из снимков в записи истории."""
+    import importlib
+    from django.apps import apps
+
+    migration = importlib.import_module("apps.weather.migrations.0005_move_weather_data_to_snapshots")
+    history_service.save_history("s", sample_city.name, sample_weather_data)
+
+    migration.restore_weather_data(apps, None)
+
+    search = WeatherSearch.objects.get()
+    assert search.snapshot is None
+    assert search.weather_data == sample_weather_data
+
+
+@pytest.mark.django_db
+def test_snapshot_migration_keeps_distinct_forecasts(sample_city):
+    """Тест миграции 0005: общий снимок только у одинаковых прогнозов, откат возвращает каждый прогноз."""
+    import importlib
+    from datetime import datetime, timezone
+    from django.apps import apps
+    from apps.weather.models import ForecastSnapshot
+
+    migration = importlib.import_module("apps.weather.migrations.0005_move_weather_data_to_snapshots")
+    search_date = datetime(2025, 5, 28, 7, 31, tzinfo=timezone.utc)
+    temperatures = [0, 1, 2, 3, 4, 0]
+    for temperature in temperatures:
+        WeatherSearch.objects.create(
+            session_key="s", city=sample_city, search_date=search_date,
+            weather_data={"current": {"temperature": temperature}}
+        )
+
+    migration.move_to_snapshots(apps, None)
+
+    assert ForecastSnapshot.objects.count() == 1
+    assert WeatherSearch.objects.filter(snapshot__isnull=False).count() == 2
+    history = HistoryService().get_history("s")
+    assert sorted(item['weather_data']['current']['temperature'] for item in history) == sorted(temperatures)
+
+    migration.restore_weather_data(apps, None)
+
+    restored = WeatherSearch.objects.order_by("id").values_list("weather_data", flat=True)
+    assert [data["current"]["temperature"] for data in restored] == temperatures
+
+
+def test_forecast_snapshot_bucket_start():
+    """Тест округления времени до начала интервала снимка."""
+    from datetime import datetime, timezone
+    from apps.weather.services.forecast_snapshots import ForecastSnapshotService
+
+    service = ForecastSnapshotService(bucket_seconds=600)
+    moment = datetime(2025, 5, 28, 7, 39, 59, tzinfo=timezone.utc)
+
+    assert service.bucket_start(moment) == datetime(2025, 5, 28, 7, 30, tzinfo=timezone.utc)
+
+
+@pytest.mark.django_db
+def test_history_buffer_flushes_on_size(history_service, sample_cities, sample_weather_data):
+    """Тест отложенной записи истории: пачка пишется при достижении flush_size."""
+    from apps.weather.models import ForecastSnapshot
+    from apps.weather.services.history_buffer import HistoryBuffer, MemoryQueue
+
+    HistoryBuffer.reset_stats()
+    buffer = HistoryBuffer(history_service.save_history_batch, MemoryQueue(), flush_size=3, background=False)
+
+    buffer.add("s", sample_cities[0].name, sample_weather_data)
+    buffer.add("s", sample_cities[0].name, sample_weather_data)
+    assert WeatherSearch.objects.count() == 0
+
+    buffer.add("other", sample_cities[1].name, sample_weather_data)
+
+    assert WeatherSearch.objects.count() == 3
+    assert ForecastSnapshot.objects.count() == 2
+    assert history_service.get_popular_cities(1)[0] == {
+        'city': sample_cities[0].name, 'country': sample_cities[0].country, 'search_count': 2
+    }
+    stats = HistoryBuffer.stats()
+    assert (stats['buffered'], stats['flushed'], stats['flushes']) == (3, 3, 1)
+
+
+@pytest.mark.django_db
+def test_history_buffer_durable_queue(tmp_path, history_service, sample_city, sample_weather_data):
+    """Тест: записи в файловой очереди переживают пересоздание буфера, битые записи отбрасываются."""
+    from apps.weather.services.history_buffer import HistoryBuffer, SqliteQueue
+
+    HistoryBuffer.reset_stats()
+    path = tmp_path / "queue.sqlite3"
+    buffer = HistoryBuffer(history_service.save_history_batch, SqliteQueue(path), background=False)
+    buffer.add("s", sample_city.name, sample_weather_data)
+    buffer.add("s", "Город без координат", sample_weather_data)
+    buffer.add("other", sample_city.name, sample_weather_data)
+    buffer.discard("other")
+
+    restarted = HistoryBuffer(history_service.save_history_batch, SqliteQueue(path), background=False)
+
+    assert restarted.flush() == 1
+    assert len(restarted.queue) == 0
+    assert [item['city'] for item in history_service.get_history("s")] == [sample_city.name]
+    assert HistoryBuffer.stats()['failed'] == 1
+
+
+@pytest.mark.django_db
+def test_popular_cities_from_counters(history_service, sample_cities):
+    """Тест счетчиков популярности при сохранении и удалении истории."""
+    for _ in range(3):
+        history_service.save_history("first", sample_cities[1].name, {})
+    history_service.save_history("second", sample_cities[0].name, {})
+    history_service.save_history("second", sample_cities[1].name, {})
+
+    popular = history_service.get_popular_cities(10)
+    assert [(item['city'], item['search_count']) for item in popular] == [
+        ("Тест Город 2", 4), ("Тест Город 1", 1)
+    ]
+
+    history_service.clear_history("first")
+    search = WeatherSearch.objects.get(session_key="second", city=sample_cities[0])
+    history_service.delete_search(search.id)
+
+    popular = history_service.get_popular_cities(10)
+    assert [(item['city'], item['search_count']) for item in popular] == [("Тест Город 2", 1)]
+
+
+@pytest.mark.django_db
+def test_popular_cities_by_window(history_service, sample_cities):
+    """Тест статистики за окно по почасовым счетчикам и их пересчета."""
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from apps.weather.models import CitySearchRollup
+
+    now = timezone.now()
+    history_service.save_history("s", sample_cities[0].name, {})
+    history_service.save_history_batch([
+        {"session_key": "s", "city": sample_cities[1].name, "weather_data": {}, "search_date": moment}
+        for moment in (now - timedelta(hours=3), now - timedelta(hours=3), now - timedelta(days=3))
+    ])
+
+    def ranking(window):
+        return [(item['city'], item['search_count']) for item in history_service.get_popular_cities(10, window)]
+
+    assert ranking("1h") == [("Тест Город 1", 1)]
+    assert ranking("24h") == [("Тест Город 2", 2), ("Тест Город 1", 1)]
+    assert ranking("7d") == [("Тест Город 2", 3), ("Тест Город 1", 1)]
+    with pytest.raises(ValueError):
+        ranking("2w")
+
+    rollups = set(CitySearchRollup.objects.values_list('city_id', 'hour', 'search_count'))
+    CitySearchRollup.objects.all().delete()
+    call_command("rebuild_search_rollups", days=30, stdout=StringIO())
+    assert set(CitySearchRollup.objects.values_list('city_id', 'hour', 'search_count')) == rollups
+
+    history_service.clear_history("s")
+    assert ranking("30d") == []
+
+
+@pytest.mark.django_db
+def test_rebuild_search_counters_command(history_service, sample_cities):
+    """Тест пересчета счетчиков командой rebuild_search_counters."""
+    from django.core.management import call_command
+    from apps.weather.models import CitySearchCounter
+
+    for city in (sample_cities[0], sample_cities[2], sample_cities[2]):
+        WeatherSearch.objects.create(session_key="s", city=city, weather_data={})
+    CitySearchCounter.objects.create(city=sample_cities[1], search_count=7)
+
+    call_command("rebuild_search_counters", stdout=StringIO())
+
+    assert dict(CitySearchCounter.objects.values_list('city__name', 'search_count')) == {
+        "Тест Город 1": 1, "Тест Город 3": 2
+    }
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_prefetch_popular_cities(mock_get, locmem_cache, sample_cities, mock_weather_response):
+    """Тест прогрева кеша: бюджет запросов, порядок по популярности и пропуск свежих."""
+    from apps.weather.models import CitySearchCounter
+    from apps.weather.services.prefetch import ForecastPrefetcher
+    from apps.weather.services.weather_service import WeatherService
+
+    for city, count in zip(sample_cities, (1, 5, 3)):
+        CitySearchCounter.objects.create(city=city, search_count=count)
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    sleep = Mock()
+    prefetcher = ForecastPrefetcher(top=3, budget=2, chunk_size=1, jitter=1.0, sleep=sleep)
+
+    assert prefetcher.run_once() == {"due": 3, "refreshed": 2, "failed": 0, "requests": 2, "busy": 0}
+    assert [call.kwargs['params']['latitude'] for call in mock_get.call_args_list] == [
+        str(sample_cities[1].latitude), str(sample_cities[2].latitude)
+    ]
+    sleep.assert_called_once()
+
+    assert prefetcher.run_once()["due"] == 1
+    assert prefetcher.run_once()["due"] == 0
+
+    # Поиск по популярному городу обслуживается из кеша
+    mock_get.reset_mock()
+    WeatherService().get_weather_forecast(sample_cities[1].latitude, sample_cities[1].longitude)
+    mock_get.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_prefetch_claims_run_and_cities(mock_get, locmem_cache, sample_cities, mock_weather_response):
+    """Тест блокировок прогрева: параллельный цикл пропускается, занятые другим запуском города - тоже."""
+    from django.core.management import CommandError, call_command
+    from apps.weather.models import CitySearchCounter
+    from apps.weather.services.prefetch import ForecastPrefetcher
+
+    for city, count in zip(sample_cities, (1, 5, 3)):
+        CitySearchCounter.objects.create(city=city, search_count=count)
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    prefetcher = ForecastPrefetcher(top=3, budget=3, chunk_size=1, jitter=0)
+    busy_key = prefetcher.weather_service.forecast_key(sample_cities[1].latitude, sample_cities[1].longitude)
+
+    locmem_cache.add(f"{ForecastPrefetcher.KEY_PREFIX}:run", 1)
+    assert prefetcher.run_once() is None
+    locmem_cache.delete(f"{ForecastPrefetcher.KEY_PREFIX}:run")
+
+    locmem_cache.add(prefetcher._claim_key(busy_key), 1)
+    assert prefetcher.run_once() == {"due": 3, "refreshed": 2, "failed": 0, "requests": 2, "busy": 1}
+    # Свои блокировки снимаются после цикла
+    assert locmem_cache.get(f"{ForecastPrefetcher.KEY_PREFIX}:run") is None
+    assert list(prefetcher.due_locations()) == [busy_key]
+
+    # Отдельный процесс прогрева не видит LocMemCache веб-воркеров
+    with pytest.raises(CommandError):
+        call_command("prefetch_forecasts", once=True, stdout=StringIO())
+    call_command("prefetch_forecasts", once=True, force=True, stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_prune_history_command(history_service, sample_cities, sample_weather_data):
+    """Тест очистки истории по возрасту и по лимиту на сессию."""
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from apps.weather.models import CitySearchCounter, ForecastSnapshot
+
+    for _ in range(4):
+        history_service.save_history("busy", sample_cities[0].name, sample_weather_data)
+    history_service.save_history("old", sample_cities[1].name, sample_weather_data)
+
+    old_date = timezone.now() - timedelta(days=40)
+    WeatherSearch.objects.filter(session_key="old").update(search_date=old_date)
+    ForecastSnapshot.objects.filter(city=sample_cities[1]).update(bucket=old_date)
+
+    call_command("prune_history", days=30, per_session=2, batch_size=1, stdout=StringIO())
+
+    assert not WeatherSearch.objects.filter(session_key="old").exists()
+    assert WeatherSearch.objects.filter(session_key="busy").count() == 2
+    assert not ForecastSnapshot.objects.filter(city=sample_cities[1]).exists()
+    assert dict(CitySearchCounter.objects.values_list('city__name', 'search_count')) == {
+        sample_cities[0].name: 2, sample_cities[1].name: 0
+    }
+
+
+@pytest.mark.django_db
+def test_delete_older_than_by_id_range(history_service, sample_city, sample_weather_data):
+    """Тест удаления старой истории пачками по диапазону id: свежие строки между старыми остаются."""
+    from datetime import timedelta
+    from django.utils import timezone
+    from apps.weather.services.retention import HistoryRetentionService
+
+    for session_key in ["old", "new", "old", "old", "new"]:
+        history_service.save_history(session_key, sample_city.name, sample_weather_data)
+    WeatherSearch.objects.filter(session_key="old").update(search_date=timezone.now() - timedelta(days=40))
+
+    assert HistoryRetentionService(batch_size=2).delete_older_than(30) == 3
+    assert list(WeatherSearch.objects.values_list('session_key', flat=True)) == ["new", "new"]
+    assert HistoryRetentionService(batch_size=2).delete_older_than(30) == 0
+
+
+@pytest.mark.django_db
+def test_clear_history_in_batches(sample_city, sample_weather_data):
+    """Тест очистки большой истории сессии пачками."""
+    from apps.weather.services.retention import HistoryRetentionService
+
+    history_service = HistoryService()
+    history_service.retention = HistoryRetentionService(batch_size=2)
+    for _ in range(5):
+        history_service.save_history("s", sample_city.name, sample_weather_data)
+
+    history_service.clear_history("s")
+
+    assert not WeatherSearch.objects.filter(session_key="s").exists()
+    assert history_service.get_popular_cities() == []
+
+    with pytest.raises(ValueError, match="не найден"):
+        history_service.delete_search(1)
+
+
+def test_partition_month_helpers():
+    """Тест вычисления границ месячных партиций."""
+    from datetime import date, datetime
+    from apps.weather.services.partitions import add_months, month_start
+
+    assert month_start(datetime(2025, 5, 28, 7, 31)) == date(2025, 5, 1)
+    assert add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+
+
+@pytest.mark.django_db
+def test_manage_partitions_falls_back_on_sqlite():
+    """Тест: на SQLite таблица истории остается обычной."""
+    from django.core.management import call_command
+    from apps.weather.services.partitions import SearchPartitionService
+
+    out = StringIO()
+    call_command("manage_partitions", stdout=out)
+
+    assert not SearchPartitionService().is_partitioned()
+    assert "только на PostgreSQL" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_check_history_indexes_command():
+    """Тест EXPLAIN-проверки: запросы истории идут по составным индексам без сортировки."""
+    from django.core.management import call_command
+
+    out = StringIO()
+    call_command("check_history_indexes", stdout=out)
+
+    assert "используют составные индексы" in out.getvalue()
+
+
+def test_history_cursor_invalid(history_service):
+    """Тест некорректного курсора истории."""
+    with pytest.raises(ValueError, match="Некорректный курсор"):
+        history_service.decode_cursor("not-a-cursor")
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_cached(mock_get, locmem_cache, weather_service, mock_weather_response):
+    """Тест повторного запроса прогноза из кеша."""
+    from apps.weather.services.forecast_cache import ForecastCache
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    first = weather_service.get_weather_forecast(55.7558, 37.6176)
+    second = weather_service.get_weather_forecast(55.7561, 37.6179)
+
+    assert first == second == mock_weather_response
+    mock_get.assert_called_once()
+    assert ForecastCache.stats() == {"hits": 1, "stale": 0, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_cache_key_by_location(mock_get, locmem_cache, weather_service, mock_weather_response):
+    """Тест раздельного кеширования прогнозов для разных координат."""
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    weather_service.get_weather_forecast(55.7558, 37.6176)
+    weather_service.get_weather_forecast(59.9311, 30.3609)
+
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_stale_while_revalidate(mock_get, settings, locmem_cache, mock_weather_response):
+    """Тест отдачи устаревшего прогноза с фоновым обновлением и сохранения его при ошибке."""
+    from apps.weather.services.weather_service import WeatherService
+
+    settings.WEATHER_FORECAST_CACHE_TTL = 0
+    settings.WEATHER_FORECAST_REFRESH_WORKERS = 0
+    fresh = dict(mock_weather_response, current={"temperature_2m": 30.0})
+    first, second = Mock(), Mock()
+    first.json.return_value = mock_weather_response
+    second.json.return_value = fresh
+    mock_get.side_effect = [first, requests.RequestException("timeout"), second, second]
+
+    service = WeatherService()
+    assert service.get_weather_forecast(55.7558, 37.6176) == mock_weather_response
+
+    # Обновление не удалось: отдается прежний прогноз, он остается в кеше
+    entry = service.get_weather_forecast_entry(55.7558, 37.6176)
+    assert entry["stale"] and entry["data"] == mock_weather_response
+    assert service.get_weather_forecast(55.7558, 37.6176) == mock_weather_response
+
+    # Ответ не ждет обновления, новые данные видны следующему запросу
+    assert service.get_weather_forecast(55.7558, 37.6176) == fresh
+    assert mock_get.call_count == 4
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_forecast_entry_fetched_at_matches_cache(mock_get, locmem_cache, mock_weather_response):
+    """Тест: при промахе кеша возвращается то же время получения, что сохранено в кеше."""
+    from asgiref.sync import async_to_sync
+    from apps.weather.services.async_weather_service import AsyncWeatherService
+    from apps.weather.services.weather_service import WeatherService
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    service = WeatherService()
+    missed = service.get_weather_forecast_entry(55.7558, 37.6176)
+    cached = service.get_weather_forecast_entry(55.7558, 37.6176)
+
+    assert mock_get.call_count == 1
+    assert missed["fetched_at"] == cached["fetched_at"]
+    assert service.forecast_age(missed)["updated_at"] == service.forecast_age(cached)["updated_at"]
+    assert async_to_sync(AsyncWeatherService().aget_weather_forecast_entry)(55.7558, 37.6176)["fetched_at"] == (
+        cached["fetched_at"]
+    )
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_search_weather_reports_data_age(mock_get, weather_service, sample_city, mock_weather_response):
+    """Тест того, что результат поиска сообщает возраст прогноза."""
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_get.return_value = mock_response
+
+    result = weather_service.search_weather_by_city(sample_city.name)
+
+    assert result["age_seconds"] == 0
+    assert result["updated_at"].tzinfo is not None
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_error_not_cached(mock_get, locmem_cache, weather_service, mock_weather_response):
+    """Тест того, что ошибки API не попадают в кеш."""
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.side_effect = [requests.RequestException("timeout"), mock_response]
+
+    with pytest.raises(ValueError):
+        weather_service.get_weather_forecast(55.7558, 37.6176)
+
+    assert weather_service.get_weather_forecast(55.7558, 37.6176) == mock_weather_response
+
+
+def test_http_client_session_is_shared(settings):
+    """Тест переиспользования одной HTTP-сессии в процессе."""
+    from apps.weather.services import http_client
+
+    settings.HTTP_CLIENT_RETRIES = 2
+    http_client.reset_session()
+    session = http_client.get_session()
+
+    assert http_client.get_session() is session
+
+    adapter = session.get_adapter("https://api.open-meteo.com")
+    assert adapter._pool_maxsize == 20
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.read == 0
+    assert "GET" in adapter.max_retries.allowed_methods
+
+    http_client.reset_session()
+    assert http_client.get_session() is not session
+    http_client.reset_session()
+
+
+@patch('apps.weather.services.http_client.get_session')
+def test_http_client_get_timeouts(mock_get_session, settings):
+    """Тест передачи таймаутов подключения и чтения."""
+    from apps.weather.services import http_client
+
+    settings.HTTP_CLIENT_CONNECT_TIMEOUT = 2
+    settings.HTTP_CLIENT_READ_TIMEOUT = 7
+
+    http_client.get("https://example.com", params={"q": 1})
+    http_client.get("https://example.com", read_timeout=3)
+
+    calls = mock_get_session.return_value.get.call_args_list
+    assert calls[0].kwargs == {"params": {"q": 1}, "timeout": (2, 7)}
+    assert calls[1].kwargs == {"params": None, "timeout": (2, 3)}
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_search_weather_by_city(mock_get, sample_city, mock_weather_response):
+    """Тест асинхронного поиска погоды по городу из локальной БД."""
+    from asgiref.sync import async_to_sync
+    from apps.weather.services.async_weather_service import AsyncWeatherService
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    result = async_to_sync(AsyncWeatherService().asearch_weather_by_city)("Тестовый город")
+
+    assert result['current']['temperature'] == -5.2
+    assert len(result['daily_forecast']) == 2
+    mock_get.assert_awaited_once()
+    assert mock_get.call_args.kwargs['params']['latitude'] == 55.75
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_get_city_coordinates_from_api(mock_get, mock_geocoding_response):
+    """Тест асинхронного геокодинга с сохранением города."""
+    from asgiref.sync import async_to_sync
+    from apps.weather.services.async_weather_service import AsyncWeatherService
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_geocoding_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    lat, lon = async_to_sync(AsyncWeatherService().aget_city_coordinates)("Новый Город")
+
+    assert (lat, lon) == (55.7558, 37.6176)
+    assert City.objects.filter(name="Тест Город").exists()
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_get_weather_forecast_api_error(mock_get):
+    """Тест обработки ошибки асинхронного клиента."""
+    import httpx
+    from asgiref.sync import async_to_sync
+    from apps.weather.services.async_weather_service import AsyncWeatherService
+
+    mock_get.side_effect = httpx.ConnectError("Weather API недоступен")
+
+    with pytest.raises(ValueError, match="Ошибка при получении данных о погоде"):
+        async_to_sync(AsyncWeatherService().aget_weather_forecast)(55.7558, 37.6176)
+
+
+def _run_concurrently(fn, count=5):
+    """Запускает fn в нескольких потоках одновременно и возвращает результаты."""
+    import threading
+
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = fn()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """Тест одного вызова upstream для одновременных запросов с одним ключом."""
+    import time
+    from apps.weather.services.single_flight import SingleFlight
+
+    flight = SingleFlight("test")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"temperature": 20}
+
+    results = _run_concurrently(lambda: flight.do("moscow", fetch))
+
+    assert len(calls) == 1
+    assert all(result == {"temperature": 20} for result in results)
+
+
+def test_single_flight_shares_errors():
+    """Тест передачи ошибки ведущего запроса всем ожидающим."""
+    import time
+    from apps.weather.services.single_flight import SingleFlight
+
+    flight = SingleFlight("test")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError("Ошибка при получении данных о погоде")
+
+    results = _run_concurrently(lambda: flight.do("moscow", fetch))
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_off_mode(settings):
+    """Тест отключения объединения запросов."""
+    from apps.weather.services.single_flight import SingleFlight
+
+    settings.WEATHER_SINGLE_FLIGHT_MODE = "off"
+    flight = SingleFlight("test")
+    calls = []
+
+    _run_concurrently(lambda: flight.do("moscow", lambda: calls.append(1)))
+
+    assert len(calls) == 5
+
+
+def test_single_flight_cache_mode_waits_for_other_worker(settings, locmem_cache):
+    """Тест ожидания результата, который получает другой воркер."""
+    import time
+    from apps.weather.services.single_flight import SingleFlight
+
+    settings.WEATHER_SINGLE_FLIGHT_MODE = "cache"
+    flight = SingleFlight("test")
+    locmem_cache.set(flight._lock_key("moscow"), "other-worker", 10)
+    locmem_cache.set(flight._result_key("moscow"), (time.time(), ("ok", {"temperature": 20})), 10)
+
+    fetch = Mock()
+
+    assert flight.do("moscow", fetch) == {"temperature": 20}
+    fetch.assert_not_called()
+
+
+def test_single_flight_cache_mode_rechecks_result_before_leading(settings, locmem_cache):
+    """Тест: ожидающий, заставший снятую блокировку, берет результат ведущего, а не запрашивает заново."""
+    import time
+    from apps.weather.services.single_flight import SingleFlight
+
+    settings.WEATHER_SINGLE_FLIGHT_MODE = "cache"
+    flight = SingleFlight("test")
+
+    # Ведущий другого воркера заканчивает, пока ожидающий спит между проверками
+    def leader_finishes(interval):
+        locmem_cache.set(flight._result_key("moscow"), (time.time(), ("ok", {"temperature": 20})), 10)
+        locmem_cache.delete(flight._lock_key("moscow"))
+
+    locmem_cache.set(flight._lock_key("moscow"), "other-worker", 10)
+    fetch = Mock()
+    with patch('apps.weather.services.single_flight.time.sleep', side_effect=leader_finishes):
+        assert flight.do("moscow", fetch) == {"temperature": 20}
+    fetch.assert_not_called()
+
+    # Результат, полученный задолго до вызова, не выдается за общий
+    locmem_cache.set(flight._result_key("moscow"), (time.time() - 60, ("ok", {"temperature": 20})), 10)
+    locmem_cache.set(flight._lock_key("moscow"), "other-worker", 10)
+    with patch('apps.weather.services.single_flight.time.sleep',
+               side_effect=lambda interval: locmem_cache.delete(flight._lock_key("moscow"))):
+        assert flight.do("moscow", lambda: {"temperature": 25}) == {"temperature": 25}
+
+
+def test_single_flight_cache_mode_leader_releases_lock(settings, locmem_cache):
+    """Тест снятия блокировки в общем кеше после запроса, в том числе с ошибкой."""
+    from apps.weather.services.single_flight import SingleFlight
+
+    settings.WEATHER_SINGLE_FLIGHT_MODE = "cache"
+    flight = SingleFlight("test")
+
+    assert flight.do("moscow", lambda: {"temperature": 20}) == {"temperature": 20}
+    assert locmem_cache.get(flight._lock_key("moscow")) is None
+
+    with pytest.raises(ValueError):
+        flight.do("moscow", Mock(side_effect=ValueError("upstream")))
+    assert locmem_cache.get(flight._lock_key("moscow")) is None
+
+    # Блокировка истекла и досталась другому воркеру - ее не снимаем
+    def slow_fetch():
+        locmem_cache.set(flight._lock_key("moscow"), "next-leader", 10)
+        return {"temperature": 25}
+
+    assert flight.do("moscow", slow_fetch) == {"temperature": 25}
+    assert locmem_cache.get(flight._lock_key("moscow")) == "next-leader"
+
+
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_single_flight(mock_get, weather_service, mock_weather_response):
+    """Тест одного запроса к Open-Meteo при одновременных промахах кеша."""
+    import time
+
+    def slow_response(*args, **kwargs):
+        time.sleep(0.1)
+        return mock_response
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.side_effect = slow_response
+
+    results = _run_concurrently(lambda: weather_service.get_weather_forecast(55.7558, 37.6176))
+
+    assert mock_get.call_count == 1
+    assert all(result == mock_weather_response for result in results)
+
+
+def test_async_single_flight_coalesces_calls():
+    """Тест объединения одновременных асинхронных запросов."""
+    import asyncio
+    from apps.weather.services.single_flight import SingleFlight
+
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"temperature": 20}
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("moscow", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert results == [{"temperature": 20}] * 5
+
+
+def test_async_single_flight_leader_cancelled():
+    """Тест: отмена ведущего (отключение клиента) не оставляет ожидающих висеть."""
+    import asyncio
+    from apps.weather.services.single_flight import SingleFlight
+
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"temperature": 20}
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("moscow", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.ado("moscow", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*followers), timeout=1)
+        return leader, results
+
+    leader, results = asyncio.run(main())
+
+    assert leader.cancelled()
+    assert results == [{"temperature": 20}] * 3
+    # Первый из ожидающих стал ведущим, остальные дождались его
+    assert len(calls) == 2
+
+
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_batch(mock_get, locmem_cache, weather_service, mock_weather_response):
+    """Тест получения прогнозов нескольких точек одним запросом с заполнением кеша."""
+    second_response = dict(mock_weather_response, latitude=59.9311, longitude=30.3609)
+    mock_response = Mock()
+    mock_response.json.return_value = [mock_weather_response, second_response]
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    locations = [(55.7558, 37.6176), (59.9311, 30.3609), (55.7558, 37.6176)]
+    result = weather_service.get_weather_forecast_batch(locations)
+
+    assert result == [mock_weather_response, second_response, mock_weather_response]
+    mock_get.assert_called_once()
+    params = mock_get.call_args.kwargs['params']
+    assert params['latitude'] == "55.75,59.95"
+    assert params['longitude'] == "37.6,30.35"
+
+    assert weather_service.get_weather_forecast(59.9311, 30.3609) == second_response
+    mock_get.assert_called_once()
+
+
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_batch_refreshes_stale_together(mock_get, settings, locmem_cache, mock_weather_response):
+    """Тест: устаревшие прогнозы пакета обновляются одним запросом на несколько точек."""
+    from apps.weather.services.weather_service import WeatherService
+
+    settings.WEATHER_FORECAST_CACHE_TTL = 0
+    settings.WEATHER_FORECAST_REFRESH_WORKERS = 0
+    weather_service = WeatherService()
+    second_response = dict(mock_weather_response, latitude=59.9311, longitude=30.3609)
+    mock_response = Mock()
+    mock_response.json.return_value = [mock_weather_response, second_response]
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    locations = [(55.7558, 37.6176), (59.9311, 30.3609)]
+    weather_service.get_weather_forecast_batch(locations)
+    mock_get.reset_mock()
+
+    assert weather_service.get_weather_forecast_batch(locations) == [mock_weather_response, second_response]
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs['params']['latitude'] == "55.75,59.95"
+
+
+@patch('apps.weather.services.http_client.get')
+def test_forecast_grid_snapping(mock_get, settings, locmem_cache, weather_service, mock_weather_response):
+    """Тест привязки координат к сетке: соседние точки делят запрос к API и запись кеша."""
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    assert weather_service.snap_coordinates(55.7558, 37.6176) == (55.75, 37.6)
+    assert weather_service.snap_coordinates(89.99, -179.99) == (90.0, -180.0)
+
+    assert weather_service.get_weather_forecast(55.7558, 37.6176) == mock_weather_response
+    assert weather_service.get_weather_forecast(55.7612, 37.5901) == mock_weather_response
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs['params']['latitude'] == 55.75
+
+    settings.WEATHER_FORECAST_GRID_STEP = 0
+    assert weather_service.snap_coordinates(55.7558, 37.6176) == (55.7558, 37.6176)
+
+
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_batch_chunks(mock_get, settings, weather_service, mock_weather_response):
+    """Тест разбиения большого пакета на несколько запросов."""
+    settings.WEATHER_FORECAST_BATCH_CHUNK_SIZE = 2
+    mock_response = Mock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.side_effect = [[mock_weather_response] * 2, mock_weather_response]
+    mock_get.return_value = mock_response
+
+    result = weather_service.get_weather_forecast_batch([(50.0, 30.0), (51.0, 31.0), (52.0, 32.0)])
+
+    assert len(result) == 3
+    assert mock_get.call_count == 2
+
+
+@patch('apps.weather.services.http_client.get')
+def test_get_weather_forecast_batch_incomplete_response(mock_get, weather_service, mock_weather_response):
+    """Тест ошибки при неполном ответе API."""
+    mock_response = Mock()
+    mock_response.json.return_value = [mock_weather_response]
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    with pytest.raises(ValueError, match="неполный ответ"):
+        weather_service.get_weather_forecast_batch([(50.0, 30.0), (51.0, 31.0)])
+
+
+def test_geocoding_cache_normalize():
+    """Тест нормализации названий городов перед поиском в кеше."""
+    from apps.weather.services.geocoding_cache import GeocodingCache
+
+    geocoding_cache = GeocodingCache()
+
+    assert GeocodingCache.normalize("  САНКТ-Петербург  ") == "санкт-петербург"
+    assert GeocodingCache.normalize("Нью   Йорк") == "нью йорк"
+    assert geocoding_cache.make_key("Москва") == geocoding_cache.make_key(" москва ")
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_city_coordinates_negative_cache(mock_get, locmem_cache, weather_service):
+    """Тест запоминания ненайденных городов: повторный запрос не идет в API."""
+    mock_response = Mock()
+    mock_response.json.return_value = {"results": []}
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    with pytest.raises(ValueError, match="не найден"):
+        weather_service.get_city_coordinates("Moskow")
+    with pytest.raises(ValueError, match="не найден"):
+        weather_service.get_city_coordinates(" MOSKOW ")
+
+    mock_get.assert_called_once()
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_city_coordinates_positive_cache(mock_get, locmem_cache, weather_service, mock_geocoding_response):
+    """Тест кеширования найденных координат без повторных запросов к БД и API."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    mock_response = Mock()
+    mock_response.json.return_value = mock_geocoding_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    assert weather_service.get_city_coordinates("Тест Город") == (55.7558, 37.6176)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert weather_service.get_city_coordinates("тест город") == (55.7558, 37.6176)
+
+    assert len(queries) == 0
+    mock_get.assert_called_once()
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_geocoded_query_saved_to_found_city(mock_get, weather_service, history_service, mock_geocoding_response):
+    """Тест истории для запроса, который Geocoding API нашел под другим названием."""
+    mock_response = Mock()
+    mock_response.json.return_value = mock_geocoding_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    assert weather_service.get_city_coordinates("Test Gorod") == (55.7558, 37.6176)
+    history_service.save_history("s", "Test Gorod", {})
+
+    assert list(WeatherSearch.objects.values_list('city__name', flat=True)) == ["Тест Город"]
+    with pytest.raises(ValueError, match="не найден"):
+        history_service.save_history("s", "Неизвестный город", {})
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_get_city_coordinates_errors_not_cached(mock_get, locmem_cache, weather_service):
+    """Тест того, что сетевые ошибки не попадают в отрицательный кеш."""
+    mock_get.side_effect = requests.RequestException("API недоступен")
+
+    with pytest.raises(ValueError, match="Ошибка при получении координат"):
+        weather_service.get_city_coordinates("Тест")
+    with pytest.raises(ValueError, match="Ошибка при получении координат"):
+        weather_service.get_city_coordinates("Тест")
+
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.django_db
+def test_city_index_prefix_search(create_test_cities):
+    """Тест поиска по префиксу названия и по началу слова."""
+    from apps.weather.services.city_index import city_index
+
+    assert [city['name'] for city in city_index.search("мос")] == ["Москва"]
+    assert [city['name'] for city in city_index.search("ПЕТЕР")] == ["Санкт-Петербург"]
+    assert city_index.search("сква") == []
+    assert city_index.search("  ") == []
+
+
+@pytest.mark.django_db
+def test_city_index_ranking_by_popularity(sample_cities):
+    """Тест ранжирования результатов по популярности города."""
+    from apps.weather.services.city_index import city_index
+
+    history_service = HistoryService()
+    for _ in range(3):
+        history_service.save_history("s", sample_cities[2].name, {})
+    history_service.save_history("s", sample_cities[1].name, {})
+
+    names = [city['name'] for city in city_index.search("тест", limit=2)]
+    assert names == ["Тест Город 3", "Тест Город 2"]
+
+    for _ in range(5):
+        history_service.save_history("s", sample_cities[0].name, {})
+
+    assert city_index.search("тест", limit=1)[0]['name'] == "Тест Город 1"
+
+
+@pytest.mark.django_db
+def test_city_index_incremental_updates(create_test_cities):
+    """Тест обновления индекса при изменении городов без обращения к БД при поиске."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from apps.weather.services.city_index import city_index
+
+    city_index.search("мос")
+
+    City.objects.create(name="Мостовской", latitude=44.4, longitude=40.8, country="Россия")
+    create_test_cities[0].delete()
+
+    with CaptureQueriesContext(connection) as queries:
+        result = city_index.search("мос")
+
+    assert [city['name'] for city in result] == ["Мостовской"]
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_city_index_syncs_remote_changes_from_db(settings, create_test_cities):
+    """Тест синхронизации индекса с изменениями другого процесса по версии в БД."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from apps.weather.services.city_index import city_index
+    from apps.weather.services.data_versions import DataVersionService
+
+    settings.WEATHER_CITY_INDEX_CHECK_INTERVAL = 0
+    city_index.search("мос")
+
+    # bulk-операции не отправляют сигналы - как изменения в другом процессе
+    City.objects.bulk_create([City(name="Мосальск", latitude=54.5, longitude=34.9, country="Россия")])
+    assert [city['name'] for city in city_index.search("мос")] == ["Москва"]
+
+    DataVersionService().bump(DataVersionService.CITIES)
+    with CaptureQueriesContext(connection) as queries:
+        result = city_index.search("мос")
+
+    assert {city['name'] for city in result} == {"Москва", "Мосальск"}
+    # Версии и только измененные города, без перезагрузки таблицы
+    assert len(queries) == 2
+    assert "updated_at" in queries[1]['sql'] and ">=" in queries[1]['sql']
+
+    City.objects.filter(name="Мосальск").delete()
+    DataVersionService().bump(DataVersionService.CITIES, DataVersionService.CITY_DELETIONS)
+    assert [city['name'] for city in city_index.search("мос")] == ["Москва"]
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_import_gazetteer(mock_get, settings, tmp_path, weather_service):
+    """Тест импорта GeoNames: повторный импорт идемпотентен, альтернативные названия ищутся без API."""
+    from django.core.management import call_command
+    from apps.weather.models import CityAlternateName
+    from apps.weather.services.city_index import city_index
+
+    def row(geoname_id, name, alternate_names, latitude, longitude, population, feature_class="P"):
+        columns = [str(geoname_id), name, name, alternate_names, str(latitude), str(longitude),
+                   feature_class, "PPLC", "RU", "", "", "", "", "", str(population), "", "", "Europe/Moscow", ""]
+        return "\t".join(columns)
+
+    dump = tmp_path / "cities.txt"
+    dump.write_text("\n".join([
+        row(524901, "Moscow", "Moskva,Москва,Moskau", 55.75222, 37.61556, 10381222),
+        row(498817, "Saint Petersburg", "Санкт-Петербург,Petersburg", 59.93863, 30.31413, 5028000),
+        row(4601066, "Moscow", "Москва", 46.73239, -117.00017, 25000),
+        row(1, "Moscow Oblast", "", 55.7, 37.6, 0, feature_class="A"),
+        "broken line",
+    ]) + "\n", encoding="utf-8")
+    countries = tmp_path / "countryInfo.txt"
+    countries.write_text("# ISO\tISO3\tISO-Numeric\tfips\tCountry\nRU\tRUS\t643\tRS\tRussia\n", encoding="utf-8")
+
+    settings.WEATHER_CITY_INDEX_CHECK_INTERVAL = 0
+    City.objects.create(name="Saint Petersburg", latitude=59.9, longitude=30.3, country="Россия")
+    city_index.search("sai")
+
+    call_command("import_gazetteer", str(dump), countries=str(countries), stdout=StringIO())
+    call_command("import_gazetteer", str(dump), countries=str(countries), stdout=StringIO())
+
+    cities = City.objects.order_by("name")
+    assert [(city.name, city.geoname_id, city.population, city.country) for city in cities] == [
+        ("Moscow", 524901, 10381222, "Russia"),
+        ("Saint Petersburg", 498817, 5028000, "Russia"),
+    ]
+    assert CityAlternateName.objects.count() == 5
+
+    # Индекс автодополнения видит импортированные и обновленные импортом города
+    assert [city['name'] for city in city_index.search("mos")] == ["Moscow"]
+    assert city_index.search("sai")[0]['country'] == "Russia"
+
+    assert weather_service.get_city_coordinates("  москва ") == (55.75222, 37.61556)
+    assert weather_service.get_city_coordinates("Petersburg") == (59.93863, 30.31413)
+    mock_get.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_import_gazetteer_keeps_referenced_namesake(tmp_path):
+    """Тест импорта: тезка с историей поиска не заменяется более населенным городом, тезка без нее - заменяется."""
+    from apps.weather.models import CitySearchCounter
+    from apps.weather.services.gazetteer import GazetteerImporter
+
+    def row(geoname_id, name, latitude, longitude, population):
+        columns = [str(geoname_id), name, name, "", str(latitude), str(longitude),
+                   "P", "PPL", "US", "", "", "", "", "", str(population), "", "", "", ""]
+        return "\t".join(columns)
+
+    idaho = City.objects.create(name="Moscow", latitude=46.73, longitude=-117.0, country="US",
+                                geoname_id=4601066, population=25000)
+    CitySearchCounter.objects.create(city=idaho, search_count=3)
+    City.objects.create(name="Paris", latitude=33.66, longitude=-95.55, country="US", geoname_id=4717560, population=25000)
+
+    stats = GazetteerImporter().import_lines([
+        row(524901, "Moscow", 55.75222, 37.61556, 10381222),
+        row(2988507, "Paris", 48.85341, 2.3488, 2138551),
+    ])
+
+    assert stats["conflicts"] == 1
+    assert stats["updated"] == 1
+    assert list(City.objects.values_list("name", "geoname_id").order_by("name")) == [
+        ("Moscow", 4601066), ("Paris", 2988507)
+    ]
+    idaho.refresh_from_db()
+    assert (idaho.latitude, idaho.search_counter.search_count) == (46.73, 3)
+
+
+@pytest.mark.django_db
+def test_nearest_city_index(settings, create_test_cities):
+    """Тест поиска ближайших городов: порядок, расстояния и обновления без перезагрузки из БД."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from apps.weather.services.nearest_cities import nearest_city_index
+
+    settings.WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD = 2
+    result = nearest_city_index.nearest(55.75, 37.62, limit=2)
+
+    assert [city['name'] for city in result] == ["Москва", "Санкт-Петербург"]
+    assert result[0]['distance_km'] < 1
+    assert 620 < result[1]['distance_km'] < 650
+
+    City.objects.create(name="Химки", latitude=55.89, longitude=37.44, country="Россия")
+    create_test_cities[0].delete()
+    City.objects.create(name="Ушуая", latitude=-54.8, longitude=-68.3, country="Аргентина")
+
+    with CaptureQueriesContext(connection) as queries:
+        assert [city['name'] for city in nearest_city_index.nearest(55.9, 37.4, limit=2)] == ["Химки", "Санкт-Петербург"]
+        assert [city['name'] for city in nearest_city_index.nearest(-60, -70, limit=1)] == ["Ушуая"]
+
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_nearest_city_index_syncs_remote_changes_from_db(settings, create_test_cities):
+    """Тест догрузки в дерево городов, измененных другим процессом."""
+    from apps.weather.services.data_versions import DataVersionService
+    from apps.weather.services.nearest_cities import nearest_city_index
+
+    settings.WEATHER_CITY_INDEX_CHECK_INTERVAL = 0
+    assert nearest_city_index.nearest(55.9, 37.4, limit=1)[0]['name'] == "Москва"
+
+    City.objects.bulk_create([City(name="Химки", latitude=55.89, longitude=37.44, country="Россия")])
+    DataVersionService().bump(DataVersionService.CITIES)
+
+    assert nearest_city_index.nearest(55.9, 37.4, limit=1)[0]['name'] == "Химки"
+
+
+@pytest.mark.django_db
+def test_nearest_city_index_rebuilds_tree_in_background(settings, create_test_cities):
+    """Тест перестройки дерева вне блокировки: поиск не ждет сборку, изменения во время нее не теряются."""
+    import threading
+    from apps.weather.services.nearest_cities import NearestCityIndex, nearest_city_index
+
+    settings.WEATHER_NEAREST_INDEX_REBUILD_THRESHOLD = 1
+    settings.WEATHER_CITY_INDEX_BACKGROUND_RELOAD = True
+    nearest_city_index.nearest(55.75, 37.62)
+
+    release = threading.Event()
+    build_tree = NearestCityIndex._build_tree
+
+    def slow_build_tree(points):
+        release.wait(5)
+        return build_tree(points)
+
+    with patch.object(NearestCityIndex, '_build_tree', staticmethod(slow_build_tree)):
+        City.objects.create(name="Химки", latitude=55.89, longitude=37.44, country="Россия")
+        City.objects.create(name="Ушуая", latitude=-54.8, longitude=-68.3, country="Аргентина")
+        assert nearest_city_index._rebuild_thread.is_alive()
+
+        # Сборка идет, а поиск и изменения обслуживаются прежним деревом
+        moscow_id = create_test_cities[0].pk
+        create_test_cities[0].delete()
+        assert [city['name'] for city in nearest_city_index.nearest(55.9, 37.4, limit=2)] == ["Химки", "Санкт-Петербург"]
+
+        release.set()
+        nearest_city_index._rebuild_thread.join(5)
+
+    assert moscow_id in nearest_city_index._stale
+    assert [city['name'] for city in nearest_city_index.nearest(55.9, 37.4, limit=2)] == ["Химки", "Санкт-Петербург"]
+    assert [city['name'] for city in nearest_city_index.nearest(-60, -70, limit=1)] == ["Ушуая"]
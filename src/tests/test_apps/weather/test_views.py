@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from django.urls import reverse
 from urllib.parse import quote
 
@@ -46,6 +46,37 @@ def test_weather_search_api_error(mock_weather_service, client):
     assert response.context['searched_city'] == 'НесуществующийГород'
 
 
+@pytest.mark.django_db
+@patch('apps.weather.views.WeatherService')
+def test_weather_search_forecast_fragment_cached(mock_service, client, locmem_cache, sample_city,
+                                                 sample_weather_data):
+    """Тест кеширования блока прогноза по городу и версии прогноза."""
+    from datetime import datetime, timezone
+
+    updated_at = datetime(2024, 12, 1, 12, 0, tzinfo=timezone.utc)
+    mock_service.return_value.search_weather_by_city.return_value = dict(
+        sample_weather_data, updated_at=updated_at, age_seconds=0
+    )
+    client.get(reverse('weather:home'), {'city': 'Тестовый город'})
+
+    # Та же версия прогноза: блок берется из кеша, заголовок и форма рендерятся заново
+    changed = dict(sample_weather_data, current=dict(sample_weather_data['current'], temperature=30.0))
+    mock_service.return_value.search_weather_by_city.return_value = dict(
+        changed, updated_at=updated_at, age_seconds=0
+    )
+    response = client.get(reverse('weather:home'), {'city': 'Тестовый город'})
+    content = response.content.decode()
+    assert '-5.2°C' in content
+    assert 'Погода в городе Тестовый город' in content
+
+    # Новая версия прогноза рендерится заново
+    mock_service.return_value.search_weather_by_city.return_value = dict(
+        changed, updated_at=datetime(2024, 12, 1, 12, 10, tzinfo=timezone.utc), age_seconds=0
+    )
+    response = client.get(reverse('weather:home'), {'city': 'Тестовый город'})
+    assert '30.0°C' in response.content.decode()
+
+
 @pytest.mark.django_db
 def test_weather_search_invalid_form(client):
     """Тест поиска с невалидными данными."""
@@ -81,7 +112,7 @@ def test_about_site_page(client):
 
 
 @pytest.mark.django_db
-@patch('requests.get')
+@patch('apps.weather.services.http_client.get')
 def test_autocomplete_view_success(mock_get, client):
     """Тест успешного автодополнения."""
     mock_response = Mock()
@@ -196,3 +227,173 @@ def test_update_previous_cities(request_factory):
     assert view.previous_cities[0] == 'НовыйГород'
     assert 'Город1,Город2' in view.previous_cities
     assert len(view.previous_cities) <= 5
+
+
+@pytest.mark.django_db
+@patch('apps.weather.async_views.AsyncWeatherService')
+def test_async_home_view_search(mock_service, sample_city, sample_weather_data):
+    """Тест асинхронного поиска погоды на главной странице."""
+    from asgiref.sync import async_to_sync
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.test import AsyncRequestFactory
+    from apps.weather.async_views import AsyncWeatherHomeView
+    from apps.weather.models import WeatherSearch
+
+    mock_service.return_value.asearch_weather_by_city = AsyncMock(return_value=sample_weather_data)
+    request = AsyncRequestFactory().get('/', {'city': 'Тестовый город'})
+    request.session = SessionStore()
+
+    response = async_to_sync(AsyncWeatherHomeView.as_view())(request)
+
+    assert response.status_code == 200
+    assert 'previous_cities' in response.cookies
+    assert WeatherSearch.objects.filter(session_key=request.session.session_key).count() == 1
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_autocomplete_view(mock_get, sample_cities):
+    """Тест асинхронного автодополнения с локальными и API предложениями."""
+    import json
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncRequestFactory
+    from apps.weather.async_views import AsyncAutocompleteView
+
+    mock_response = Mock()
+    mock_response.json.return_value = {
+        "results": [{"name": "Тест API", "latitude": 1.0, "longitude": 2.0, "country": "Россия"}]
+    }
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    request = AsyncRequestFactory().get('/api/v1/autocomplete/', {'q': 'Тест'})
+    response = async_to_sync(AsyncAutocompleteView.as_view())(request)
+
+    data = json.loads(response.content)
+    assert response.status_code == 200
+    assert {s['source'] for s in data['suggestions']} >= {'api'}
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_autocomplete_deadline(mock_get, settings, sample_cities):
+    """Тест асинхронного автодополнения: API не успел в бюджет задержки."""
+    import asyncio
+    import json
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncRequestFactory
+    from apps.weather.async_views import AsyncAutocompleteView
+
+    settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS = 20
+
+    async def slow_upstream(*args, **kwargs):
+        await asyncio.sleep(0.5)
+
+    mock_get.side_effect = slow_upstream
+
+    request = AsyncRequestFactory().get('/api/v1/autocomplete/', {'q': 'Тест'})
+    response = async_to_sync(AsyncAutocompleteView.as_view())(request)
+
+    data = json.loads(response.content)
+    assert data['sources'] == {'local': 'ok', 'api': 'timeout'}
+    assert {s['source'] for s in data['suggestions']} == {'local'}
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.async_http_client.get')
+def test_async_autocomplete_shares_and_bounds_api_requests(mock_get, settings, sample_cities):
+    """Тест асинхронного автодополнения: одинаковые запросы разделяют задачу, сверх предела API пропускается."""
+    import asyncio
+    import json
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncRequestFactory
+    from apps.weather.async_views import AsyncAutocompleteView
+
+    settings.WEATHER_AUTOCOMPLETE_DEADLINE_MS = 20
+    settings.WEATHER_AUTOCOMPLETE_WORKERS = 1
+
+    async def slow_upstream(*args, **kwargs):
+        await asyncio.sleep(0.5)
+
+    mock_get.side_effect = slow_upstream
+    view = AsyncAutocompleteView.as_view()
+
+    async def autocomplete(*queries):
+        # Запросы идут по очереди в одном цикле событий: первая задача к API еще не завершилась
+        sources = []
+        for query in queries:
+            response = await view(AsyncRequestFactory().get('/api/v1/autocomplete/', {'q': query}))
+            sources.append(json.loads(response.content)['sources'])
+        return sources
+
+    sources = async_to_sync(autocomplete)('Тест', 'тест ', 'Тес')
+
+    assert sources == [
+        {'local': 'ok', 'api': 'timeout'},
+        {'local': 'ok', 'api': 'timeout'},
+        {'local': 'ok', 'api': 'busy'},
+    ]
+    assert mock_get.call_count == 1
+
+
+@pytest.mark.django_db
+def test_async_api_views_keep_drf_behaviour(history_service, sample_city, sample_weather_data):
+    """Тест ASGI-версий API: та же схема OpenAPI и обработка запроса DRF, что у WSGI-версий."""
+    import json
+    from asgiref.sync import async_to_sync, iscoroutinefunction
+    from django.test import AsyncRequestFactory
+    from django.urls import path
+    from drf_spectacular.generators import SchemaGenerator
+    from apps.weather.api.api_views import UserHistoryAPIView, WeatherStatsAPIView
+    from apps.weather.api.async_api_views import AsyncUserHistoryAPIView, AsyncWeatherStatsAPIView
+
+    def schema(stats_view, history_view):
+        patterns = [path("stats/", stats_view.as_view()), path("user-history/", history_view.as_view())]
+        return SchemaGenerator(patterns=patterns).get_schema(request=None, public=True)["paths"]
+
+    assert schema(AsyncWeatherStatsAPIView, AsyncUserHistoryAPIView) == schema(WeatherStatsAPIView, UserHistoryAPIView)
+
+    view = AsyncWeatherStatsAPIView.as_view()
+    assert iscoroutinefunction(view)
+
+    history_service.save_history("s", sample_city.name, sample_weather_data)
+    response = async_to_sync(view)(AsyncRequestFactory().get('/api/v1/stats/'))
+    assert response.status_code == 200
+    assert json.loads(response.content)['popular_cities'][0]['city'] == sample_city.name
+
+    # Ошибки DRF (здесь - согласование формата) в формате DRF, как у WSGI-версии
+    response = async_to_sync(view)(AsyncRequestFactory().get('/api/v1/stats/', headers={'accept': 'application/xml'}))
+    assert response.status_code == 406
+    assert 'detail' in json.loads(response.render().content)
+
+
+@pytest.mark.django_db
+@patch('apps.weather.services.http_client.get')
+def test_weather_search_by_alternate_name(mock_get, client, settings, mock_weather_response):
+    """Тест поиска по альтернативному названию: история пишется в найденный город, в том числе из буфера."""
+    from apps.weather.models import City, CityAlternateName, WeatherSearch
+    from apps.weather.services.history_buffer import get_history_buffer, reset_history_buffer
+
+    moscow = City.objects.create(name="Moscow", latitude=55.75, longitude=37.62, country="Russia")
+    CityAlternateName.objects.create(city=moscow, name="Москва", normalized="москва")
+    mock_response = Mock()
+    mock_response.json.return_value = mock_weather_response
+    mock_response.raise_for_status.return_value = None
+    mock_get.return_value = mock_response
+
+    response = client.get(reverse('weather:home'), {'city': 'Москва'})
+
+    assert response.status_code == 200
+    assert 'error_message' not in response.context
+    assert list(WeatherSearch.objects.values_list('city__name', flat=True)) == ["Moscow"]
+
+    settings.WEATHER_HISTORY_WRITE_MODE = "memory"
+    reset_history_buffer()
+    try:
+        client.get(reverse('weather:home'), {'city': 'москва'})
+        assert get_history_buffer().flush() == 1
+    finally:
+        reset_history_buffer()
+
+    assert WeatherSearch.objects.filter(city=moscow).count() == 2
+    assert City.objects.count() == 1